@@ -1,108 +1,205 @@
 # app.py
-from flask import Flask
+from flask import Blueprint, Flask
 from flask_cors import CORS
-import cloudinary
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
+from controller.errors import static_body, static_error, error_response
 
-# Load environment variables
-load_dotenv()
+# Blueprints registered per deployment profile (names resolved lazily from routes)
+PROFILE_BLUEPRINTS = {
+    # Image processing only - no database required
+    'api': ('image_bp', 'direct_api_bp'),
+    # Image processing plus watermark CRUD backed by the database
+    'db': ('image_bp', 'watermark_bp', 'direct_api_bp'),
+    # Direct watermark API only - no Cloudinary or database
+    'local': ('direct_api_bp',)
+}
 
-def create_app():
-    """Application factory pattern"""
-    app = Flask(__name__)
+# Static response bodies, serialized once at import instead of on every response
+# (the 413 body names the configured MAX_CONTENT_LENGTH, so create_app builds it)
+STATIC_RESPONSES = {
+    200: static_body({'status': 'healthy'}),
+    404: static_error('Endpoint not found', 'NOT_FOUND', 404),
+    405: static_error('Method not allowed', 'METHOD_NOT_ALLOWED', 405),
+    408: static_error(
+        'Request timeout - image processing took too long', 'REQUEST_TIMEOUT', 408,
+        hint='Please try with a smaller image or contact support if the issue persists'
+    ),
+    500: static_error(
+        'Internal server error', 'INTERNAL_ERROR', 500,
+        hint='An unexpected error occurred during image processing'
+    )
+}
+
+def _static_response(status_code: int):
+    """Build a response from a pre-serialized body (fresh object, since CORS adds headers)"""
+    return error_response(STATIC_RESPONSES[status_code])
+
+# Blueprint name -> import error message, for blueprints served by the 503 fallback
+IMPORT_ERRORS = {}
+
+def _unavailable_blueprint(blueprint_name: str, url_prefix: str) -> Blueprint:
+    """Build a blueprint that answers 503 for every route under url_prefix"""
+    blueprint = Blueprint(f'{blueprint_name}_unavailable', __name__, url_prefix=url_prefix)
     
-    # Configure CORS
-    # Get allowed origins from environment variable
-    allowed_origins = os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000,http://localhost:8080,https://www.origity.store').split(',')
+    @blueprint.route('/', defaults={'path': ''}, methods=['GET', 'POST', 'PUT', 'DELETE'])
+    @blueprint.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
+    def unavailable(path):
+        return {
+            'error': 'Service temporarily unavailable',
+            'code': 'SERVICE_UNAVAILABLE',
+            'message': 'This endpoint failed to load; check the server logs'
+        }, 503
     
+    return blueprint
+
+# Thread-count variables read by OpenBLAS/MKL/OpenMP when NumPy is first imported.
+# Parallelism comes from Gunicorn threads, the WM_WORKERS process pool and the
+# per-channel threads; letting every SVD also start cpu_count BLAS threads
+# oversubscribes the cores under concurrent load.
+BLAS_THREAD_VARS = ('OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'OMP_NUM_THREADS')
+
+DEFAULT_ALLOWED_ORIGINS = 'http://localhost:3000,http://localhost:8080,https://www.origity.store'
+
+@lru_cache(maxsize=None)
+def _allowed_origins():
+    """Parse ALLOWED_ORIGINS once per process (shared with workers when preloaded)"""
+    origins = os.getenv('ALLOWED_ORIGINS', DEFAULT_ALLOWED_ORIGINS).split(',')
     # Clean up origins (remove whitespace and empty strings)
-    allowed_origins = [origin.strip() for origin in allowed_origins if origin.strip()]
-    
-    print(f"🔒 CORS allowed origins: {allowed_origins}")
-    
-    CORS(app, resources={
+    return tuple(origin.strip() for origin in origins if origin.strip())
+
+@lru_cache(maxsize=None)
+def _cors_resources():
+    """Build the CORS resource config once per process"""
+    allowed_origins = list(_allowed_origins())
+    return {
         r"/api/*": {
             "origins": allowed_origins,
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
             "allow_headers": ["Content-Type", "Authorization", "X-Requested-With"],
-            "supports_credentials": True
+            "supports_credentials": True,
+            "max_age": 86400  # Let browsers cache preflight responses for 24h
         },
+        # Plain GET with no custom headers is a CORS "simple request" - no preflight
         r"/health": {
             "origins": allowed_origins,
-            "methods": ["GET"]
+            "methods": ["GET"],
+            "allow_headers": [],
+            "max_age": 86400
         }
-    })
+    }
+
+def create_app(profile: str = None):
+    """
+    Application factory pattern
+    
+    Args:
+        profile: Deployment profile selecting which blueprints to register
+                 ('api', 'db' or 'local'; defaults to APP_PROFILE env var, then 'db')
+    """
+    # Load environment variables once per process
+    if not os.getenv('_DOTENV_LOADED'):
+        load_dotenv()
+        os.environ['_DOTENV_LOADED'] = '1'
+    
+    # Pin BLAS to one thread per computing thread unless configured otherwise; this
+    # runs before NumPy is imported (services load lazily) and is inherited by the
+    # spawned watermark pool processes
+    blas_threads = os.getenv('BLAS_THREADS', '1')
+    for name in BLAS_THREAD_VARS:
+        os.environ.setdefault(name, blas_threads)
+    
+    profile = profile or os.getenv('APP_PROFILE', 'db')
+    if profile not in PROFILE_BLUEPRINTS:
+        raise ValueError(f"Unsupported app profile: {profile}")
+    
+    app = Flask(__name__)
+    
+    # Configure CORS
+    if app.debug:
+        app.logger.info(f"CORS allowed origins: {list(_allowed_origins())}")
+    
+    # Flask-CORS answers preflight requests itself; max_age lets browsers cache them
+    CORS(app, resources=_cors_resources())
+    
+    # Per-request profiling (?profile=1) for staging; never enable it in production
+    if os.getenv('ENABLE_PROFILER', 'false').lower() == 'true':
+        from config.profiling import register_profiler
+        register_profiler(app)
+
+    # Use orjson for request/response JSON when it is installed
+    from config.json_provider import ORJSON_OK, OrjsonProvider
+    if ORJSON_OK:
+        app.json = OrjsonProvider(app)
+    
+    # Gzip large JSON responses (base64 images) when flask-compress is installed
+    if os.getenv('ENABLE_COMPRESSION', 'true').lower() == 'true':
+        from config.compression import register_compression
+        register_compression(app)
     
     # Configure Flask
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request size
+    # Hard ceiling for any request body; image endpoints enforce tighter per-endpoint
+    # caps (detect carries up to three base64 images)
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 48 * 1024 * 1024))
+    too_large_response = static_error(
+        'Request entity too large', 'REQUEST_TOO_LARGE', 413,
+        hint=f"Request size exceeds {app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024):.3g}MB limit"
+    )
     app.config['JSON_SORT_KEYS'] = False
     app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0  # Disable caching for development
     app.config['PERMANENT_SESSION_LIFETIME'] = 300  # 5 minutes session timeout
     
-    # Configure Cloudinary
-    cloudinary.config(
-        cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-        api_key=os.getenv('CLOUDINARY_API_KEY'),
-        api_secret=os.getenv('CLOUDINARY_API_SECRET'),
-        secure=True
-    )
+    # Cloudinary is configured lazily by service.image_service on first upload
+    
+    # Import and register blueprints after app creation to avoid circular imports.
+    # Route modules only create their controllers/services on first request.
+    # A blueprint that fails to import is replaced by a 503 fallback instead of
+    # taking down the whole process (and, with preload_app, the Gunicorn master).
+    import routes
+    for blueprint_name in PROFILE_BLUEPRINTS[profile]:
+        try:
+            app.register_blueprint(getattr(routes, blueprint_name))
+        except ImportError as e:
+            app.logger.exception(f"Error importing routes for {blueprint_name}")
+            IMPORT_ERRORS[blueprint_name] = str(e)
+            app.register_blueprint(_unavailable_blueprint(blueprint_name, routes.URL_PREFIXES[blueprint_name]))
     
-    # Import and register blueprints after app creation to avoid circular imports
-    try:
-        from routes.image_routes import image_bp
-        from routes.watermark_routes import watermark_bp
-        from routes.direct_api_routes import direct_api_bp
-        app.register_blueprint(image_bp)
-        app.register_blueprint(watermark_bp)
-        app.register_blueprint(direct_api_bp)
-    except ImportError as e:
-        print(f"Error importing routes: {e}")
-        raise
-    
-    # Global error handlers
+    # Schema creation runs once per release (`flask init-db`), not on worker startup
+    if profile == 'db':
+        @app.cli.command('init-db')
+        def init_db():
+            """Create database tables if they don't exist"""
+            from config.database_manager import DatabaseManager
+            DatabaseManager().create_tables()
+            print("✓ Tables created/verified successfully")
+    
+    # Global error handlers (bodies are pre-serialized in STATIC_RESPONSES)
     @app.errorhandler(404)
     def not_found(error):
-        return {
-            'error': 'Endpoint not found',
-            'code': 'NOT_FOUND'
-        }, 404
+        return _static_response(404)
     
     @app.errorhandler(405)
     def method_not_allowed(error):
-        return {
-            'error': 'Method not allowed',
-            'code': 'METHOD_NOT_ALLOWED'
-        }, 405
+        return _static_response(405)
     
     @app.errorhandler(408)
     def request_timeout(error):
-        return {
-            'error': 'Request timeout - image processing took too long',
-            'code': 'REQUEST_TIMEOUT',
-            'message': 'Please try with a smaller image or contact support if the issue persists'
-        }, 408
+        return _static_response(408)
     
     @app.errorhandler(413)
     def request_entity_too_large(error):
-        return {
-            'error': 'Request entity too large',
-            'code': 'REQUEST_TOO_LARGE',
-            'message': 'Image size exceeds 16MB limit'
-        }, 413
+        return error_response(too_large_response)
     
     @app.errorhandler(500)
     def internal_error(error):
-        return {
-            'error': 'Internal server error',
-            'code': 'INTERNAL_ERROR',
-            'message': 'An unexpected error occurred during image processing'
-        }, 500
+        # Unexpected exceptions from controllers land here; Flask has already logged the traceback
+        return _static_response(500)
     
     # Add a simple health check route
     @app.route('/health')
     def health():
-        return {'status': 'healthy'}, 200
+        return _static_response(200)
     
     return app
 
@@ -110,4 +207,6 @@ def create_app():
 app = create_app()
 
 if __name__ == '__main__':
+    # Local development only - production runs under Gunicorn:
+    #   gunicorn -c gunicorn.conf.py app:app
     app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
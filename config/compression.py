@@ -0,0 +1,38 @@
+# config/compression.py
+import os
+from flask import Flask
+
+try:
+    # Response compression; optional, the app serves uncompressed bodies without it
+    from flask_compress import Compress
+    COMPRESS_OK = True
+except ImportError:
+    Compress = None
+    COMPRESS_OK = False
+
+def register_compression(app: Flask) -> bool:
+    """
+    Gzip JSON responses for clients that send Accept-Encoding: gzip
+    
+    Embed/extract bodies are mostly base64 JPEG text, which deflate shrinks by
+    roughly a quarter (base64 only carries 6 bits per character). Streamed
+    responses (SSE progress, the NDJSON watermark listing) are left alone so
+    they keep flushing incrementally.
+    
+    Args:
+        app: Flask application to attach the compression hook to
+        
+    Returns:
+        bool: True if compression was enabled, False if flask-compress is not installed
+    """
+    if not COMPRESS_OK:
+        return False
+    
+    app.config['COMPRESS_ALGORITHM'] = 'gzip'
+    app.config['COMPRESS_MIMETYPES'] = ['application/json']
+    # Level 1: most of the gain on base64 text at a fraction of the CPU of level 6
+    app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', 1))
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    app.config['COMPRESS_STREAMS'] = False
+    Compress(app)
+    return True
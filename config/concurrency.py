@@ -0,0 +1,15 @@
+# config/concurrency.py
+import multiprocessing
+import os
+
+def gunicorn_worker_count() -> int:
+    """
+    Number of Gunicorn worker processes per host
+    
+    Shared by gunicorn.conf.py and the pools sized per worker (service.job_service),
+    so both agree on how many workers split the CPUs.
+    
+    Returns:
+        int: WORKERS, else WEB_CONCURRENCY (Render/Heroku), else max(2, CPU count)
+    """
+    return int(os.getenv('WORKERS', os.getenv('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count()))))
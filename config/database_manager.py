@@ -1,53 +1,180 @@
 # config/database_manager.py
+import hashlib
 import os
+import queue
+import re
 import sqlite3
-from typing import Dict, Any, Optional, List
+import threading
+import time
+import uuid
+import weakref
+from typing import Callable, Dict, Any, Iterator, Optional, List
 from contextlib import contextmanager
-from config.database import DatabaseConfig
+from functools import lru_cache, partial
+from config.database import get_config
+
+# Connection pools shared by every DatabaseManager in this process,
+# keyed by database type and connection target
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Names of statements already PREPAREd on each PostgreSQL connection;
+# entries disappear when the pool closes the connection
+_prepared_statements = weakref.WeakKeyDictionary()
+_PARAM_PATTERN = re.compile(r'%%|%s')
+
+# Per-driver table existence query and the format of its table name parameter
+TABLE_EXISTS_QUERIES = {
+    # Single pg_class lookup instead of scanning information_schema
+    'postgresql': ("SELECT to_regclass(%s) IS NOT NULL AS table_exists", 'public.{}'),
+    'mysql': ("""
+        SELECT COUNT(*) > 0 AS table_exists
+        FROM information_schema.tables 
+        WHERE table_schema = DATABASE() 
+        AND table_name = %s
+    """, '{}'),
+    'sqlite': ("""
+        SELECT COUNT(*) > 0 AS table_exists FROM sqlite_master 
+        WHERE type='table' AND name=?
+    """, '{}'),
+}
+
+@lru_cache(maxsize=None)
+def _register_postgresql_types():
+    """Decode json/jsonb columns with orjson when it is installed (once per process)"""
+    try:
+        import orjson
+    except ImportError:
+        return
+    from psycopg2.extras import register_default_json, register_default_jsonb
+    register_default_json(globally=True, loads=orjson.loads)
+    register_default_jsonb(globally=True, loads=orjson.loads)
+
+# Compiled row -> dict functions keyed by the result's column names
+_row_builders = {}
+_IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+def _row_builder(columns: tuple) -> Callable[[tuple], Dict[str, Any]]:
+    """
+    Return a function that turns a result row into a dict for these columns
+    
+    Args:
+        columns: Column names from cursor.description
+        
+    Returns:
+        Callable: Generated function building a dict literal, or a zip-based fallback
+        when a column name is not a plain identifier
+    """
+    builder = _row_builders.get(columns)
+    if builder is None:
+        if all(_IDENTIFIER_PATTERN.fullmatch(column) for column in columns):
+            # A dict display with constant keys skips zip() and dict() per row
+            fields = ', '.join(f'{column!r}: row[{index}]' for index, column in enumerate(columns))
+            namespace = {}
+            exec(f"def build(row): return {{{fields}}}", namespace)
+            builder = namespace['build']
+        else:
+            builder = lambda row: dict(zip(columns, row))
+        _row_builders[columns] = builder
+    return builder
+
+def close_pools():
+    """Close all pooled connections (call in the master before workers fork)"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
+class _MySQLPool:
+    """Adapt mysql.connector pooling to the psycopg2 getconn/putconn interface"""
+    
+    def __init__(self, pool_size: int, params: Dict[str, Any]):
+        from mysql.connector.pooling import MySQLConnectionPool
+        self._pool = MySQLConnectionPool(pool_name='watermark_service', pool_size=pool_size, **params)
+    
+    def getconn(self):
+        return self._pool.get_connection()
+    
+    def putconn(self, connection, close: bool = False):
+        # Closing a pooled MySQL connection hands it back to the pool
+        connection.close()
+    
+    def closeall(self):
+        self._pool._remove_connections()
+
+class _SQLitePool:
+    """Queue-backed pool of long-lived SQLite connections with WAL enabled"""
+    
+    def __init__(self, pool_size: int, params: Dict[str, Any]):
+        self._params = params
+        self._idle = queue.Queue(maxsize=pool_size)
+    
+    def _connect(self):
+        connection = sqlite3.connect(**self._params)
+        # WAL lets readers run alongside a writer; NORMAL sync is safe under WAL
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA cache_size={int(os.getenv('SQLITE_CACHE_SIZE', -65536))}")
+        # Serve reads from a memory map instead of read() syscalls; keep temp tables in RAM
+        connection.execute(f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 268435456))}")
+        connection.execute("PRAGMA temp_store=MEMORY")
+        # Wait for a competing writer instead of failing with "database is locked"
+        connection.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))}")
+        return connection
+    
+    def getconn(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+    
+    def putconn(self, connection, close: bool = False):
+        if not close:
+            try:
+                connection.rollback()
+                self._idle.put_nowait(connection)
+                return
+            except (queue.Full, sqlite3.Error):
+                pass
+        connection.close()
+    
+    def closeall(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
 
 class DatabaseManager:
     """Database connection and operation manager"""
     
     def __init__(self):
-        self.config = DatabaseConfig()
+        self.config = get_config()
         self.db_type = self.config.DATABASE_TYPE
         self.db_url = self.config.DATABASE_URL
+        if self.db_type not in TABLE_EXISTS_QUERIES:
+            raise ValueError(f"Unsupported database type: {self.db_type}")
+        self._table_exists_cache = {}
+        
+        # Resolve driver-specific behaviour once instead of branching on db_type per call
+        use_pgbouncer = self.db_type == 'postgresql' and self.config.POOL_CONFIG['pgbouncer']
+        if use_pgbouncer:
+            self._acquire = self._acquire_direct
+        elif self.db_type == 'postgresql':
+            self._acquire = self._acquire_postgresql
+        else:
+            self._acquire = self._acquire_pooled
+        # Prepared statements are per server session, which PgBouncer's
+        # transaction pooling does not preserve
+        self._use_prepared_statements = self.db_type == 'postgresql' and not use_pgbouncer
         
     @contextmanager
     def get_connection(self):
         """Get database connection with context manager for automatic cleanup"""
         connection = None
+        pool = None
         try:
-            if self.db_type == 'postgresql':
-                import psycopg2
-                if self.db_url:
-                    # Use DATABASE_URL directly
-                    connection = psycopg2.connect(self.db_url)
-                else:
-                    # Use parsed parameters
-                    connection = psycopg2.connect(**self.config.get_connection_params())
-                    
-            elif self.db_type == 'mysql':
-                import mysql.connector
-                if self.db_url:
-                    # Parse DATABASE_URL for MySQL
-                    params = self.config._parse_database_url(self.db_url)
-                    connection = mysql.connector.connect(**params)
-                else:
-                    # Use parsed parameters
-                    connection = mysql.connector.connect(**self.config.get_connection_params())
-                    
-            elif self.db_type == 'sqlite':
-                if self.db_url:
-                    # Parse DATABASE_URL for SQLite
-                    params = self.config._parse_database_url(self.db_url)
-                    connection = sqlite3.connect(**params)
-                else:
-                    # Use parsed parameters
-                    connection = sqlite3.connect(**self.config.get_connection_params())
-            else:
-                raise ValueError(f"Unsupported database type: {self.db_type}")
-            
+            connection, pool = self._acquire()
             yield connection
         except Exception as e:
             if connection:
@@ -59,141 +186,304 @@ class DatabaseManager:
         finally:
             if connection:
                 try:
-                    connection.close()
+                    if pool is not None:
+                        # Return the connection to its pool instead of closing it
+                        pool.putconn(connection)
+                    else:
+                        connection.close()
                 except:
                     pass
     
+    def _acquire_direct(self):
+        """Open an unpooled PostgreSQL connection (PgBouncer pools server connections)"""
+        import psycopg2
+        return self._connect_postgresql(psycopg2.connect), None
+    
+    def _acquire_postgresql(self):
+        """Borrow a validated connection from the shared psycopg2 pool"""
+        pool = self._get_pool()
+        return self._checkout_postgresql(pool), pool
+    
+    def _acquire_pooled(self):
+        """Borrow a connection from the shared MySQL or SQLite pool"""
+        pool = self._get_pool()
+        return pool.getconn(), pool
+    
+    def _get_pool(self):
+        """Get (or lazily create) the shared connection pool for this database"""
+        params = self.config.get_connection_params()
+        key = (self.db_type, self.db_url or repr(sorted(params.items())))
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool_config = self.config.POOL_CONFIG
+                if self.db_type == 'postgresql':
+                    from psycopg2.pool import ThreadedConnectionPool
+                    minconn = pool_config['pool_size']
+                    maxconn = pool_config['pool_size'] + pool_config['max_overflow']
+                    pool = self._connect_postgresql(partial(ThreadedConnectionPool, minconn, maxconn))
+                    pool.created_at = {}
+                elif self.db_type == 'mysql':
+                    pool = _MySQLPool(pool_config['pool_size'], params)
+                else:
+                    pool = _SQLitePool(pool_config['pool_size'], params)
+                _pools[key] = pool
+            return pool
+    
+    def _connect_postgresql(self, connect):
+        """Call a psycopg2 connect-style factory with DATABASE_URL or parsed parameters"""
+        _register_postgresql_types()
+        params = self.config.get_connection_params()
+        if self.db_url:
+            # Use DATABASE_URL directly (libpq honours its query options, e.g. sslmode)
+            return connect(self.db_url, application_name=params['application_name'])
+        # Use parsed parameters
+        return connect(**params)
+    
+    def _checkout_postgresql(self, pool):
+        """Take a connection from the pool, replacing expired or dead connections"""
+        pool_config = self.config.POOL_CONFIG
+        connection = pool.getconn()
+        now = time.monotonic()
+        created_at = pool.created_at.setdefault(id(connection), now)
+        
+        expired = pool_config['recycle'] > 0 and now - created_at > pool_config['recycle']
+        if expired or connection.closed or (pool_config['pre_ping'] and not self._ping(connection)):
+            pool.created_at.pop(id(connection), None)
+            pool.putconn(connection, close=True)
+            connection = pool.getconn()
+            pool.created_at[id(connection)] = time.monotonic()
+        
+        return connection
+    
+    def _ping(self, connection) -> bool:
+        """Return True if the connection still answers a trivial query"""
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+    
     def execute_query(self, query: str, params: tuple = None, fetch: bool = True) -> Optional[List[Dict[str, Any]]]:
         """Execute a database query and return results"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             try:
-                if params:
+                if params and self._use_prepared_statements and isinstance(params, (tuple, list)):
+                    # Reuse the server-side plan for this SQL text on this connection
+                    cursor.execute(self._prepare_postgresql(conn, cursor, query, len(params)), params)
+                elif params:
                     cursor.execute(query, params)
                 else:
                     cursor.execute(query)
                 
                 if fetch:
-                    if self.db_type == 'sqlite':
-                        # SQLite doesn't have column names in cursor.description
-                        columns = [description[0] for description in cursor.description]
-                        results = []
-                        for row in cursor.fetchall():
-                            results.append(dict(zip(columns, row)))
-                        return results
-                    else:
-                        # PostgreSQL and MySQL have column names
-                        columns = [desc[0] for desc in cursor.description]
-                        results = []
-                        for row in cursor.fetchall():
-                            results.append(dict(zip(columns, row)))
-                        return results
+                    # Resolve column names once and build rows straight from the cursor
+                    columns = tuple(desc[0] for desc in cursor.description)
+                    return list(map(_row_builder(columns), cursor))
                 else:
                     conn.commit()
                     return None
             finally:
                 cursor.close()
     
-    def execute_many(self, query: str, params_list: List[tuple]) -> None:
-        """Execute multiple queries with different parameters"""
+    def iter_query(self, query: str, params: tuple = None, itersize: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Yield query result rows one at a time instead of building a list
+        
+        Args:
+            query: SQL query to run
+            params: Optional query parameters
+            itersize: Rows fetched from the database per round-trip
+            
+        Returns:
+            Iterator[Dict[str, Any]]: Row dicts; the connection is held until exhausted or closed
+        """
+        with self.get_connection() as conn:
+            if self.db_type == 'postgresql':
+                # Named (server-side) cursor so rows also cross the network in chunks
+                cursor = conn.cursor(name=f'stream_{uuid.uuid4().hex}')
+            else:
+                cursor = conn.cursor()
+            try:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                
+                build_row = None
+                while True:
+                    rows = cursor.fetchmany(itersize)
+                    if not rows:
+                        break
+                    if build_row is None:
+                        # Server-side cursors only describe columns after the first fetch
+                        build_row = _row_builder(tuple(desc[0] for desc in cursor.description))
+                    yield from map(build_row, rows)
+            finally:
+                cursor.close()
+    
+    def _prepare_postgresql(self, conn, cursor, query: str, param_count: int) -> str:
+        """
+        PREPARE a %s-style query once per connection and return its EXECUTE statement
+        
+        Args:
+            conn: Pooled psycopg2 connection the statement is prepared on
+            cursor: Cursor used to issue PREPARE on first use
+            query: SQL text with %s placeholders
+            param_count: Number of bound parameters
+            
+        Returns:
+            str: "EXECUTE <name>(%s, ...)" to run with the original parameters, or the
+                query itself when its placeholders don't match param_count
+        """
+        name = 'stmt_' + hashlib.md5(query.encode('utf-8')).hexdigest()[:16]
+        prepared = _prepared_statements.setdefault(conn, set())
+        if name not in prepared:
+            # Leave queries whose %s count doesn't match the parameters to psycopg2's own checks
+            if _PARAM_PATTERN.findall(query).count('%s') != param_count:
+                return query
+            placeholders = iter(range(1, param_count + 1))
+            sql = _PARAM_PATTERN.sub(lambda m: '%' if m.group() == '%%' else f'${next(placeholders)}', query)
+            cursor.execute(f"PREPARE {name} AS {sql}")
+            prepared.add(name)
+        return f"EXECUTE {name}({', '.join(['%s'] * param_count)})"
+    
+    def execute_many(self, query: str, params_list: List[tuple], page_size: int = 500) -> None:
+        """Execute multiple queries with different parameters in one transaction"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             try:
-                cursor.executemany(query, params_list)
+                if self.db_type == 'postgresql':
+                    # psycopg2's executemany is one round-trip per row; send pages instead
+                    from psycopg2.extras import execute_batch
+                    execute_batch(cursor, query, params_list, page_size=page_size)
+                elif self.db_type == 'mysql':
+                    # mysql.connector rewrites each chunk of INSERTs into a multi-row INSERT
+                    for start in range(0, len(params_list), page_size):
+                        cursor.executemany(query, params_list[start:start + page_size])
+                else:
+                    # sqlite3 binds row by row in C inside a single implicit transaction
+                    cursor.executemany(query, params_list)
                 conn.commit()
             finally:
                 cursor.close()
     
     def table_exists(self, table_name: str) -> bool:
-        """Check if a table exists in the database"""
-        if self.db_type == 'postgresql':
-            query = """
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = %s
-                );
-            """
-        elif self.db_type == 'mysql':
-            query = """
-                SELECT COUNT(*) 
-                FROM information_schema.tables 
-                WHERE table_schema = DATABASE() 
-                AND table_name = %s
-            """
-        elif self.db_type == 'sqlite':
-            query = """
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name=?
-            """
+        """Check if a table exists in the database (cached until create_tables runs)"""
+        if table_name in self._table_exists_cache:
+            return self._table_exists_cache[table_name]
         
-        result = self.execute_query(query, (table_name,))
-        if self.db_type == 'sqlite':
-            return len(result) > 0
-        else:
-            return result[0]['exists'] if result else False
+        query, name_format = TABLE_EXISTS_QUERIES[self.db_type]
+        params = (name_format.format(table_name),)
+        
+        result = self.execute_query(query, params)
+        exists = bool(result[0]['table_exists']) if result else False
+        # Only cache positive answers; a missing table may be created by another worker
+        if exists:
+            self._table_exists_cache[table_name] = True
+        return exists
     
     def create_tables(self):
         """Create watermark tables if they don't exist"""
-        if not self.table_exists('watermarks'):
-            if self.db_type == 'postgresql':
-                query = """
-                    CREATE TABLE watermarks (
+        # IF NOT EXISTS makes this idempotent, so workers racing at startup can't fail
+        if self.db_type == 'postgresql':
+            statements = [
+                """
+                    CREATE TABLE IF NOT EXISTS watermarks (
                         watermark_id SERIAL PRIMARY KEY,
                         store_name VARCHAR(255) NOT NULL,
                         watermark_url_image TEXT NOT NULL,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    );
-                    CREATE INDEX idx_watermarks_store_name ON watermarks(store_name);
+                    )
+                """,
+                "CREATE INDEX IF NOT EXISTS idx_watermarks_store_name ON watermarks(store_name)"
+            ]
+        elif self.db_type == 'mysql':
+            # MySQL has no CREATE INDEX IF NOT EXISTS, so declare the index inline
+            statements = [
                 """
-            elif self.db_type == 'mysql':
-                query = """
-                    CREATE TABLE watermarks (
+                    CREATE TABLE IF NOT EXISTS watermarks (
                         watermark_id INT AUTO_INCREMENT PRIMARY KEY,
                         store_name VARCHAR(255) NOT NULL,
                         watermark_url_image TEXT NOT NULL,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                    );
-                    CREATE INDEX idx_watermarks_store_name ON watermarks(store_name);
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        INDEX idx_watermarks_store_name (store_name)
+                    )
                 """
-            elif self.db_type == 'sqlite':
-                query = """
-                    CREATE TABLE watermarks (
+            ]
+        elif self.db_type == 'sqlite':
+            statements = [
+                """
+                    CREATE TABLE IF NOT EXISTS watermarks (
                         watermark_id INTEGER PRIMARY KEY AUTOINCREMENT,
                         store_name TEXT NOT NULL,
                         watermark_url_image TEXT NOT NULL,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    );
-                    CREATE INDEX idx_watermarks_store_name ON watermarks(store_name);
-                """
-            
-            self.execute_query(query, fetch=False)
-            print(f"Created watermarks table in {self.db_type} database")
+                    )
+                """,
+                "CREATE INDEX IF NOT EXISTS idx_watermarks_store_name ON watermarks(store_name)"
+            ]
+        else:
+            raise ValueError(f"Unsupported database type: {self.db_type}")
+        
+        # Run every statement on one connection and commit once
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+                conn.commit()
+            finally:
+                cursor.close()
+        
+        if self.db_type == 'postgresql':
+            self._create_trigram_index()
+        
+        self._table_exists_cache.clear()
+        print(f"Created/verified watermarks table in {self.db_type} database")
+    
+    def _create_trigram_index(self):
+        """
+        Index store_name with pg_trgm so search_watermarks' ILIKE '%q%' avoids a sequential scan
+        
+        Runs in its own transaction because CREATE EXTENSION needs privileges that
+        managed databases may not grant; search still works (unindexed) without it.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_watermarks_store_name_trgm "
+                    "ON watermarks USING gin (store_name gin_trgm_ops)"
+                )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"⚠ Skipped trigram index on watermarks.store_name: {e}")
+            finally:
+                cursor.close()
     
     def get_last_insert_id(self, cursor) -> int:
         """Get the last inserted ID based on database type"""
         if self.db_type == 'postgresql':
+            # PostgreSQL returns the ID via a RETURNING clause
             return cursor.fetchone()[0]
-        elif self.db_type == 'mysql':
-            return cursor.lastrowid
-        elif self.db_type == 'sqlite':
-            return cursor.lastrowid
-        return None
+        return cursor.lastrowid
     
     def test_connection(self) -> bool:
         """Test database connection and return True if successful"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                if self.db_type == 'postgresql':
-                    cursor.execute("SELECT 1")
-                elif self.db_type == 'mysql':
-                    cursor.execute("SELECT 1")
-                elif self.db_type == 'sqlite':
-                    cursor.execute("SELECT 1")
+                cursor.execute("SELECT 1")
                 cursor.fetchone()
                 cursor.close()
                 return True
@@ -0,0 +1,44 @@
+# config/json_provider.py
+import json
+from decimal import Decimal
+from typing import Any
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+    ORJSON_OK = True
+except ImportError:  # orjson not installed, Flask keeps its default provider
+    orjson = None
+    ORJSON_OK = False
+
+
+def _default(obj: Any) -> Any:
+    """Serialize types orjson does not handle natively"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Serialize obj to UTF-8 JSON bytes using orjson when available"""
+    if ORJSON_OK:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_default).encode('utf-8')
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (C-implemented, keys keep insertion order)"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        # Hand orjson's bytes straight to the response, skipping a decode/encode round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype='application/json')
@@ -0,0 +1,43 @@
+# config/profiling.py
+from flask import Flask, Response, g, request
+
+try:
+    # Sampling profiler; optional, only installed in staging/dev images
+    from pyinstrument import Profiler
+    PYINSTRUMENT_OK = True
+except ImportError:
+    Profiler = None
+    PYINSTRUMENT_OK = False
+
+def register_profiler(app: Flask) -> bool:
+    """
+    Profile any request that carries ?profile=1 and answer it with a pyinstrument HTML report
+
+    Streamed responses (SSE, the watermark listing) are only profiled up to the
+    point the view returns; the body is generated after the report is built.
+
+    Args:
+        app: Flask application to attach the before/after request hooks to
+
+    Returns:
+        bool: True if the hooks were registered, False if pyinstrument is not installed
+    """
+    if not PYINSTRUMENT_OK:
+        app.logger.warning("ENABLE_PROFILER is set but pyinstrument is not installed")
+        return False
+
+    @app.before_request
+    def start_profiler():
+        if request.args.get('profile'):
+            g.profiler = Profiler()
+            g.profiler.start()
+
+    @app.after_request
+    def stop_profiler(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.stop()
+        return Response(profiler.output_html(), mimetype='text/html')
+
+    return True
@@ -0,0 +1,39 @@
+# controller/errors.py
+from flask import Response
+from config.json_provider import dumps_bytes
+
+def static_body(payload, status_code: int = 200):
+    """
+    Serialize a constant JSON body once, at import time
+
+    Args:
+        payload: JSON-serializable body (e.g. a health check response)
+        status_code: HTTP status to respond with
+
+    Returns:
+        tuple: (body_bytes, status_code) for error_response
+    """
+    return dumps_bytes(payload), status_code
+
+def static_error(message: str, code: str, status_code: int = 400, hint: str = None):
+    """
+    Serialize a constant error envelope once, at import time
+
+    Args:
+        message: Human-readable error message
+        code: Machine-readable error code
+        status_code: HTTP status to respond with
+        hint: Optional follow-up advice, sent as the envelope's "message"
+
+    Returns:
+        tuple: (body_bytes, status_code) for error_response
+    """
+    body = {'error': message, 'code': code}
+    if hint is not None:
+        body['message'] = hint
+    return static_body(body, status_code)
+
+def error_response(entry):
+    """Build a fresh response from a pre-serialized (body_bytes, status_code) pair (any status)"""
+    body, status_code = entry
+    return Response(body, status=status_code, mimetype='application/json'), status_code
@@ -1,23 +1,190 @@
 # controller/image_controller.py
-import base64
-from flask import request, jsonify
-from service.image_service import ImageService
-from service.embeded_service import EmbeddedService
-from service.extract_service import ExtractService
-from service.stat_detect import StatDetectService
+import hashlib
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from flask import request, jsonify, Response, send_from_directory, stream_with_context, url_for
+from service import (get_image_service, get_embedded_service, get_extract_service,
+                     get_detect_service, get_job_service)
+from service.image_service import ImageServiceError, NotFoundError
+from config.json_provider import dumps_bytes
+from controller.errors import static_body, static_error, error_response
+from controller.validation import MISSING_BODY_ERROR, EMBED_RULES, check_fields, check_extract_payload
+
+# Health check body is constant; load balancers poll it constantly
+HEALTH_BODY = static_body({
+    'status': 'healthy',
+    'service': 'image_service',
+    'version': '1.0.0'
+})
+
+# Upload validation errors are identical on every request, so serialize them once
+UPLOAD_ERRORS = {
+    code: static_error(message, code, status_code)
+    for code, message, status_code in (
+        ('MISSING_BODY', 'Request body is required', 400),
+        ('MISSING_FIELD', 'Missing required field: image', 400),
+        ('INVALID_IMAGE_DATA', 'Image must be a non-empty base64 string', 400),
+        ('PAYLOAD_TOO_LARGE', 'Request payload exceeds the maximum allowed size', 413),
+    )
+}
+
+def _upload_error(code: str):
+    """Build a fresh response from a pre-serialized upload error body"""
+    return error_response(UPLOAD_ERRORS[code])
+
+# Other constant error bodies, serialized once
+INVALID_ID_ERROR = static_error('Public ID is required', 'INVALID_ID')
+DELETE_FAILED_ERROR = static_error('Failed to delete image', 'DELETE_FAILED', 500)
+INVALID_ALPHA_ERROR = static_error('alpha must be a number between 0 and 1', 'INVALID_ALPHA')
+MISSING_FILE_ERRORS = {
+    field: static_error(f'Missing required file field: {field}', 'MISSING_FIELD')
+    for field in ('original_image', 'watermark_image')
+}
+MISSING_ITEMS_ERROR = static_error('Missing required field: items', 'MISSING_FIELD')
+INVALID_ITEMS_ERROR = static_error('items must be a non-empty list', 'INVALID_BATCH_ITEMS')
+
+# Result images written by the watermark services: kind -> (directory, filename pattern)
+RESULT_FILES = {
+    'watermarked': (os.path.join(tempfile.gettempdir(), "watermarked_images"), 'watermarked_{}.jpg'),
+    'extracted': (os.path.join(tempfile.gettempdir(), "extracted_watermarks"), 'extracted_{}.jpg'),
+}
+_RESULT_ID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+RESULT_NOT_FOUND_ERROR = static_error('Result not found or expired', 'RESULT_NOT_FOUND', 404)
+
+# Futures for embed/extract calls currently running, keyed by a hash of their inputs,
+# so identical concurrent requests share one pipeline run
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _request_key(operation: str, *parts) -> str:
+    """Hash an operation's inputs into a coalescing key"""
+    digest = hashlib.blake2b(operation.encode('utf-8'), digest_size=16)
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+def _coalesce(key: str, compute):
+    """
+    Run compute() once for all concurrent callers with the same key
+    
+    Args:
+        key: Hash of the operation inputs
+        compute: Zero-argument callable producing the result
+        
+    Returns:
+        The shared result; the first caller's exception is re-raised for every waiter
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = _inflight[key] = Future()
+
+    if is_owner:
+        try:
+            future.set_result(compute())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+
+    return future.result()
+
+# Serialized extract responses keyed like _inflight. Only extractions given their
+# sideinfo_json are cached: those are deterministic in the request, while one without
+# it depends on the *.wm.json files on disk, which every embed adds to
+_extract_cache = OrderedDict()
+_extract_cache_lock = threading.Lock()
+
+def _extract_cache_get(key: str):
+    """Return the cached (body_bytes, status_code) for key, or None"""
+    with _extract_cache_lock:
+        entry = _extract_cache.get(key)
+        if entry is not None:
+            _extract_cache.move_to_end(key)
+        return entry
+
+def _extract_cache_put(key: str, entry, maxsize: int) -> None:
+    """Store an entry and evict the least recently used ones beyond maxsize"""
+    with _extract_cache_lock:
+        _extract_cache[key] = entry
+        _extract_cache.move_to_end(key)
+        while len(_extract_cache) > maxsize:
+            _extract_cache.popitem(last=False)
+
+# Serialized get_image_info responses keyed by public_id: (expires_at, body_bytes).
+# Cloudinary metadata for a public_id only changes when the image is deleted or replaced
+_info_cache = OrderedDict()
+_info_cache_lock = threading.Lock()
+
+def _info_cache_get(public_id: str):
+    """Return the cached response body for public_id, or None if absent or expired"""
+    with _info_cache_lock:
+        entry = _info_cache.get(public_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _info_cache[public_id]
+            return None
+        _info_cache.move_to_end(public_id)
+        return entry[1]
+
+def _info_cache_put(public_id: str, body: bytes, ttl: float, maxsize: int) -> None:
+    """Store a response body for ttl seconds and evict the least recently used ones beyond maxsize"""
+    with _info_cache_lock:
+        _info_cache[public_id] = (time.monotonic() + ttl, body)
+        _info_cache.move_to_end(public_id)
+        while len(_info_cache) > maxsize:
+            _info_cache.popitem(last=False)
+
+def _info_cache_invalidate(public_id: str) -> None:
+    with _info_cache_lock:
+        _info_cache.pop(public_id, None)
 
 class ImageController:
     def __init__(self):
-        self.image_service = ImageService()
-        self.embedded_service = EmbeddedService()
-        self.extract_service = ExtractService()
-        self.stat_detect_service = StatDetectService()
+        # Services are per-process singletons shared with the other blueprints
+        self.image_service = get_image_service()
+        self.embedded_service = get_embedded_service()
+        self.extract_service = get_extract_service()
+        self.stat_detect_service = get_detect_service()
+        self.job_service = get_job_service()
+        # Extract result cache size (0 disables) and the largest suspect image worth caching
+        self.extract_cache_size = int(os.getenv('WM_EXTRACT_CACHE', 128))
+        self.extract_cache_max_payload = int(os.getenv('WM_EXTRACT_CACHE_MAX_PAYLOAD', 4 * 1024 * 1024))
+        # Seconds between SSE keep-alive comments so proxies don't drop idle streams
+        self.sse_heartbeat_interval = float(os.getenv('SSE_HEARTBEAT_INTERVAL', 15))
+        # Image info cache size (0 disables) and entry lifetime in seconds
+        self.info_cache_size = int(os.getenv('IMAGE_INFO_CACHE_SIZE', 4096))
+        self.info_cache_ttl = float(os.getenv('IMAGE_INFO_CACHE_TTL', 300))
+        self.max_batch_size = int(os.getenv('MAX_BATCH_SIZE', 10))
+        # Result files are named by a fresh uuid and never rewritten, so clients may cache them
+        self.result_max_age = int(os.getenv('RESULT_MAX_AGE', 365 * 24 * 3600))
+        self.batch_max_workers = int(os.getenv('BATCH_MAX_WORKERS', 4))
+        # Largest accepted image in bytes, and its base64 length (plus room for a data: URL prefix)
+        self.max_upload_size = self.image_service.max_file_size
+        self.max_upload_base64_length = (self.max_upload_size + 2) // 3 * 4 + 256
+        # Request body caps, checked against Content-Length before anything is read:
+        # one base64 image per image field plus room for the remaining JSON fields
+        self.max_upload_request_size = self._request_size_limit(1)
+        self.max_embed_request_size = self._request_size_limit(2)
+        self.max_extract_request_size = self._request_size_limit(2)  # suspect image + sideinfo watermark_ref
+        self.max_detect_request_size = self._request_size_limit(3)
 
     def upload_image(self):
         """
         Handle image upload request
         
-        Expected JSON payload:
+        Expected multipart/form-data with an "image" file field, or JSON payload:
         {
             "image": "base64_encoded_string_here"
         }
@@ -25,24 +192,45 @@ class ImageController:
         Returns:
             tuple: (response_data, status_code)
         """
+        # Reject oversized bodies before Flask buffers and parses them
+        too_large = self._reject_if_too_large(self.max_upload_request_size)
+        if too_large:
+            return too_large
+
         try:
-            # Validate request content type
-            if not request.is_json:
-                return jsonify({
-                    'error': 'Content-Type must be application/json',
-                    'code': 'INVALID_CONTENT_TYPE'
-                }), 400
+            # Binary uploads skip base64 encoding on the wire and decoding here
+            if request.mimetype == 'multipart/form-data':
+                image_file = request.files.get('image')
+                if image_file is None:
+                    return _upload_error('MISSING_FIELD')
 
-            # Get request data
-            data = request.get_json()
-            
-            # Validate payload structure
-            validation_error = self._validate_upload_payload(data)
-            if validation_error:
-                return validation_error
+                # Read at most one byte past the limit instead of buffering an oversized file
+                image_data = image_file.read(self.max_upload_size + 1)
+                if len(image_data) > self.max_upload_size:
+                    return _upload_error('PAYLOAD_TOO_LARGE')
+
+                # Let a background thread wait on Cloudinary when the client asked for a job
+                if self._wants_async():
+                    return self._submit_upload_job(self.image_service.upload_image_bytes, image_data)
+
+                result = self.job_service.run_io(self.image_service.upload_image_bytes, image_data)
+
+            # Anything else is JSON (the image blueprint rejects other Content-Types)
+            else:
+                # Get request data
+                data = request.get_json(silent=True)
+                
+                # Validate payload structure
+                validation_error = self._validate_upload_payload(data)
+                if validation_error:
+                    return validation_error
 
-            # Process upload through service
-            result = self.image_service.upload_base64_image(data['image'])
+                # Let a background thread wait on Cloudinary when the client asked for a job
+                if self._wants_async():
+                    return self._submit_upload_job(self.image_service.upload_base64_image, data['image'])
+
+                # Process upload through service
+                result = self.job_service.run_io(self.image_service.upload_base64_image, data['image'])
             
             return jsonify({
                 'success': True,
@@ -56,7 +244,7 @@ class ImageController:
                 'code': 'VALIDATION_ERROR'
             }), 400
 
-        except Exception as e:
+        except ImageServiceError as e:
             return jsonify({
                 'error': str(e),
                 'code': 'UPLOAD_ERROR'
@@ -74,20 +262,31 @@ class ImageController:
         """
         try:
             if not public_id:
-                return jsonify({
-                    'error': 'Public ID is required',
-                    'code': 'INVALID_ID'
-                }), 400
+                return error_response(INVALID_ID_ERROR)
+
+            # Serve recently fetched info without a Cloudinary round trip
+            cached = _info_cache_get(public_id) if self.info_cache_size else None
+            if cached is not None:
+                return Response(cached, status=200, mimetype='application/json'), 200
 
             # Get image info through service
-            result = self.image_service.get_image_info(public_id)
+            result = self.job_service.run_io(self.image_service.get_image_info, public_id)
             
-            return jsonify({
+            body = dumps_bytes({
                 'success': True,
                 'data': result
-            }), 200
+            })
+            if self.info_cache_size:
+                _info_cache_put(public_id, body, self.info_cache_ttl, self.info_cache_size)
+            return Response(body, status=200, mimetype='application/json'), 200
 
-        except Exception as e:
+        except NotFoundError as e:
+            return jsonify({
+                'error': str(e),
+                'code': 'IMAGE_NOT_FOUND'
+            }), 404
+
+        except ImageServiceError as e:
             return jsonify({
                 'error': str(e),
                 'code': 'RETRIEVAL_ERROR'
@@ -105,13 +304,13 @@ class ImageController:
         """
         try:
             if not public_id:
-                return jsonify({
-                    'error': 'Public ID is required',
-                    'code': 'INVALID_ID'
-                }), 400
+                return error_response(INVALID_ID_ERROR)
 
-            # Delete image through service
-            success = self.image_service.delete_image(public_id)
+            # Delete image through service, dropping any cached info once Cloudinary has answered
+            try:
+                success = self.job_service.run_io(self.image_service.delete_image, public_id)
+            finally:
+                _info_cache_invalidate(public_id)
             
             if success:
                 return jsonify({
@@ -119,12 +318,9 @@ class ImageController:
                     'message': 'Image deleted successfully'
                 }), 200
             else:
-                return jsonify({
-                    'error': 'Failed to delete image',
-                    'code': 'DELETE_FAILED'
-                }), 500
+                return error_response(DELETE_FAILED_ERROR)
 
-        except Exception as e:
+        except ImageServiceError as e:
             return jsonify({
                 'error': str(e),
                 'code': 'DELETE_ERROR'
@@ -134,7 +330,8 @@ class ImageController:
         """
         Handle watermark embedding request
         
-        Expected JSON payload:
+        Expected multipart/form-data with "original_image" and "watermark_image" file
+        fields (and an optional "alpha" form field), or JSON payload:
         {
             "original_image": "base64_encoded_original_image",
             "watermark_image": "base64_encoded_watermark_image",
@@ -144,46 +341,57 @@ class ImageController:
         Returns:
             tuple: (response_data, status_code)
         """
+        # Reject oversized bodies before Flask buffers and parses them
+        too_large = self._reject_if_too_large(self.max_embed_request_size)
+        if too_large:
+            return too_large
+
         try:
-            # Validate request content type
-            if not request.is_json:
-                return jsonify({
-                    'error': 'Content-Type must be application/json',
-                    'code': 'INVALID_CONTENT_TYPE'
-                }), 400
+            # Binary uploads are already raw image bytes, so they skip base64 decoding
+            if request.mimetype == 'multipart/form-data':
+                validation_error = self._validate_watermark_files()
+                if validation_error:
+                    return validation_error
 
-            # Get request data
-            data = request.get_json()
-            
-            # Validate payload structure
-            validation_error = self._validate_watermark_payload(data)
-            if validation_error:
-                return validation_error
+                params = {
+                    'original_image': request.files['original_image'].read(),
+                    'watermark_image': request.files['watermark_image'].read(),
+                    'alpha': float(request.form.get('alpha', 0.6))
+                }
 
-            # Extract parameters
-            original_image = data['original_image']
-            watermark_image = data['watermark_image']
-            alpha = data.get('alpha', 0.6)  # Default alpha value
-
-            # Process watermark embedding through service
-            result = self.embedded_service.embed_watermark_from_base64(
-                original_image, 
-                watermark_image, 
-                alpha
-            )
+                # Hand CPU-heavy work to the process pool when the client asked for a job
+                if self._wants_async():
+                    return self._submit_job('embed', params, decoded=True)
+
+                # Process watermark embedding through service
+                result = self._embed_from_bytes(params)
+
+            # Anything else is JSON (the image blueprint rejects other Content-Types)
+            else:
+                # Get request data
+                data = request.get_json(silent=True)
+                
+                # Validate payload structure
+                validation_error = self._validate_watermark_payload(data)
+                if validation_error:
+                    return validation_error
+
+                # Hand CPU-heavy work to the process pool when the client asked for a job
+                if self._wants_async():
+                    return self._submit_job('embed', data)
+
+                # Extract parameters
+                original_image = data['original_image']
+                watermark_image = data['watermark_image']
+                alpha = data.get('alpha', 0.6)  # Default alpha value
+
+                # Process watermark embedding through service
+                result = self._embed_from_base64(original_image, watermark_image, alpha)
             
-            return jsonify({
-                'success': True,
-                'message': 'Watermark embedded successfully',
-                'data': {
-                    'watermarked_image': result['watermarked_image_b64'],
-                    'unique_id': result['unique_id'],
-                    'image_size': result['image_size'],
-                    'metadata': result['metadata'],
-                    'output_path': result['output_path'],
-                    'metadata_path': result['metadata_path']
-                }
-            }), 200
+            body = self._build_embed_response(result)[0]
+            if self._wants_image_urls():
+                self._link_result_image(body['data'], 'watermarked_image', 'watermarked', 'watermarked_url')
+            return jsonify(body), 200
 
         except ValueError as e:
             return jsonify({
@@ -221,66 +429,48 @@ class ImageController:
         Returns:
             tuple: (response_data, status_code)
         """
-        try:
-            # Validate request content type
-            if not request.is_json:
-                return jsonify({
-                    'error': 'Content-Type must be application/json',
-                    'code': 'INVALID_CONTENT_TYPE'
-                }), 400
+        # Reject oversized bodies before Flask buffers and parses them
+        too_large = self._reject_if_too_large(self.max_extract_request_size)
+        if too_large:
+            return too_large
 
-            # Get request data
-            data = request.get_json()
+        try:
+            # Get request data (Content-Type is checked by the image blueprint)
+            data = request.get_json(silent=True)
             
             # Validate payload structure
             validation_error = self._validate_extract_payload(data)
             if validation_error:
                 return validation_error
 
+            # Hand CPU-heavy work to the process pool when the client asked for a job
+            if self._wants_async():
+                return self._submit_job('extract', data)
+
             # Extract parameters
             suspect_image = data['suspect_image']
             sideinfo_json = data.get('sideinfo_json', None)
 
+            # Serve repeated extractions of the same inputs from the cache
+            key = self._extract_key(suspect_image, sideinfo_json)
+            image_urls = self._wants_image_urls()
+            cache_key = key + ':url' if image_urls else key
+            cacheable = self.extract_cache_size and sideinfo_json is not None
+            cached = _extract_cache_get(cache_key) if cacheable else None
+            if cached is not None:
+                body_bytes, status_code = cached
+                return Response(body_bytes, status=status_code, mimetype='application/json'), status_code
+
             # Process watermark extraction through service
-            result = self.extract_service.extract_watermark_from_base64_with_json(
-                suspect_image, 
-                sideinfo_json
-            )
-            
-            # Handle different extraction statuses
-            if result["status"] == "ok_extracted":
-                return jsonify({
-                    'success': True,
-                    'message': 'Watermark extracted successfully',
-                    'status': 'extracted',
-                    'data': {
-                        'extracted_watermark': result.get('extracted_image_b64'),
-                        'unique_id': result.get('unique_id'),
-                        'alpha': result['alpha'],
-                        'wavelet': result['wavelet'],
-                        'canonical_size': result['canonical_size'],
-                        'sideinfo_used': result['sideinfo_used'],
-                        'watermark_logo': result['watermark_logo'],
-                        'extracted_path': result['extracted_path']
-                    }
-                }), 200
-            
-            elif result["status"] in ["skip_no_sideinfo", "skip_bad_meta"]:
-                return jsonify({
-                    'success': True,
-                    'message': 'No watermark extraction possible - proceed with embedding',
-                    'status': 'no_extraction',
-                    'reason': result['reason'],
-                    'data': {
-                        'proceed_to_embedding': True
-                    }
-                }), 200
+            result = self._extract_from_base64(suspect_image, sideinfo_json, key)
             
-            else:
-                return jsonify({
-                    'error': f"Unexpected extraction status: {result.get('status', 'unknown')}",
-                    'code': 'EXTRACTION_ERROR'
-                }), 500
+            body, status_code = self._build_extract_response(result)
+            if image_urls and body.get('status') == 'extracted':
+                self._link_result_image(body['data'], 'extracted_watermark', 'extracted', 'extracted_url')
+            if (cacheable and body.get('status') == 'extracted'
+                    and len(suspect_image) <= self.extract_cache_max_payload):
+                _extract_cache_put(cache_key, (dumps_bytes(body), status_code), self.extract_cache_size)
+            return jsonify(body), status_code
 
         except ValueError as e:
             return jsonify({
@@ -310,22 +500,24 @@ class ImageController:
         Returns:
             tuple: (response_data, status_code)
         """
-        try:
-            # Validate request content type
-            if not request.is_json:
-                return jsonify({
-                    'error': 'Content-Type must be application/json',
-                    'code': 'INVALID_CONTENT_TYPE'
-                }), 400
+        # Reject oversized bodies before Flask buffers and parses them
+        too_large = self._reject_if_too_large(self.max_detect_request_size)
+        if too_large:
+            return too_large
 
-            # Get request data
-            data = request.get_json()
+        try:
+            # Get request data (Content-Type is checked by the image blueprint)
+            data = request.get_json(silent=True)
             
             # Validate payload structure
             validation_error = self._validate_detect_payload(data)
             if validation_error:
                 return validation_error
 
+            # Hand CPU-heavy work to the process pool when the client asked for a job
+            if self._wants_async():
+                return self._submit_job('detect', data)
+
             # Extract parameters
             original_watermark = data['original_watermark']
             extracted_watermark = data['extracted_watermark']
@@ -333,29 +525,16 @@ class ImageController:
             save_record = data.get('save_record', False)
             suspect_image = data.get('suspect_image', None)
 
-            # Process watermark detection through service
-            result = self.stat_detect_service.compare_watermarks_from_base64(
-                original_wm_b64=original_watermark,
-                extracted_wm_b64=extracted_watermark,
-                pcc_threshold=pcc_threshold,
-                save_record=save_record,
-                suspect_image_b64=suspect_image
-            )
+            # Process watermark detection on the CPU pool
+            result = self.job_service.run('detect', {
+                'original_watermark': original_watermark,
+                'extracted_watermark': extracted_watermark,
+                'pcc_threshold': pcc_threshold,
+                'save_record': save_record,
+                'suspect_image': suspect_image
+            })
             
-            return jsonify({
-                'success': True,
-                'message': 'Watermark detection completed successfully',
-                'data': {
-                    'detection_result': {
-                        'is_match': result['detection']['is_match'],
-                        'pcc_threshold': result['detection']['pcc_threshold'],
-                        'used_absolute_pcc': result['detection']['used_absolute_pcc']
-                    },
-                    'metrics': result['metrics'],
-                    'comparison_results': result['comparison_results'],
-                    'detection_record': result.get('detection_record', None)
-                }
-            }), 200
+            return jsonify(self._build_detect_response(result)[0]), 200
 
         except ValueError as e:
             return jsonify({
@@ -369,47 +548,409 @@ class ImageController:
                 'code': 'WATERMARK_DETECT_ERROR'
             }), 500
 
-    def health_check(self):
-        """Handle health check request"""
-        return jsonify({
-            'status': 'healthy',
-            'service': 'image_service',
-            'version': '1.0.0'
-        }), 200
+    def detect_watermark_stream(self):
+        """
+        Handle watermark detection request, streaming progress as Server-Sent Events
+        
+        Expects the same JSON payload as detect_watermark. Emits
+        {"type": "progress", "stage": "...", "pct": N} events while the metrics are
+        computed, then one {"type": "done", ...detect response...} or
+        {"type": "error", "error": "...", "code": "..."} event.
+        
+        Returns:
+            Response: text/event-stream
+        """
+        # Reject oversized bodies before Flask buffers and parses them
+        too_large = self._reject_if_too_large(self.max_detect_request_size)
+        if too_large:
+            return too_large
 
-    def _validate_upload_payload(self, data):
+        try:
+            # Get request data (Content-Type is checked by the image blueprint)
+            data = request.get_json(silent=True)
+            
+            # Validate payload structure
+            validation_error = self._validate_detect_payload(data)
+            if validation_error:
+                return validation_error
+
+            events = queue.Queue()
+
+            def progress(stage, pct):
+                events.put({'type': 'progress', 'stage': stage, 'pct': pct})
+
+            def run():
+                try:
+                    result = self.stat_detect_service.compare_watermarks_from_base64(
+                        original_wm_b64=data['original_watermark'],
+                        extracted_wm_b64=data['extracted_watermark'],
+                        pcc_threshold=data.get('pcc_threshold', 0.70),
+                        save_record=data.get('save_record', False),
+                        suspect_image_b64=data.get('suspect_image', None),
+                        progress_cb=progress
+                    )
+                    events.put({'type': 'done', **self._build_detect_response(result)[0]})
+                except ValueError as e:
+                    events.put({'type': 'error', 'error': str(e), 'code': 'VALIDATION_ERROR'})
+                except Exception as e:
+                    events.put({'type': 'error', 'error': str(e), 'code': 'WATERMARK_DETECT_ERROR'})
+
+            # Detection runs on its own thread so the stream can send heartbeats between stages
+            threading.Thread(target=run, name='detect-stream', daemon=True).start()
+
+            def generate():
+                while True:
+                    try:
+                        event = events.get(timeout=self.sse_heartbeat_interval)
+                    except queue.Empty:
+                        yield b':\n\n'
+                        continue
+                    yield b'data: ' + dumps_bytes(event) + b'\n\n'
+                    if event['type'] != 'progress':
+                        return
+
+            return Response(
+                stream_with_context(generate()),
+                status=200,
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        except Exception as e:
+            return jsonify({
+                'error': str(e),
+                'code': 'WATERMARK_DETECT_ERROR'
+            }), 500
+
+    def batch_process(self):
         """
-        Validate upload request payload
+        Handle batch image processing request
+        
+        Expected JSON payload:
+        {
+            "items": [
+                {"operation": "embed", "params": {...}},    // same payload as /embed-watermark
+                {"operation": "extract", "params": {...}},  // same payload as /extract-watermark
+                {"operation": "detect", "params": {...}},   // same payload as /detect-watermark
+                {"operation": "upload", "params": {...}}    // same payload as /upload
+            ]
+        }
+        
+        Items are processed concurrently; results are streamed back in request order.
+        
+        Returns:
+            Response: streamed JSON {"success": true, "count": N, "results": [...]}
+        """
+        try:
+            # Get request data (Content-Type is checked by the image blueprint)
+            data = request.get_json(silent=True)
+            
+            # Validate payload structure
+            validation_error = self._validate_batch_payload(data)
+            if validation_error:
+                return validation_error
+
+            items = data['items']
+
+            # Validate every item up front so workers only run service calls
+            jobs = []
+            for item in items:
+                operation = item['operation']
+                params = item.get('params') or {}
+                item_error = self.BATCH_OPERATIONS[operation][0](self, params)
+                if item_error:
+                    response, status_code = item_error
+                    jobs.append((None, None, response.get_json(), status_code))
+                else:
+                    jobs.append((self.BATCH_OPERATIONS[operation][1], params, None, None))
+
+            def run_job(job):
+                runner, params, error_body, status_code = job
+                if runner is None:
+                    return {'success': False, 'status_code': status_code, **error_body}
+                try:
+                    return {'success': True, 'status_code': 200, 'data': runner(self, params)}
+                except ValueError as e:
+                    return {'success': False, 'status_code': 400, 'error': str(e), 'code': 'VALIDATION_ERROR'}
+                except Exception as e:
+                    return {'success': False, 'status_code': 500, 'error': str(e), 'code': 'BATCH_ITEM_ERROR'}
+
+            def generate():
+                yield b'{"success": true, "count": %d, "results": [' % len(jobs)
+                with ThreadPoolExecutor(max_workers=min(len(jobs), self.batch_max_workers)) as executor:
+                    # executor.map yields in submission order, so results keep item order
+                    for index, item_result in enumerate(executor.map(run_job, jobs)):
+                        yield (b',' if index else b'') + dumps_bytes({'index': index, **item_result})
+                yield b']}'
+
+            return Response(stream_with_context(generate()), status=200, mimetype='application/json')
+
+        except Exception as e:
+            return jsonify({
+                'error': str(e),
+                'code': 'BATCH_ERROR'
+            }), 500
+
+    def get_job(self, job_id):
+        """
+        Handle job status request for upload/embed/extract/detect calls made with ?async=true
         
         Args:
-            data: Request JSON data
+            job_id: Job id returned in the 202 response
             
         Returns:
-            tuple or None: Error response tuple if validation fails, None if valid
+            tuple: (response_data, status_code)
         """
-        if not data:
+        job = self.job_service.get_job(job_id)
+        if job is None:
             return jsonify({
-                'error': 'Request body is required',
-                'code': 'MISSING_BODY'
-            }), 400
+                'error': f'Job {job_id} not found or expired',
+                'code': 'JOB_NOT_FOUND'
+            }), 404
 
-        if 'image' not in data:
-            return jsonify({
-                'error': 'Missing required field: image',
-                'code': 'MISSING_FIELD'
-            }), 400
+        return jsonify({'success': True, **job}), 200
 
-        if not data['image'] or not isinstance(data['image'], str):
-            return jsonify({
-                'error': 'Image must be a non-empty base64 string',
-                'code': 'INVALID_IMAGE_DATA'
-            }), 400
+    def get_result(self, kind, unique_id):
+        """
+        Handle result image download (embed/extract responses requested with ?images=url)
+        
+        Args:
+            kind: 'watermarked' or 'extracted'
+            unique_id: unique_id from the embed/extract response
+            
+        Returns:
+            Response: JPEG file with ETag/Last-Modified (304 when the client's copy is current)
+        """
+        if kind not in RESULT_FILES or not _RESULT_ID_PATTERN.fullmatch(unique_id):
+            return error_response(RESULT_NOT_FOUND_ERROR)
+
+        directory, pattern = RESULT_FILES[kind]
+        path = pattern.format(unique_id)
+        if not os.path.isfile(os.path.join(directory, path)):
+            return error_response(RESULT_NOT_FOUND_ERROR)
+
+        return send_from_directory(
+            directory,
+            path,
+            mimetype='image/jpeg',
+            conditional=True,
+            etag=True,
+            max_age=self.result_max_age
+        )
+
+    def health_check(self):
+        """Handle health check request"""
+        return error_response(HEALTH_BODY)
+
+    def _request_size_limit(self, image_count: int) -> int:
+        """Largest request body accepted for an endpoint carrying image_count base64 images"""
+        return image_count * self.max_upload_base64_length + 64 * 1024
 
+    def _reject_if_too_large(self, max_bytes: int):
+        """
+        Check the declared Content-Length against an endpoint's cap
+        
+        Args:
+            max_bytes: Largest accepted request body
+            
+        Returns:
+            tuple or None: 413 response tuple if the body is too large, None otherwise
+        """
+        if request.content_length and request.content_length > max_bytes:
+            return _upload_error('PAYLOAD_TOO_LARGE')
         return None
 
-    def _validate_watermark_payload(self, data):
+    def _wants_async(self):
+        """Return True when the client asked for a background job (?async=true)"""
+        return request.args.get('async', '').lower() in ('1', 'true')
+
+    def _wants_image_urls(self):
+        """Return True when the client asked for result image URLs instead of inline base64 (?images=url)"""
+        return request.args.get('images', '').lower() == 'url'
+
+    def _link_result_image(self, data, field, kind, url_field):
+        """Replace a response's inline base64 result image with its download URL"""
+        data.pop(field, None)
+        data[url_field] = url_for('image.get_result', kind=kind, unique_id=data['unique_id'], _external=True)
+
+    def _submit_job(self, operation, data, decoded=False):
+        """Queue a validated embed/extract/detect payload and answer 202 with the job id"""
+        build_response = {
+            'embed': self._build_embed_response,
+            'extract': self._build_extract_response,
+            'detect': self._build_detect_response,
+        }[operation]
+        return self._job_accepted(self.job_service.submit(operation, data, build_response, decoded=decoded))
+
+    def _submit_upload_job(self, upload, payload):
+        """Queue a validated upload on the I/O thread pool and answer 202 with the job id"""
+        job_id = self.job_service.submit_io(upload, payload, build_response=lambda result: ({
+            'success': True,
+            'message': 'Image uploaded successfully',
+            'data': result
+        }, 201))
+        return self._job_accepted(job_id)
+
+    def _job_accepted(self, job_id):
+        """Build the 202 response pointing clients at the job status endpoint"""
+        return jsonify({
+            'success': True,
+            'message': 'Job accepted',
+            'job_id': job_id,
+            'status': 'pending',
+            'status_url': f'/api/images/jobs/{job_id}'
+        }), 202
+
+    def _build_embed_response(self, result):
         """
-        Validate watermark embedding request payload
+        Map an EmbeddedService result to the API response body
+        
+        Returns:
+            tuple: (response_body, status_code)
+        """
+        return {
+            'success': True,
+            'message': 'Watermark embedded successfully',
+            'data': self._build_embed_data(result)
+        }, 200
+
+    def _build_detect_response(self, result):
+        """
+        Map a StatDetectService result to the API response body
+        
+        Returns:
+            tuple: (response_body, status_code)
+        """
+        return {
+            'success': True,
+            'message': 'Watermark detection completed successfully',
+            'data': self._build_detect_data(result)
+        }, 200
+
+    def _build_embed_data(self, result):
+        """Map an EmbeddedService result to the API response data"""
+        return {
+            'watermarked_image': result['watermarked_image_b64'],
+            'unique_id': result['unique_id'],
+            'image_size': result['image_size'],
+            'metadata': result['metadata'],
+            'output_path': result['output_path'],
+            'metadata_path': result['metadata_path']
+        }
+
+    def _build_extract_response(self, result):
+        """
+        Map an ExtractService result to the API response body
+        
+        Returns:
+            tuple: (response_body, status_code)
+        """
+        # Handle different extraction statuses
+        if result["status"] == "ok_extracted":
+            return {
+                'success': True,
+                'message': 'Watermark extracted successfully',
+                'status': 'extracted',
+                'data': {
+                    'extracted_watermark': result.get('extracted_image_b64'),
+                    'unique_id': result.get('unique_id'),
+                    'alpha': result['alpha'],
+                    'wavelet': result['wavelet'],
+                    'canonical_size': result['canonical_size'],
+                    'sideinfo_used': result['sideinfo_used'],
+                    'watermark_logo': result['watermark_logo'],
+                    'extracted_path': result['extracted_path']
+                }
+            }, 200
+        
+        elif result["status"] in ["skip_no_sideinfo", "skip_bad_meta"]:
+            return {
+                'success': True,
+                'message': 'No watermark extraction possible - proceed with embedding',
+                'status': 'no_extraction',
+                'reason': result['reason'],
+                'data': {
+                    'proceed_to_embedding': True
+                }
+            }, 200
+        
+        else:
+            return {
+                'error': f"Unexpected extraction status: {result.get('status', 'unknown')}",
+                'code': 'EXTRACTION_ERROR'
+            }, 500
+
+    def _build_detect_data(self, result):
+        """Map a StatDetectService result to the API response data"""
+        return {
+            'detection_result': {
+                'is_match': result['detection']['is_match'],
+                'pcc_threshold': result['detection']['pcc_threshold'],
+                'used_absolute_pcc': result['detection']['used_absolute_pcc']
+            },
+            'metrics': result['metrics'],
+            'comparison_results': result['comparison_results'],
+            'detection_record': result.get('detection_record', None)
+        }
+
+    def _embed_from_base64(self, original_image, watermark_image, alpha):
+        """Embed a watermark, sharing the run with identical concurrent requests"""
+        key = _request_key('embed', original_image, watermark_image, repr(float(alpha)))
+        return _coalesce(key, lambda: self.job_service.run('embed', {
+            'original_image': original_image,
+            'watermark_image': watermark_image,
+            'alpha': alpha
+        }))
+
+    def _embed_from_bytes(self, params):
+        """Embed a watermark from raw image bytes, sharing the run with identical concurrent requests"""
+        key = _request_key('embed', params['original_image'], params['watermark_image'], repr(params['alpha']))
+        return _coalesce(key, lambda: self.job_service.run('embed', params, decoded=True))
+
+    def _extract_key(self, suspect_image, sideinfo_json):
+        """Hash extract inputs into the coalescing/cache key"""
+        return _request_key('extract', suspect_image, json.dumps(sideinfo_json, sort_keys=True))
+
+    def _extract_from_base64(self, suspect_image, sideinfo_json, key=None):
+        """Extract a watermark, sharing the run with identical concurrent requests"""
+        key = key or self._extract_key(suspect_image, sideinfo_json)
+        return _coalesce(key, lambda: self.job_service.run('extract', {
+            'suspect_image': suspect_image,
+            'sideinfo_json': sideinfo_json
+        }))
+
+    def _run_batch_upload(self, params):
+        """Run a single batch upload item"""
+        return self.job_service.run_io(self.image_service.upload_base64_image, params['image'])
+
+    def _run_batch_embed(self, params):
+        """Run a single batch embed item"""
+        result = self._embed_from_base64(
+            params['original_image'],
+            params['watermark_image'],
+            params.get('alpha', 0.6)
+        )
+        return self._build_embed_data(result)
+
+    def _run_batch_extract(self, params):
+        """Run a single batch extract item"""
+        result = self._extract_from_base64(
+            params['suspect_image'],
+            params.get('sideinfo_json', None)
+        )
+        body, status_code = self._build_extract_response(result)
+        if status_code != 200:
+            raise Exception(body['error'])
+        return {key: value for key, value in body.items() if key != 'success'}
+
+    def _run_batch_detect(self, params):
+        """Run a single batch detect item"""
+        result = self.job_service.run('detect', params)
+        return self._build_detect_data(result)
+
+    def _validate_batch_payload(self, data):
+        """
+        Validate batch request payload
         
         Args:
             data: Request JSON data
@@ -418,49 +959,39 @@ class ImageController:
             tuple or None: Error response tuple if validation fails, None if valid
         """
         if not data:
-            return jsonify({
-                'error': 'Request body is required',
-                'code': 'MISSING_BODY'
-            }), 400
+            return error_response(MISSING_BODY_ERROR)
 
-        if 'original_image' not in data:
-            return jsonify({
-                'error': 'Missing required field: original_image',
-                'code': 'MISSING_FIELD'
-            }), 400
+        if 'items' not in data:
+            return error_response(MISSING_ITEMS_ERROR)
 
-        if 'watermark_image' not in data:
-            return jsonify({
-                'error': 'Missing required field: watermark_image',
-                'code': 'MISSING_FIELD'
-            }), 400
+        items = data['items']
+        if not isinstance(items, list) or not items:
+            return error_response(INVALID_ITEMS_ERROR)
 
-        if not data['original_image'] or not isinstance(data['original_image'], str):
+        if len(items) > self.max_batch_size:
             return jsonify({
-                'error': 'original_image must be a non-empty base64 string',
-                'code': 'INVALID_IMAGE_DATA'
+                'error': f'Batch size exceeds maximum of {self.max_batch_size} items',
+                'code': 'BATCH_TOO_LARGE'
             }), 400
 
-        if not data['watermark_image'] or not isinstance(data['watermark_image'], str):
-            return jsonify({
-                'error': 'watermark_image must be a non-empty base64 string',
-                'code': 'INVALID_IMAGE_DATA'
-            }), 400
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or item.get('operation') not in self.BATCH_OPERATIONS:
+                return jsonify({
+                    'error': f'items[{index}].operation must be one of: {", ".join(self.BATCH_OPERATIONS)}',
+                    'code': 'INVALID_BATCH_OPERATION'
+                }), 400
 
-        # Validate alpha if provided
-        if 'alpha' in data:
-            alpha = data['alpha']
-            if not isinstance(alpha, (int, float)) or alpha <= 0 or alpha > 1:
+            if item.get('params') is not None and not isinstance(item['params'], dict):
                 return jsonify({
-                    'error': 'alpha must be a number between 0 and 1',
-                    'code': 'INVALID_ALPHA'
+                    'error': f'items[{index}].params must be a JSON object',
+                    'code': 'INVALID_BATCH_PARAMS'
                 }), 400
 
         return None
 
-    def _validate_extract_payload(self, data):
+    def _validate_upload_payload(self, data):
         """
-        Validate watermark extraction request payload
+        Validate upload request payload
         
         Args:
             data: Request JSON data
@@ -469,65 +1000,67 @@ class ImageController:
             tuple or None: Error response tuple if validation fails, None if valid
         """
         if not data:
-            return jsonify({
-                'error': 'Request body is required',
-                'code': 'MISSING_BODY'
-            }), 400
+            return _upload_error('MISSING_BODY')
 
-        if 'suspect_image' not in data:
-            return jsonify({
-                'error': 'Missing required field: suspect_image',
-                'code': 'MISSING_FIELD'
-            }), 400
+        image = data.get('image') if isinstance(data, dict) else None
+        if image is None:
+            return _upload_error('MISSING_FIELD')
 
-        if not data['suspect_image'] or not isinstance(data['suspect_image'], str):
-            return jsonify({
-                'error': 'suspect_image must be a non-empty base64 string',
-                'code': 'INVALID_IMAGE_DATA'
-            }), 400
+        if not image or not isinstance(image, str):
+            return _upload_error('INVALID_IMAGE_DATA')
 
-        # Validate sideinfo_json if provided
-        if 'sideinfo_json' in data and data['sideinfo_json'] is not None:
-            if not isinstance(data['sideinfo_json'], dict):
-                return jsonify({
-                    'error': 'sideinfo_json must be a JSON object',
-                    'code': 'INVALID_SIDEINFO_FORMAT'
-                }), 400
-            
-            sideinfo = data['sideinfo_json']
-            
-            # Validate required fields in sideinfo_json
-            required_fields = ['wm_params', 'host_S', 'watermark_ref']
-            for field in required_fields:
-                if field not in sideinfo:
-                    return jsonify({
-                        'error': f'Missing required field in sideinfo_json: {field}',
-                        'code': 'MISSING_SIDEINFO_FIELD'
-                    }), 400
-            
-            # Validate watermark_ref has either path or image_base64
-            watermark_ref = sideinfo['watermark_ref']
-            has_path = 'path' in watermark_ref and watermark_ref['path']
-            has_base64 = 'image_base64' in watermark_ref and watermark_ref['image_base64']
-            
-            if not has_path and not has_base64:
-                return jsonify({
-                    'error': 'watermark_ref must contain either "path" or "image_base64" field for the original watermark logo',
-                    'code': 'MISSING_WATERMARK_REFERENCE'
-                }), 400
-            
-            # Validate base64 format if provided
-            if has_base64:
-                try:
-                    base64.b64decode(watermark_ref['image_base64'], validate=True)
-                except Exception as e:
-                    return jsonify({
-                        'error': f'watermark_ref.image_base64 has invalid base64 format: {str(e)}',
-                        'code': 'INVALID_BASE64_FORMAT'
-                    }), 400
+        # Reject oversized images before decoding them
+        if len(image) > self.max_upload_base64_length:
+            return _upload_error('PAYLOAD_TOO_LARGE')
+
+        return None
+
+    def _validate_watermark_files(self):
+        """
+        Validate multipart watermark embedding request
+        
+        Returns:
+            tuple or None: Error response tuple if validation fails, None if valid
+        """
+        for field in ('original_image', 'watermark_image'):
+            if field not in request.files:
+                return error_response(MISSING_FILE_ERRORS[field])
+
+        # Validate alpha if provided
+        if 'alpha' in request.form:
+            try:
+                alpha = float(request.form['alpha'])
+            except ValueError:
+                alpha = None
+            if alpha is None or alpha <= 0 or alpha > 1:
+                return error_response(INVALID_ALPHA_ERROR)
 
         return None
 
+    def _validate_watermark_payload(self, data):
+        """
+        Validate watermark embedding request payload
+        
+        Args:
+            data: Request JSON data
+            
+        Returns:
+            tuple or None: Error response tuple if validation fails, None if valid
+        """
+        return check_fields(EMBED_RULES, data)
+
+    def _validate_extract_payload(self, data):
+        """
+        Validate watermark extraction request payload
+        
+        Args:
+            data: Request JSON data
+            
+        Returns:
+            tuple or None: Error response tuple if validation fails, None if valid
+        """
+        return check_extract_payload(data)
+
     def _validate_detect_payload(self, data):
         """
         Validate watermark detection request payload
@@ -538,6 +1071,15 @@ class ImageController:
         Returns:
             tuple or None: Error response tuple if validation fails, None if valid
         """
-        # No validation - accept all data
+        # Only the body itself is checked; the detect service handles the fields
+        if not data or not isinstance(data, dict):
+            return error_response(MISSING_BODY_ERROR)
         return None
 
+    # Batch operation name -> (validator, runner)
+    BATCH_OPERATIONS = {
+        'upload': (_validate_upload_payload, _run_batch_upload),
+        'embed': (_validate_watermark_payload, _run_batch_embed),
+        'extract': (_validate_extract_payload, _run_batch_extract),
+        'detect': (_validate_detect_payload, _run_batch_detect)
+    }
@@ -0,0 +1,31 @@
+# controller/responses.py
+from flask import Response
+from config.json_provider import dumps_bytes
+
+def success_body(data=None, message: str = None) -> bytes:
+    """
+    Serialize a {"success": true, "message": ..., "data": ...} envelope
+    
+    The framing is fixed, so only message and data go through the JSON encoder;
+    either is left out of the body when None.
+    
+    Args:
+        data: JSON-serializable payload
+        message: Human-readable status message
+        
+    Returns:
+        bytes: UTF-8 JSON body
+    """
+    body = bytearray(b'{"success":true')
+    if message is not None:
+        body += b',"message":'
+        body += dumps_bytes(message)
+    if data is not None:
+        body += b',"data":'
+        body += dumps_bytes(data)
+    body += b'}'
+    return bytes(body)
+
+def success_response(data=None, message: str = None, status_code: int = 200):
+    """Build a (Response, status_code) pair from success_body"""
+    return Response(success_body(data, message), status=status_code, mimetype='application/json'), status_code
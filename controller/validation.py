@@ -0,0 +1,121 @@
+# controller/validation.py
+from flask import jsonify
+from controller.errors import static_error, error_response
+from service.image_codec import validate_base64
+
+MISSING_BODY_ERROR = static_error('Request body is required', 'MISSING_BODY')
+
+def compile_rules(*rules):
+    """
+    Pre-serialize the error bodies of a payload's field rules
+    
+    Args:
+        *rules: (field, required, check, invalid_code, invalid_message) tuples
+        
+    Returns:
+        tuple: (field, required, check, missing_error, invalid_error) tuples for check_fields
+    """
+    return tuple(
+        (field, required, check,
+         static_error(f'Missing required field: {field}', 'MISSING_FIELD'),
+         static_error(message, code))
+        for field, required, check, code, message in rules
+    )
+
+_ABSENT = object()
+
+def check_fields(rules, data):
+    """
+    Validate a JSON payload against compiled field rules
+    
+    Args:
+        rules: Output of compile_rules
+        data: Request JSON data
+        
+    Returns:
+        tuple or None: Error response tuple for the first failing field, None if valid
+    """
+    if not data or not isinstance(data, dict):
+        return error_response(MISSING_BODY_ERROR)
+
+    for field, required, check, missing_error, invalid_error in rules:
+        value = data.get(field, _ABSENT)
+        if value is _ABSENT:
+            if required:
+                return error_response(missing_error)
+        elif not check(value):
+            return error_response(invalid_error)
+
+    return None
+
+def _is_image_data(value) -> bool:
+    return bool(value) and isinstance(value, str)
+
+def _is_alpha(value) -> bool:
+    return isinstance(value, (int, float)) and 0 < value <= 1
+
+def _is_optional_object(value) -> bool:
+    return value is None or isinstance(value, dict)
+
+# Watermark JSON payload rules, shared by the image and direct API endpoints
+EMBED_RULES = compile_rules(
+    ('original_image', True, _is_image_data, 'INVALID_IMAGE_DATA', 'original_image must be a non-empty base64 string'),
+    ('watermark_image', True, _is_image_data, 'INVALID_IMAGE_DATA', 'watermark_image must be a non-empty base64 string'),
+    ('alpha', False, _is_alpha, 'INVALID_ALPHA', 'alpha must be a number between 0 and 1'),
+)
+EXTRACT_RULES = compile_rules(
+    ('suspect_image', True, _is_image_data, 'INVALID_IMAGE_DATA', 'suspect_image must be a non-empty base64 string'),
+    ('sideinfo_json', False, _is_optional_object, 'INVALID_SIDEINFO_FORMAT', 'sideinfo_json must be a JSON object'),
+)
+
+SIDEINFO_REQUIRED_FIELDS = ('wm_params', 'host_S', 'watermark_ref')
+MISSING_SIDEINFO_ERRORS = {
+    field: static_error(f'Missing required field in sideinfo_json: {field}', 'MISSING_SIDEINFO_FIELD')
+    for field in SIDEINFO_REQUIRED_FIELDS
+}
+MISSING_WATERMARK_REFERENCE_ERROR = static_error(
+    'watermark_ref must contain either "path" or "image_base64" field for the original watermark logo',
+    'MISSING_WATERMARK_REFERENCE'
+)
+
+def check_extract_payload(data):
+    """
+    Validate a watermark extraction payload, including its optional sideinfo_json
+    
+    Args:
+        data: Request JSON data
+        
+    Returns:
+        tuple or None: Error response tuple if validation fails, None if valid
+    """
+    validation_error = check_fields(EXTRACT_RULES, data)
+    if validation_error:
+        return validation_error
+
+    # Validate sideinfo_json contents if provided
+    sideinfo = data.get('sideinfo_json')
+    if sideinfo is not None:
+        # Validate required fields in sideinfo_json
+        for field in SIDEINFO_REQUIRED_FIELDS:
+            if field not in sideinfo:
+                return error_response(MISSING_SIDEINFO_ERRORS[field])
+        
+        # Validate watermark_ref has either path or image_base64
+        watermark_ref = sideinfo['watermark_ref']
+        has_path = 'path' in watermark_ref and watermark_ref['path']
+        has_base64 = 'image_base64' in watermark_ref and watermark_ref['image_base64']
+        
+        if not has_path and not has_base64:
+            return error_response(MISSING_WATERMARK_REFERENCE_ERROR)
+        
+        # Validate base64 format if provided
+        if has_base64:
+            try:
+                validate_base64(watermark_ref['image_base64'])
+            except Exception as e:
+                return jsonify({
+                    'error': f'watermark_ref.image_base64 has invalid base64 format: {str(e)}',
+                    'code': 'INVALID_BASE64_FORMAT'
+                }), 400
+
+    return None
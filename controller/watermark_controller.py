@@ -1,10 +1,49 @@
 # controller/watermark_controller.py
-from flask import request, jsonify
+import hashlib
+import os
+from flask import request, jsonify, Response, stream_with_context
 from service.watermark_service import WatermarkService
+from config.json_provider import dumps_bytes
+from controller.errors import static_error, error_response
+from controller.responses import success_body, success_response
+from controller.validation import compile_rules, check_fields
+
+# Constant error bodies, serialized once
+MISSING_WATERMARKS_ERROR = static_error('watermarks must be a non-empty list', 'MISSING_FIELD')
+MISSING_QUERY_ERROR = static_error('Search query parameter "q" is required', 'MISSING_QUERY')
+INVALID_PAGINATION_ERROR = static_error('limit and offset must be non-negative integers', 'INVALID_PAGINATION')
+INVALID_JSON_ERROR = static_error('Request body must be valid JSON', 'INVALID_JSON')
+MISSING_UPDATE_FIELDS_ERROR = static_error('At least one field (store_name or watermark_url_image) must be provided', 'MISSING_FIELDS')
+
+def _is_nonempty_string(value) -> bool:
+    return bool(value) and isinstance(value, str)
+
+def _is_optional_nonblank_string(value) -> bool:
+    return value is None or (isinstance(value, str) and bool(value.strip()))
+
+# JSON payload rules, checked in one pass by check_fields
+CREATE_RULES = compile_rules(
+    ('store_name', True, _is_nonempty_string, 'INVALID_STORE_NAME', 'store_name must be a non-empty string'),
+    ('watermark_url_image', True, _is_nonempty_string, 'INVALID_IMAGE_URL', 'watermark_url_image must be a non-empty string'),
+)
+UPDATE_RULES = compile_rules(
+    ('store_name', False, _is_optional_nonblank_string, 'INVALID_STORE_NAME', 'store_name must be a non-empty string'),
+    ('watermark_url_image', False, _is_optional_nonblank_string, 'INVALID_IMAGE_URL', 'watermark_url_image must be a non-empty string'),
+)
+
+# Listing formats, in order of preference when the client accepts either
+STREAM_MIMETYPES = ['application/json', 'application/x-ndjson']
 
 class WatermarkController:
     def __init__(self):
         self.watermark_service = WatermarkService()
+        self.max_bulk_size = int(os.getenv('MAX_BULK_WATERMARKS', 100))
+        # Bytes of serialized rows buffered per write when streaming the listing
+        self.stream_chunk_size = int(os.getenv('WATERMARK_STREAM_CHUNK_SIZE', 64 * 1024))
+        # Largest page a listing or search may request; search defaults to this cap
+        self.max_page_size = int(os.getenv('WATERMARK_MAX_PAGE_SIZE', 200))
+        # Seconds clients may reuse a watermark GET before revalidating with its ETag
+        self.watermark_max_age = int(os.getenv('WATERMARK_MAX_AGE', 60))
 
     def create_watermark(self):
         """
@@ -20,15 +59,10 @@ class WatermarkController:
             tuple: (response_data, status_code)
         """
         try:
-            # Validate request content type
-            if not request.is_json:
-                return jsonify({
-                    'error': 'Content-Type must be application/json',
-                    'code': 'INVALID_CONTENT_TYPE'
-                }), 400
-
-            # Get request data
-            data = request.get_json()
+            # Parse the body once (Flask caches it on the request); malformed JSON is a 400, not a 500
+            data = request.get_json(silent=True)
+            if data is None:
+                return error_response(INVALID_JSON_ERROR)
             
             # Validate payload structure
             validation_error = self._validate_create_watermark_payload(data)
@@ -45,11 +79,63 @@ class WatermarkController:
                 watermark_url_image=watermark_url_image
             )
             
+            return success_response(watermark.to_dict(), 'Watermark created successfully', 201)
+
+        except ValueError as e:
+            return jsonify({
+                'error': str(e),
+                'code': 'VALIDATION_ERROR'
+            }), 400
+
+        except Exception as e:
             return jsonify({
-                'success': True,
-                'message': 'Watermark created successfully',
-                'data': watermark.to_dict()
-            }), 201
+                'error': str(e),
+                'code': 'WATERMARK_CREATE_ERROR'
+            }), 500
+
+    def create_watermarks_bulk(self):
+        """
+        Handle bulk watermark creation request
+        
+        Expected JSON payload:
+        {
+            "watermarks": [
+                {"store_name": "Store Name", "watermark_url_image": "URL or path"},
+                ...
+            ]
+        }
+        
+        Returns:
+            tuple: (response_data, status_code)
+        """
+        try:
+            # Parse the body once (Flask caches it on the request); malformed JSON is a 400, not a 500
+            data = request.get_json(silent=True)
+            if data is None:
+                return error_response(INVALID_JSON_ERROR)
+            
+            # Validate payload structure
+            if not data or not isinstance(data.get('watermarks'), list) or not data['watermarks']:
+                return error_response(MISSING_WATERMARKS_ERROR)
+
+            if len(data['watermarks']) > self.max_bulk_size:
+                return jsonify({
+                    'error': f'At most {self.max_bulk_size} watermarks can be created per request',
+                    'code': 'BULK_TOO_LARGE'
+                }), 400
+
+            for item in data['watermarks']:
+                validation_error = self._validate_create_watermark_payload(item if isinstance(item, dict) else None)
+                if validation_error:
+                    return validation_error
+
+            # Insert every watermark in one transaction through service
+            watermarks = self.watermark_service.create_watermarks(data['watermarks'])
+            
+            return success_response({
+                'watermarks': [w.to_dict() for w in watermarks],
+                'count': len(watermarks)
+            }, f'{len(watermarks)} watermarks created successfully', 201)
 
         except ValueError as e:
             return jsonify({
@@ -78,10 +164,11 @@ class WatermarkController:
             watermark = self.watermark_service.get_watermark_by_id(watermark_id)
             
             if watermark:
-                return jsonify({
-                    'success': True,
-                    'data': watermark.to_dict()
-                }), 200
+                body = success_body(watermark.to_dict())
+                # Strong ETag over the exact body; If-None-Match hits get an empty 304
+                response = self._cacheable(Response(body, status=200, mimetype='application/json'),
+                                           hashlib.blake2b(body, digest_size=8).hexdigest())
+                return response, response.status_code
             else:
                 return jsonify({
                     'error': f'Watermark with ID {watermark_id} not found',
@@ -94,6 +181,15 @@ class WatermarkController:
                 'code': 'WATERMARK_RETRIEVAL_ERROR'
             }), 500
 
+    def _cacheable(self, response: Response, etag: str, weak: bool = False, vary: str = None) -> Response:
+        """Tag a response for revalidation and answer 304 if the client already has it"""
+        response.set_etag(etag, weak=weak)
+        if vary:
+            response.vary.add(vary)
+        response.cache_control.max_age = self.watermark_max_age
+        response.cache_control.private = True
+        return response.make_conditional(request)
+
     def get_watermark_by_store_name(self, store_name: str):
         """
         Handle get watermark by store name request
@@ -109,10 +205,7 @@ class WatermarkController:
             watermark = self.watermark_service.get_watermark_by_store_name(store_name)
             
             if watermark:
-                return jsonify({
-                    'success': True,
-                    'data': watermark.to_dict()
-                }), 200
+                return success_response(watermark.to_dict())
             else:
                 return jsonify({
                     'error': f'Watermark for store "{store_name}" not found',
@@ -129,20 +222,78 @@ class WatermarkController:
         """
         Handle get all watermarks request
         
+        Watermarks are streamed from the database cursor, so memory use does not
+        grow with the table size. Clients that send Accept: application/x-ndjson
+        get one watermark object per line instead of the JSON envelope.
+        
+        Query parameters: limit, offset (optional; without limit every watermark is streamed)
+        
         Returns:
-            tuple: (response_data, status_code)
+            Response: streamed JSON {"success": true, "data": {"watermarks": [...], "count": N}}
+                or NDJSON rows
         """
         try:
-            # Get all watermarks through service
-            watermarks = self.watermark_service.get_all_watermarks()
+            page = self._pagination_args(default_limit=None)
+            if page is None:
+                return error_response(INVALID_PAGINATION_ERROR)
+            limit, offset = page
+
+            ndjson = request.accept_mimetypes.best_match(STREAM_MIMETYPES) == 'application/x-ndjson'
+
+            # Revalidate against the table's version before reading (or streaming) any rows
+            version = self.watermark_service.get_watermarks_version()
+            etag = hashlib.blake2b(f"{version}:{ndjson}:{limit}:{offset}".encode(), digest_size=8).hexdigest()
+            if request.if_none_match.contains_weak(etag):
+                response = self._cacheable(Response(status=200), etag, weak=True, vary='Accept')
+                return response, response.status_code
+
+            # Get all watermarks through service as row dicts (no Watermark objects per row)
+            watermarks = self.watermark_service.iter_all_watermark_dicts(limit, offset)
             
-            return jsonify({
-                'success': True,
-                'data': {
-                    'watermarks': [w.to_dict() for w in watermarks],
-                    'count': len(watermarks)
-                }
-            }), 200
+            # Fetch the first row now so database errors still produce a 500
+            first = next(watermarks, None)
+            chunk_size = self.stream_chunk_size
+
+            if ndjson:
+                def generate_ndjson():
+                    if first is None:
+                        return
+                    buffer = bytearray(dumps_bytes(first))
+                    buffer += b'\n'
+                    for watermark in watermarks:
+                        if len(buffer) >= chunk_size:
+                            yield bytes(buffer)
+                            buffer.clear()
+                        buffer += dumps_bytes(watermark)
+                        buffer += b'\n'
+                    yield bytes(buffer)
+
+                return self._cacheable(
+                    Response(stream_with_context(generate_ndjson()), status=200, mimetype='application/x-ndjson'),
+                    etag, weak=True, vary='Accept'
+                )
+
+            def generate():
+                # Rows are batched into chunk_size writes rather than one socket write each
+                count = 0
+                buffer = bytearray(b'{"success": true, "data": {"watermarks": [')
+                if first is not None:
+                    buffer += dumps_bytes(first)
+                    count = 1
+                    for watermark in watermarks:
+                        if len(buffer) >= chunk_size:
+                            yield bytes(buffer)
+                            buffer.clear()
+                        buffer += b','
+                        buffer += dumps_bytes(watermark)
+                        count += 1
+                buffer += b'], "count": %d}}' % count
+                yield bytes(buffer)
+
+            return self._cacheable(
+                Response(stream_with_context(generate()), status=200, mimetype='application/json'),
+                etag, weak=True, vary='Accept'
+            )
 
         except Exception as e:
             return jsonify({
@@ -167,15 +318,10 @@ class WatermarkController:
             tuple: (response_data, status_code)
         """
         try:
-            # Validate request content type
-            if not request.is_json:
-                return jsonify({
-                    'error': 'Content-Type must be application/json',
-                    'code': 'INVALID_CONTENT_TYPE'
-                }), 400
-
-            # Get request data
-            data = request.get_json()
+            # Parse the body once (Flask caches it on the request); malformed JSON is a 400, not a 500
+            data = request.get_json(silent=True)
+            if data is None:
+                return error_response(INVALID_JSON_ERROR)
             
             # Validate payload structure
             validation_error = self._validate_update_watermark_payload(data)
@@ -194,11 +340,7 @@ class WatermarkController:
             )
             
             if watermark:
-                return jsonify({
-                    'success': True,
-                    'message': 'Watermark updated successfully',
-                    'data': watermark.to_dict()
-                }), 200
+                return success_response(watermark.to_dict(), 'Watermark updated successfully')
             else:
                 return jsonify({
                     'error': f'Watermark with ID {watermark_id} not found',
@@ -232,10 +374,7 @@ class WatermarkController:
             success = self.watermark_service.delete_watermark(watermark_id)
             
             if success:
-                return jsonify({
-                    'success': True,
-                    'message': f'Watermark with ID {watermark_id} deleted successfully'
-                }), 200
+                return success_response(message=f'Watermark with ID {watermark_id} deleted successfully')
             else:
                 return jsonify({
                     'error': f'Watermark with ID {watermark_id} not found',
@@ -252,7 +391,8 @@ class WatermarkController:
         """
         Handle watermark search request
         
-        Query parameter: q (search query)
+        Query parameters: q (search query), limit (default and maximum
+        WATERMARK_MAX_PAGE_SIZE), offset
         
         Returns:
             tuple: (response_data, status_code)
@@ -262,22 +402,26 @@ class WatermarkController:
             query = request.args.get('q', '')
             
             if not query:
-                return jsonify({
-                    'error': 'Search query parameter "q" is required',
-                    'code': 'MISSING_QUERY'
-                }), 400
-
-            # Search watermarks through service
-            watermarks = self.watermark_service.search_watermarks(query)
+                return error_response(MISSING_QUERY_ERROR)
+
+            page = self._pagination_args(default_limit=self.max_page_size)
+            if page is None:
+                return error_response(INVALID_PAGINATION_ERROR)
+            limit, offset = page
+
+            # Search watermarks through service as row dicts (no Watermark objects per row);
+            # one extra row tells whether another page exists without a COUNT(*)
+            watermarks = self.watermark_service.search_watermark_dicts(query, limit + 1, offset)
+            has_more = len(watermarks) > limit
+            if has_more:
+                watermarks.pop()
             
-            return jsonify({
-                'success': True,
-                'data': {
-                    'query': query,
-                    'watermarks': [w.to_dict() for w in watermarks],
-                    'count': len(watermarks)
-                }
-            }), 200
+            return success_response({
+                'query': query,
+                'watermarks': watermarks,
+                'count': len(watermarks),
+                'has_more': has_more
+            })
 
         except Exception as e:
             return jsonify({
@@ -285,6 +429,28 @@ class WatermarkController:
                 'code': 'WATERMARK_SEARCH_ERROR'
             }), 500
 
+    def _pagination_args(self, default_limit):
+        """
+        Read ?limit= and ?offset=, capping limit at max_page_size
+        
+        Args:
+            default_limit: Limit when the parameter is absent (None for no limit)
+            
+        Returns:
+            tuple or None: (limit, offset), None if either is not a non-negative integer
+        """
+        try:
+            limit = request.args.get('limit')
+            limit = default_limit if limit is None else int(limit)
+            offset = int(request.args.get('offset', 0))
+        except (TypeError, ValueError):
+            return None
+        if (limit is not None and limit < 0) or offset < 0:
+            return None
+        if limit is not None:
+            limit = min(limit, self.max_page_size)
+        return limit, offset
+
     def _validate_create_watermark_payload(self, data):
         """
         Validate watermark creation request payload
@@ -295,37 +461,7 @@ class WatermarkController:
         Returns:
             tuple or None: Error response tuple if validation fails, None if valid
         """
-        if not data:
-            return jsonify({
-                'error': 'Request body is required',
-                'code': 'MISSING_BODY'
-            }), 400
-
-        if 'store_name' not in data:
-            return jsonify({
-                'error': 'Missing required field: store_name',
-                'code': 'MISSING_FIELD'
-            }), 400
-
-        if 'watermark_url_image' not in data:
-            return jsonify({
-                'error': 'Missing required field: watermark_url_image',
-                'code': 'MISSING_FIELD'
-            }), 400
-
-        if not data['store_name'] or not isinstance(data['store_name'], str):
-            return jsonify({
-                'error': 'store_name must be a non-empty string',
-                'code': 'INVALID_STORE_NAME'
-            }), 400
-
-        if not data['watermark_url_image'] or not isinstance(data['watermark_url_image'], str):
-            return jsonify({
-                'error': 'watermark_url_image must be a non-empty string',
-                'code': 'INVALID_IMAGE_URL'
-            }), 400
-
-        return None
+        return check_fields(CREATE_RULES, data)
 
     def _validate_update_watermark_payload(self, data):
         """
@@ -337,33 +473,12 @@ class WatermarkController:
         Returns:
             tuple or None: Error response tuple if validation fails, None if valid
         """
-        if not data:
-            return jsonify({
-                'error': 'Request body is required',
-                'code': 'MISSING_BODY'
-            }), 400
+        validation_error = check_fields(UPDATE_RULES, data)
+        if validation_error:
+            return validation_error
 
         # At least one field must be provided
         if 'store_name' not in data and 'watermark_url_image' not in data:
-            return jsonify({
-                'error': 'At least one field (store_name or watermark_url_image) must be provided',
-                'code': 'MISSING_FIELDS'
-            }), 400
-
-        # Validate store_name if provided
-        if 'store_name' in data and data['store_name'] is not None:
-            if not isinstance(data['store_name'], str) or not data['store_name'].strip():
-                return jsonify({
-                    'error': 'store_name must be a non-empty string',
-                    'code': 'INVALID_STORE_NAME'
-                }), 400
-
-        # Validate watermark_url_image if provided
-        if 'watermark_url_image' in data and data['watermark_url_image'] is not None:
-            if not isinstance(data['watermark_url_image'], str) or not data['watermark_url_image'].strip():
-                return jsonify({
-                    'error': 'watermark_url_image must be a non-empty string',
-                    'code': 'INVALID_IMAGE_URL'
-                }), 400
+            return error_response(MISSING_UPDATE_FIELDS_ERROR)
 
         return None
@@ -14,6 +14,10 @@ CREATE TABLE IF NOT EXISTS watermarks (
 CREATE INDEX IF NOT EXISTS idx_watermarks_store_name ON watermarks(store_name);
 CREATE INDEX IF NOT EXISTS idx_watermarks_created_at ON watermarks(created_at);
 
+-- PostgreSQL only: trigram index for case-insensitive substring search (store_name ILIKE '%q%')
+-- CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- CREATE INDEX IF NOT EXISTS idx_watermarks_store_name_trgm ON watermarks USING gin (store_name gin_trgm_ops);
+
 -- SQLite Schema (alternative)
 -- CREATE TABLE IF NOT EXISTS watermarks (
 --     watermark_id INTEGER PRIMARY KEY AUTOINCREMENT,
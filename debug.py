@@ -1,51 +1,52 @@
 # debug.py
+import importlib
 import sys
+import time
 import traceback
 
-print("Python version:", sys.version)
-print("Python path:", sys.path)
-
-try:
-    print("Testing imports...")
-    
-    print("1. Testing Flask import...")
-    from flask import Flask
-    print("   ✓ Flask imported successfully")
-    
-    print("2. Testing Cloudinary import...")
-    import cloudinary
-    print("   ✓ Cloudinary imported successfully")
-    
-    print("3. Testing PIL import...")
-    from PIL import Image
-    print("   ✓ PIL imported successfully")
-    
-    print("4. Testing service import...")
-    from service.image_service import ImageService
-    print("   ✓ ImageService imported successfully")
-    
-    print("5. Testing controller import...")
-    from controller.image_controller import ImageController
-    print("   ✓ ImageController imported successfully")
-    
-    print("6. Testing routes import...")
-    from routes.image_routes import image_bp
-    print("   ✓ Routes imported successfully")
-    
-    print("7. Testing app creation...")
-    from app import app
-    print("   ✓ App created successfully")
-    
-    print("8. Testing app context...")
-    with app.app_context():
-        print("   ✓ App context works")
-    
-    print("\n✅ All imports successful! The app should work.")
-    
-except Exception as e:
-    print(f"\n❌ Error: {e}")
-    print("\nFull traceback:")
-    traceback.print_exc()
-    
-    print(f"\nError type: {type(e)}")
-    print(f"Error args: {e.args}")
\ No newline at end of file
+# (label, module, attribute) checked in order; attribute None means the module itself
+IMPORT_CHECKS = [
+    ("Flask", "flask", "Flask"),
+    ("Cloudinary", "cloudinary", None),
+    ("PIL", "PIL.Image", None),
+    ("ImageService", "service.image_service", "ImageService"),
+    ("ImageController", "controller.image_controller", "ImageController"),
+    ("Routes", "routes.image_routes", "image_bp"),
+    ("App", "app", "app"),
+]
+
+def main():
+    """Import the app's dependencies one by one and report what fails and how long each takes"""
+    print("Python version:", sys.version)
+    print("Python path:", sys.path)
+
+    try:
+        print("Testing imports...")
+
+        app = None
+        for step, (label, module_name, attribute) in enumerate(IMPORT_CHECKS, start=1):
+            print(f"{step}. Testing {label} import...")
+            started = time.perf_counter()
+            module = importlib.import_module(module_name)
+            value = getattr(module, attribute) if attribute else module
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"   ✓ {label} imported successfully ({elapsed_ms:.0f} ms)")
+            if module_name == "app":
+                app = value
+
+        print(f"{len(IMPORT_CHECKS) + 1}. Testing app context...")
+        with app.app_context():
+            print("   ✓ App context works")
+
+        print("\n✅ All imports successful! The app should work.")
+
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        print("\nFull traceback:")
+        traceback.print_exc()
+
+        print(f"\nError type: {type(e)}")
+        print(f"Error args: {e.args}")
+
+if __name__ == '__main__':
+    main()
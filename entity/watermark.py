@@ -1,4 +1,8 @@
 class Watermark:
+    # Fixed attribute set: no per-instance __dict__, which matters when
+    # thousands of rows are materialized for a listing
+    __slots__ = ('watermark_id', 'store_name', 'watermark_url_image')
+
     def __init__(self, watermark_id: int, store_name: str, watermark_url_image: str):
         """
         Watermark entity class
@@ -14,11 +18,7 @@ class Watermark:
     
     def to_dict(self) -> dict:
         """Convert watermark object to dictionary"""
-        return {
-            'watermark_id': self.watermark_id,
-            'store_name': self.store_name,
-            'watermark_url_image': self.watermark_url_image
-        }
+        return {key: getattr(self, key) for key in self.__slots__}
     
     @classmethod
     def from_dict(cls, data: dict) -> 'Watermark':
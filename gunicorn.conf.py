@@ -1,21 +1,44 @@
 # gunicorn.conf.py
-import multiprocessing
 import os
 
+from config.concurrency import gunicorn_worker_count
+
 # Server socket
-bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
-backlog = 2048
+# Set GUNICORN_BIND=unix:/tmp/gunicorn.sock when running behind Nginx to skip TCP
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', 5000)}")
+# Pending-connection queue for bursts; the kernel caps it at net.core.somaxconn
+backlog = int(os.getenv('BACKLOG', 2048))
+# SO_REUSEPORT lets a new master bind the port while the old one drains
+# (zero-downtime restarts, or several masters sharing one port)
+reuse_port = os.getenv('REUSE_PORT', 'true').lower() == 'true'
 
 # Worker processes
-workers = int(os.getenv('WORKERS', 1))
-worker_class = 'sync'
+# gthread: NumPy/OpenCV and Cloudinary/requests release the GIL, so threads overlap
+# I/O and heavy compute without a full process image per request.
+# Set WORKER_CLASS=gevent for I/O-only deployments.
+# WEB_CONCURRENCY is the worker count convention used by Render/Heroku
+workers = gunicorn_worker_count()
+worker_class = os.getenv('WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    # Patch before preload_app imports the app, so Cloudinary's HTTP sockets
+    # (and the ssl/threading modules they use) yield instead of blocking
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        # psycopg2 is a C extension that monkey-patching can't reach; without this
+        # a slow query blocks every greenlet in the worker
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+threads = int(os.getenv('THREADS', 8))
 worker_connections = 1000
 timeout = 300  # 5 minutes timeout for image processing operations
 keepalive = 5
 
 # Restart workers after this many requests, to help prevent memory leaks
 max_requests = 1000
-max_requests_jitter = 100
+max_requests_jitter = 50
 
 # Logging
 accesslog = '-'
@@ -49,8 +72,35 @@ raw_env = [
     'PYTHONUNBUFFERED=1',
 ]
 
+# Image-processing modules imported once in the master (preload_app) so forked
+# workers share their pages copy-on-write instead of each importing them lazily
+preload_modules = [
+    'numpy',
+    'cv2',
+    'pywt',
+    'skimage.metrics',
+    'service.wavelets',
+    'service.embeded_service',
+    'service.extract_service',
+    'service.stat_detect',
+]
+
 # Preload application for better performance
 def when_ready(server):
+    import importlib
+    for module_name in preload_modules:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            server.log.warning("Could not preload %s: %s", module_name, e)
+
+    # Create tables once in the master instead of racing in every worker
+    if os.getenv('RUN_MIGRATIONS'):
+        from config.database_manager import DatabaseManager, close_pools
+        DatabaseManager().create_tables()
+        # psycopg2 connections are not fork-safe; don't let workers inherit them
+        close_pools()
+        server.log.info("Database tables created/verified")
     server.log.info("Watermark service is ready to accept connections")
 
 def worker_int(worker):
@@ -62,5 +112,13 @@ def pre_fork(server, worker):
 def post_fork(server, worker):
     server.log.info("Worker spawned (pid: %s)", worker.pid)
 
+def post_worker_init(worker):
+    # Prime the preloaded NumPy/OpenCV/PyWavelets kernels so the first request doesn't pay for it
+    try:
+        from service.job_service import warm_up_kernels
+        warm_up_kernels()
+    except ImportError as e:
+        worker.log.warning("Could not warm up image kernels: %s", e)
+
 def worker_abort(worker):
     worker.log.info("Worker received SIGABRT signal")
@@ -0,0 +1,24 @@
+# routes/__init__.py
+import importlib
+
+# Blueprint name -> defining module, imported on first attribute access
+_lazy_imports = {
+    'image_bp': 'routes.image_routes',
+    'watermark_bp': 'routes.watermark_routes',
+    'direct_api_bp': 'routes.direct_api_routes'
+}
+
+# Blueprint name -> URL prefix (used by the app's fallback when an import fails)
+URL_PREFIXES = {
+    'image_bp': '/api/images',
+    'watermark_bp': '/api/watermarks',
+    'direct_api_bp': '/api/direct'
+}
+
+def __getattr__(name):
+    """Import a blueprint's module only when that blueprint is first accessed"""
+    if name in _lazy_imports:
+        blueprint = getattr(importlib.import_module(_lazy_imports[name]), name)
+        globals()[name] = blueprint  # cache so __getattr__ isn't hit again
+        return blueprint
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,49 +1,90 @@
 # routes/direct_api_routes.py
-from flask import Blueprint, request, jsonify
-from service.embeded_service import EmbeddedService
-from service.extract_service import ExtractService
-from service.stat_detect import StatDetectService
-import base64
+from flask import Blueprint, Response, request, jsonify
+import os
 import threading
 import time
 from functools import wraps
+from werkzeug.exceptions import HTTPException
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 # Create blueprint for direct API calls
 direct_api_bp = Blueprint('direct_api', __name__, url_prefix='/api/direct')
 
-# Initialize services directly
-embedded_service = EmbeddedService()
-extract_service = ExtractService()
-detect_service = StatDetectService()
+# Watermark operations run on the job service's process pool (shared with the
+# image blueprint and created on first use, so NumPy/OpenCV/PyWavelets load lazily)
+from service import get_job_service
+from controller.errors import static_body, static_error, error_response
+from controller.responses import success_response
+from config.json_provider import dumps_bytes
+from controller.validation import EMBED_RULES, check_fields, check_extract_payload
+
+# Constant error bodies, serialized once
+INVALID_CONTENT_TYPE_ERROR = static_error('Content-Type must be application/json', 'INVALID_CONTENT_TYPE')
+INVALID_JSON_ERROR = static_error('Request body must be valid JSON', 'INVALID_JSON')
+MISSING_DETECT_FIELDS_ERROR = static_error(
+    'Both original_watermark and extracted_watermark are required', 'MISSING_FIELD'
+)
+
+def _json_body():
+    """
+    Parse the request's JSON body once
+
+    Returns:
+        tuple: (data, None) on success, (None, error_response) if the body is not JSON
+    """
+    if not request.is_json:
+        return None, error_response(INVALID_CONTENT_TYPE_ERROR)
+    data = request.get_json(silent=True)
+    if data is None:
+        return None, error_response(INVALID_JSON_ERROR)
+    return data, None
+
+# Shared pool waiting on direct API operations under a timeout. A per-call
+# `with ThreadPoolExecutor()` joins its thread on exit, so a timed-out request
+# used to hold its Gunicorn thread until the pipeline finished anyway. The CPU
+# work itself runs on the job service's process pool (WM_WORKERS).
+_operation_pool = None
+_operation_pool_lock = threading.Lock()
+
+def _get_operation_pool() -> ThreadPoolExecutor:
+    """Create the per-process operation pool on first use (after Gunicorn has forked)"""
+    global _operation_pool
+    with _operation_pool_lock:
+        if _operation_pool is None:
+            _operation_pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv('DIRECT_API_THREADS', 8)),
+                thread_name_prefix='direct-api'
+            )
+        return _operation_pool
 
 # Thread-safe timeout decorator for long-running operations
 def with_timeout(timeout_seconds=240):
-    """Decorator to add timeout to functions using ThreadPoolExecutor"""
+    """Decorator to add timeout to functions using the shared operation pool"""
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Use ThreadPoolExecutor for timeout functionality
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                try:
-                    # Submit the function to the executor
-                    future = executor.submit(func, *args, **kwargs)
-                    # Wait for result with timeout
-                    result = future.result(timeout=timeout_seconds)
-                    return result
-                except FuturesTimeoutError:
-                    return {
-                        'error': f'Operation timed out after {timeout_seconds} seconds',
-                        'code': 'OPERATION_TIMEOUT',
-                        'message': 'Image processing is taking longer than expected. Please try with a smaller image.'
-                    }
-                except Exception as e:
-                    # Handle any other exceptions that might occur
-                    return {
-                        'error': f'Error during operation: {str(e)}',
-                        'code': 'OPERATION_ERROR',
-                        'message': 'An error occurred during image processing.'
-                    }
+            future = None
+            try:
+                # Submit the function to the shared pool and wait with a timeout;
+                # on timeout the request returns at once
+                future = _get_operation_pool().submit(func, *args, **kwargs)
+                return future.result(timeout=timeout_seconds)
+            except FuturesTimeoutError:
+                # The wait includes time queued behind busy pool threads; drop the work if
+                # it never started (an operation already running finishes in the pool)
+                future.cancel()
+                return {
+                    'error': f'Operation timed out after {timeout_seconds} seconds',
+                    'code': 'OPERATION_TIMEOUT',
+                    'message': 'Image processing is taking longer than expected. Please try with a smaller image.'
+                }
+            except Exception as e:
+                # Handle any other exceptions that might occur
+                return {
+                    'error': f'Error during operation: {str(e)}',
+                    'code': 'OPERATION_ERROR',
+                    'message': 'An error occurred during image processing.'
+                }
         return wrapper
     return decorator
 
@@ -64,63 +105,25 @@ def direct_embed_watermark():
         JSON response with watermarked image and metadata
     """
     try:
-        # Validate request content type
-        if not request.is_json:
-            return jsonify({
-                'error': 'Content-Type must be application/json',
-                'code': 'INVALID_CONTENT_TYPE'
-            }), 400
+        # Parse the body once; malformed JSON is a 400, not a 500
+        data, error = _json_body()
+        if error:
+            return error
 
-        # Get request data
-        data = request.get_json()
-        
         # Validate payload structure
-        if not data:
-            return jsonify({
-                'error': 'Request body is required',
-                'code': 'MISSING_BODY'
-            }), 400
-
-        if 'original_image' not in data:
-            return jsonify({
-                'error': 'Missing required field: original_image',
-                'code': 'MISSING_FIELD'
-            }), 400
-
-        if 'watermark_image' not in data:
-            return jsonify({
-                'error': 'Missing required field: watermark_image',
-                'code': 'MISSING_FIELD'
-            }), 400
-
-        if not data['original_image'] or not isinstance(data['original_image'], str):
-            return jsonify({
-                'error': 'original_image must be a non-empty base64 string',
-                'code': 'INVALID_IMAGE_DATA'
-            }), 400
-
-        if not data['watermark_image'] or not isinstance(data['watermark_image'], str):
-            return jsonify({
-                'error': 'watermark_image must be a non-empty base64 string',
-                'code': 'INVALID_IMAGE_DATA'
-            }), 400
-
-        # Validate alpha if provided
+        validation_error = check_fields(EMBED_RULES, data)
+        if validation_error:
+            return validation_error
         alpha = data.get('alpha', 0.6)
-        if not isinstance(alpha, (int, float)) or alpha <= 0 or alpha > 1:
-            return jsonify({
-                'error': 'alpha must be a number between 0 and 1',
-                'code': 'INVALID_ALPHA'
-            }), 400
 
         # Call service directly with timeout protection
         @with_timeout(240)  # 4 minutes timeout
         def embed_watermark():
-            return embedded_service.embed_watermark_from_base64(
-                data['original_image'], 
-                data['watermark_image'], 
-                alpha
-            )
+            return get_job_service().run('embed', {
+                'original_image': data['original_image'],
+                'watermark_image': data['watermark_image'],
+                'alpha': alpha
+            })
         
         result = embed_watermark()
         
@@ -131,18 +134,19 @@ def direct_embed_watermark():
             elif result.get('code') == 'OPERATION_ERROR':
                 return jsonify(result), 500
         
-        return jsonify({
-            'success': True,
-            'message': 'Watermark embedded successfully',
-            'data': {
-                'watermarked_image': result['watermarked_image_b64'],
-                'unique_id': result['unique_id'],
-                'image_size': result['image_size'],
-                'metadata': result['metadata'],
-                'output_path': result['output_path'],
-                'metadata_path': result['metadata_path']
-            }
-        }), 200
+        # The body carries a multi-MB base64 image; serialize it straight to bytes
+        return success_response({
+            'watermarked_image': result['watermarked_image_b64'],
+            'unique_id': result['unique_id'],
+            'image_size': result['image_size'],
+            'metadata': result['metadata'],
+            'output_path': result['output_path'],
+            'metadata_path': result['metadata_path']
+        }, 'Watermark embedded successfully')
+
+    except HTTPException:
+        # e.g. 413 from reading an oversized body; answered by the app's error handlers
+        raise
 
     except ValueError as e:
         return jsonify({
@@ -180,81 +184,24 @@ def direct_extract_watermark():
         JSON response with extraction results
     """
     try:
-        # Validate request content type
-        if not request.is_json:
-            return jsonify({
-                'error': 'Content-Type must be application/json',
-                'code': 'INVALID_CONTENT_TYPE'
-            }), 400
+        # Parse the body once; malformed JSON is a 400, not a 500
+        data, error = _json_body()
+        if error:
+            return error
 
-        # Get request data
-        data = request.get_json()
-        
         # Validate payload structure
-        if not data:
-            return jsonify({
-                'error': 'Request body is required',
-                'code': 'MISSING_BODY'
-            }), 400
-
-        if 'suspect_image' not in data:
-            return jsonify({
-                'error': 'Missing required field: suspect_image',
-                'code': 'MISSING_FIELD'
-            }), 400
-
-        if not data['suspect_image'] or not isinstance(data['suspect_image'], str):
-            return jsonify({
-                'error': 'suspect_image must be a non-empty base64 string',
-                'code': 'INVALID_IMAGE_DATA'
-            }), 400
-
-        # Validate sideinfo_json if provided
+        validation_error = check_extract_payload(data)
+        if validation_error:
+            return validation_error
         sideinfo_json = data.get('sideinfo_json', None)
-        if sideinfo_json is not None:
-            if not isinstance(sideinfo_json, dict):
-                return jsonify({
-                    'error': 'sideinfo_json must be a JSON object',
-                    'code': 'INVALID_SIDEINFO_FORMAT'
-                }), 400
-            
-            # Validate required fields in sideinfo_json
-            required_fields = ['wm_params', 'host_S', 'watermark_ref']
-            for field in required_fields:
-                if field not in sideinfo_json:
-                    return jsonify({
-                        'error': f'Missing required field in sideinfo_json: {field}',
-                        'code': 'MISSING_SIDEINFO_FIELD'
-                    }), 400
-            
-            # Validate watermark_ref has either path or image_base64
-            watermark_ref = sideinfo_json['watermark_ref']
-            has_path = 'path' in watermark_ref and watermark_ref['path']
-            has_base64 = 'image_base64' in watermark_ref and watermark_ref['image_base64']
-            
-            if not has_path and not has_base64:
-                return jsonify({
-                    'error': 'watermark_ref must contain either "path" or "image_base64" field for the original watermark logo',
-                    'code': 'MISSING_WATERMARK_REFERENCE'
-                }), 400
-            
-            # Validate base64 format if provided
-            if has_base64:
-                try:
-                    base64.b64decode(watermark_ref['image_base64'], validate=True)
-                except Exception as e:
-                    return jsonify({
-                        'error': f'watermark_ref.image_base64 has invalid base64 format: {str(e)}',
-                        'code': 'INVALID_BASE64_FORMAT'
-                    }), 400
 
         # Call service directly with timeout protection
         @with_timeout(240)  # 4 minutes timeout
         def extract_watermark():
-            return extract_service.extract_watermark_from_base64_with_json(
-                data['suspect_image'], 
-                sideinfo_json
-            )
+            return get_job_service().run('extract', {
+                'suspect_image': data['suspect_image'],
+                'sideinfo_json': sideinfo_json
+            })
         
         result = extract_watermark()
         
@@ -267,7 +214,8 @@ def direct_extract_watermark():
         
         # Handle different extraction statuses
         if result["status"] == "ok_extracted":
-            return jsonify({
+            # Carries base64 images; serialize straight to bytes
+            return Response(dumps_bytes({
                 'success': True,
                 'message': 'Watermark extracted successfully',
                 'status': 'extracted',
@@ -281,7 +229,7 @@ def direct_extract_watermark():
                     'watermark_logo': result['watermark_logo'],
                     'extracted_path': result['extracted_path']
                 }
-            }), 200
+            }), status=200, mimetype='application/json'), 200
         
         elif result["status"] in ["skip_no_sideinfo", "skip_bad_meta"]:
             return jsonify({
@@ -300,6 +248,10 @@ def direct_extract_watermark():
                 'code': 'EXTRACTION_ERROR'
             }), 500
 
+    except HTTPException:
+        # e.g. 413 from reading an oversized body; answered by the app's error handlers
+        raise
+
     except ValueError as e:
         return jsonify({
             'error': str(e),
@@ -331,15 +283,12 @@ def direct_detect_watermark():
         JSON response with detection results and metrics
     """
     try:
-        # Validate request content type
-        if not request.is_json:
-            return jsonify({
-                'error': 'Content-Type must be application/json',
-                'code': 'INVALID_CONTENT_TYPE'
-            }), 400
-
-        # Get request data
-        data = request.get_json()
+        # Parse the body once; malformed JSON is a 400, not a 500
+        data, error = _json_body()
+        if error:
+            return error
+        if not isinstance(data, dict):
+            return error_response(MISSING_DETECT_FIELDS_ERROR)
         
         # Extract parameters
         original_watermark = data.get('original_watermark')
@@ -350,34 +299,31 @@ def direct_detect_watermark():
 
         # Basic validation
         if not original_watermark or not extracted_watermark:
-            return jsonify({
-                'error': 'Both original_watermark and extracted_watermark are required',
-                'code': 'MISSING_FIELD'
-            }), 400
+            return error_response(MISSING_DETECT_FIELDS_ERROR)
 
-        # Call service directly
-        result = detect_service.compare_watermarks_from_base64(
-            original_wm_b64=original_watermark,
-            extracted_wm_b64=extracted_watermark,
-            pcc_threshold=pcc_threshold,
-            save_record=save_record,
-            suspect_image_b64=suspect_image
-        )
+        # Run on the watermark process pool (suspect_image is not used for detection)
+        result = get_job_service().run('detect', {
+            'original_watermark': original_watermark,
+            'extracted_watermark': extracted_watermark,
+            'pcc_threshold': pcc_threshold,
+            'save_record': save_record,
+            'suspect_image': suspect_image
+        })
         
-        return jsonify({
-            'success': True,
-            'message': 'Watermark detection completed successfully',
-            'data': {
-                'detection_result': {
-                    'is_match': result['detection']['is_match'],
-                    'pcc_threshold': result['detection']['pcc_threshold'],
-                    'used_absolute_pcc': result['detection']['used_absolute_pcc']
-                },
-                'metrics': result['metrics'],
-                'comparison_results': result['comparison_results'],
-                'detection_record': result.get('detection_record', None)
-            }
-        }), 200
+        return success_response({
+            'detection_result': {
+                'is_match': result['detection']['is_match'],
+                'pcc_threshold': result['detection']['pcc_threshold'],
+                'used_absolute_pcc': result['detection']['used_absolute_pcc']
+            },
+            'metrics': result['metrics'],
+            'comparison_results': result['comparison_results'],
+            'detection_record': result.get('detection_record', None)
+        }, 'Watermark detection completed successfully')
+
+    except HTTPException:
+        # e.g. 413 from reading an oversized body; answered by the app's error handlers
+        raise
 
     except ValueError as e:
         return jsonify({
@@ -391,20 +337,22 @@ def direct_detect_watermark():
             'code': 'WATERMARK_DETECT_ERROR'
         }), 500
 
-# Health check for direct API
+# Health check for direct API (constant body, serialized once)
+DIRECT_HEALTH_BODY = static_body({
+    'status': 'healthy',
+    'service': 'direct_api_service',
+    'version': '1.0.0',
+    'endpoints': {
+        'embed': '/api/direct/embed',
+        'extract': '/api/direct/extract',
+        'detect': '/api/direct/detect'
+    }
+})
+
 @direct_api_bp.route('/health', methods=['GET'])
 def direct_health_check():
     """Direct health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'service': 'direct_api_service',
-        'version': '1.0.0',
-        'endpoints': {
-            'embed': '/api/direct/embed',
-            'extract': '/api/direct/extract',
-            'detect': '/api/direct/detect'
-        }
-    }), 200
+    return error_response(DIRECT_HEALTH_BODY)
 
 # Error handlers for the direct API blueprint
 @direct_api_bp.errorhandler(404)
@@ -1,49 +1,96 @@
 # routes/image_routes.py
-from flask import Blueprint
-from controller.image_controller import ImageController
+from functools import lru_cache
+from flask import Blueprint, request
+from controller.errors import static_error, error_response
 
 # Create blueprint
 image_bp = Blueprint('image', __name__, url_prefix='/api/images')
 
-# Initialize controller
-image_controller = ImageController()
+# Endpoints whose body must be JSON, and those that also take multipart file uploads
+JSON_ENDPOINTS = frozenset({
+    'image.extract_watermark', 'image.detect_watermark', 'image.detect_watermark_stream', 'image.batch_process'
+})
+JSON_OR_MULTIPART_ENDPOINTS = frozenset({'image.upload_image', 'image.embed_watermark'})
+
+# Content-type errors are constant, so serialize them once
+INVALID_JSON_CONTENT_TYPE_ERROR = static_error('Content-Type must be application/json', 'INVALID_CONTENT_TYPE')
+INVALID_UPLOAD_CONTENT_TYPE_ERROR = static_error(
+    'Content-Type must be application/json or multipart/form-data', 'INVALID_CONTENT_TYPE'
+)
+
+# Initialize controller on first request so NumPy/OpenCV/Cloudinary load lazily
+@lru_cache(maxsize=None)
+def get_image_controller():
+    """Return the shared ImageController, creating it on first use"""
+    from controller.image_controller import ImageController
+    return ImageController()
+
+# Reject unsupported Content-Types before the controller (or the body) is touched
+@image_bp.before_request
+def require_json():
+    if request.endpoint in JSON_ENDPOINTS:
+        if not request.is_json:
+            return error_response(INVALID_JSON_CONTENT_TYPE_ERROR)
+    elif request.endpoint in JSON_OR_MULTIPART_ENDPOINTS:
+        if not request.is_json and request.mimetype != 'multipart/form-data':
+            return error_response(INVALID_UPLOAD_CONTENT_TYPE_ERROR)
+    return None
 
 # Define routes
 @image_bp.route('/upload', methods=['POST'])
 def upload_image():
     """Upload base64 image endpoint"""
-    return image_controller.upload_image()
+    return get_image_controller().upload_image()
 
 @image_bp.route('/<path:public_id>/info', methods=['GET'])
 def get_image_info(public_id):
     """Get image info by public ID endpoint"""
-    return image_controller.get_image_info(public_id)
+    return get_image_controller().get_image_info(public_id)
 
 @image_bp.route('/<path:public_id>', methods=['DELETE'])
 def delete_image(public_id):
     """Delete image endpoint"""
-    return image_controller.delete_image(public_id)
+    return get_image_controller().delete_image(public_id)
 
 @image_bp.route('/embed-watermark', methods=['POST'])
 def embed_watermark():
     """Embed watermark into image endpoint"""
-    return image_controller.embed_watermark()
+    return get_image_controller().embed_watermark()
 
 @image_bp.route('/extract-watermark', methods=['POST'])
 def extract_watermark():
     """Extract watermark from suspect image endpoint"""
-    return image_controller.extract_watermark()
+    return get_image_controller().extract_watermark()
 
 @image_bp.route('/detect-watermark', methods=['POST'])
 def detect_watermark():
     """Detect/compare watermarks using statistical metrics endpoint"""
-    return image_controller.detect_watermark()
+    return get_image_controller().detect_watermark()
+
+@image_bp.route('/detect-watermark/stream', methods=['POST'])
+def detect_watermark_stream():
+    """Detect/compare watermarks, streaming progress as Server-Sent Events endpoint"""
+    return get_image_controller().detect_watermark_stream()
+
+@image_bp.route('/batch', methods=['POST'])
+def batch_process():
+    """Process multiple upload/embed/extract/detect items in one request endpoint"""
+    return get_image_controller().batch_process()
+
+@image_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a background embed/extract/detect job endpoint"""
+    return get_image_controller().get_job(job_id)
 
+@image_bp.route('/results/<kind>/<unique_id>.jpg', methods=['GET'])
+def get_result(kind, unique_id):
+    """Download a watermarked/extracted result image endpoint"""
+    return get_image_controller().get_result(kind, unique_id)
 
 @image_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return image_controller.health_check()
+    return get_image_controller().health_check()
 
 # Error handlers for the blueprint
 @image_bp.errorhandler(413)
@@ -1,48 +1,69 @@
 # routes/watermark_routes.py
-from flask import Blueprint
-from controller.watermark_controller import WatermarkController
+from functools import lru_cache
+from flask import Blueprint, request
+from controller.errors import static_error, error_response
 
 # Create blueprint
 watermark_bp = Blueprint('watermark', __name__, url_prefix='/api/watermarks')
 
-# Initialize controller
-watermark_controller = WatermarkController()
+# Every watermark write takes a JSON body
+JSON_METHODS = frozenset({'POST', 'PUT', 'PATCH'})
+INVALID_CONTENT_TYPE_ERROR = static_error('Content-Type must be application/json', 'INVALID_CONTENT_TYPE')
+
+# Initialize controller on first request so the database is not touched at startup
+@lru_cache(maxsize=None)
+def get_watermark_controller():
+    """Return the shared WatermarkController, creating it on first use"""
+    from controller.watermark_controller import WatermarkController
+    return WatermarkController()
+
+# Reject non-JSON writes before the controller (or the body) is touched
+@watermark_bp.before_request
+def require_json():
+    if request.method in JSON_METHODS and not request.is_json:
+        return error_response(INVALID_CONTENT_TYPE_ERROR)
+    return None
 
 # Define watermark CRUD routes
 @watermark_bp.route('/', methods=['POST'])
 def create_watermark():
     """Create a new watermark endpoint"""
-    return watermark_controller.create_watermark()
+    return get_watermark_controller().create_watermark()
+
+@watermark_bp.route('/bulk', methods=['POST'])
+def create_watermarks_bulk():
+    """Create several watermarks in one request endpoint"""
+    return get_watermark_controller().create_watermarks_bulk()
 
 @watermark_bp.route('/', methods=['GET'])
 def get_all_watermarks():
     """Get all watermarks endpoint"""
-    return watermark_controller.get_all_watermarks()
+    return get_watermark_controller().get_all_watermarks()
 
 @watermark_bp.route('/search', methods=['GET'])
 def search_watermarks():
     """Search watermarks by store name endpoint"""
-    return watermark_controller.search_watermarks()
+    return get_watermark_controller().search_watermarks()
 
 @watermark_bp.route('/<int:watermark_id>', methods=['GET'])
 def get_watermark(watermark_id):
     """Get watermark by ID endpoint"""
-    return watermark_controller.get_watermark(watermark_id)
+    return get_watermark_controller().get_watermark(watermark_id)
 
 @watermark_bp.route('/store/<store_name>', methods=['GET'])
 def get_watermark_by_store_name(store_name):
     """Get watermark by store name endpoint"""
-    return watermark_controller.get_watermark_by_store_name(store_name)
+    return get_watermark_controller().get_watermark_by_store_name(store_name)
 
 @watermark_bp.route('/<int:watermark_id>', methods=['PUT'])
 def update_watermark(watermark_id):
     """Update watermark by ID endpoint"""
-    return watermark_controller.update_watermark(watermark_id)
+    return get_watermark_controller().update_watermark(watermark_id)
 
 @watermark_bp.route('/<int:watermark_id>', methods=['DELETE'])
 def delete_watermark(watermark_id):
     """Delete watermark by ID endpoint"""
-    return watermark_controller.delete_watermark(watermark_id)
+    return get_watermark_controller().delete_watermark(watermark_id)
 
 # Error handlers for the watermark blueprint
 @watermark_bp.errorhandler(404)
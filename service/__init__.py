@@ -0,0 +1,35 @@
+# service/__init__.py
+from functools import lru_cache
+
+# Shared service instances, one per process. Each is created on first use so
+# NumPy/OpenCV/PyWavelets/Cloudinary only load when a route needs them.
+
+@lru_cache(maxsize=None)
+def get_image_service():
+    """Return the shared ImageService, creating it on first use"""
+    from service.image_service import ImageService
+    return ImageService()
+
+@lru_cache(maxsize=None)
+def get_embedded_service():
+    """Return the shared EmbeddedService, creating it on first use"""
+    from service.embeded_service import EmbeddedService
+    return EmbeddedService()
+
+@lru_cache(maxsize=None)
+def get_extract_service():
+    """Return the shared ExtractService, creating it on first use"""
+    from service.extract_service import ExtractService
+    return ExtractService()
+
+@lru_cache(maxsize=None)
+def get_detect_service():
+    """Return the shared StatDetectService, creating it on first use"""
+    from service.stat_detect import StatDetectService
+    return StatDetectService()
+
+@lru_cache(maxsize=None)
+def get_job_service():
+    """Return the shared JobService (and its worker pools), creating it on first use"""
+    from service.job_service import JobService
+    return JobService()
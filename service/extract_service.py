@@ -6,17 +6,21 @@ import pywt
 import os, json
 from pathlib import Path
 import glob
-import base64
 import io
 import tempfile
-from typing import Dict, Any, Tuple, Optional, Callable
+from typing import Dict, Any, List, Tuple, Optional, Callable
 import uuid
 import requests
+from service.image_codec import decode_base64_image, encode_base64
+from service.wavelets import get_wavelet, dwt2_approximation
 
 class ExtractService:
     def __init__(self, sideinfo_fetcher: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None):
         self.phash_hamming_threshold = 12  # Hamming distance threshold for pHash (tune 8–14)
         self.sideinfo_dir = os.path.join(tempfile.gettempdir(), "watermarked_images")
+        self.default_output_dir = os.path.join(tempfile.gettempdir(), "extracted_watermarks")
+        # Output directories already created by this process
+        self._ready_dirs = set()
         # Optional hook to fetch sideinfo JSON from an external database by key/id
         # Signature: fetcher(ref: str) -> Optional[dict]
         self.sideinfo_fetcher = sideinfo_fetcher
@@ -42,11 +46,9 @@ class ExtractService:
         suspect_path = os.path.join(temp_dir, f"suspect_{uuid.uuid4().hex}.jpg")
         suspect_image.save(suspect_path)
         
-        # Create output directory if not specified
+        # Output directory if not specified (created on first save)
         if output_dir is None:
-            output_dir = os.path.join(tempfile.gettempdir(), "extracted_watermarks")
-        
-        os.makedirs(output_dir, exist_ok=True)
+            output_dir = self.default_output_dir
         
         # Generate unique filename for extracted watermark
         unique_id = str(uuid.uuid4())
@@ -70,10 +72,10 @@ class ExtractService:
             pass
         
         # Convert extracted image to base64 if extraction was successful
-        if result["status"] == "ok_extracted" and os.path.exists(extracted_path):
-            with open(extracted_path, "rb") as f:
-                extracted_b64 = base64.b64encode(f.read()).decode('utf-8')
-            result["extracted_image_b64"] = extracted_b64
+        # (from the JPEG bytes that were saved, instead of reading the file back)
+        extracted_jpeg = result.pop("extracted_jpeg", None)
+        if result["status"] == "ok_extracted" and extracted_jpeg is not None:
+            result["extracted_image_b64"] = encode_base64(extracted_jpeg)
             result["unique_id"] = unique_id
         
         return result
@@ -91,19 +93,37 @@ class ExtractService:
         Returns:
             Dict containing extraction results and metadata
         """
-        # Decode base64 image and save temporarily
-        suspect_image = self._decode_base64_to_pil(suspect_image_b64)
+        # Decode base64 image
+        return self.extract_watermark_from_bytes_with_json(
+            decode_base64_image(suspect_image_b64),
+            sideinfo_json,
+            output_dir
+        )
+    
+    def extract_watermark_from_bytes_with_json(self, suspect_bytes: bytes, sideinfo_json: dict = None,
+                                               output_dir: str = None) -> Dict[str, Any]:
+        """
+        Extract watermark from suspect image given as raw image file bytes and JSON sideinfo
+        
+        Args:
+            suspect_bytes: Suspect image file content
+            sideinfo_json: Optional JSON object with sideinfo data (instead of file path)
+            output_dir: Output directory for extracted watermark (default: temp directory)
+            
+        Returns:
+            Dict containing extraction results and metadata
+        """
+        # Open the image and save it temporarily
+        suspect_image = Image.open(io.BytesIO(suspect_bytes))
         
         # Create temp directory for processing
         temp_dir = tempfile.mkdtemp()
         suspect_path = os.path.join(temp_dir, f"suspect_{uuid.uuid4().hex}.jpg")
         suspect_image.save(suspect_path)
         
-        # Create output directory if not specified
+        # Output directory if not specified (created on first save)
         if output_dir is None:
-            output_dir = os.path.join(tempfile.gettempdir(), "extracted_watermarks")
-        
-        os.makedirs(output_dir, exist_ok=True)
+            output_dir = self.default_output_dir
         
         # Generate unique filename for extracted watermark
         unique_id = str(uuid.uuid4())
@@ -123,10 +143,10 @@ class ExtractService:
             pass
         
         # Convert extracted image to base64 if extraction was successful
-        if result["status"] == "ok_extracted" and os.path.exists(extracted_path):
-            with open(extracted_path, "rb") as f:
-                extracted_b64 = base64.b64encode(f.read()).decode('utf-8')
-            result["extracted_image_b64"] = extracted_b64
+        # (from the JPEG bytes that were saved, instead of reading the file back)
+        extracted_jpeg = result.pop("extracted_jpeg", None)
+        if result["status"] == "ok_extracted" and extracted_jpeg is not None:
+            result["extracted_image_b64"] = encode_base64(extracted_jpeg)
             result["unique_id"] = unique_id
         
         return result
@@ -152,10 +172,9 @@ class ExtractService:
         suspect_path = os.path.join(temp_dir, f"suspect_{uuid.uuid4().hex}.jpg")
         suspect_image.save(suspect_path)
         
-        # Create output directory if not specified
+        # Output directory if not specified (created on first save)
         if output_dir is None:
-            output_dir = os.path.join(tempfile.gettempdir(), "extracted_watermarks")
-        os.makedirs(output_dir, exist_ok=True)
+            output_dir = self.default_output_dir
         
         # Generate unique filename for extracted watermark
         unique_id = str(uuid.uuid4())
@@ -179,10 +198,10 @@ class ExtractService:
             pass
         
         # Convert extracted image to base64 if extraction was successful
-        if result["status"] == "ok_extracted" and os.path.exists(extracted_path):
-            with open(extracted_path, "rb") as f:
-                extracted_b64 = base64.b64encode(f.read()).decode('utf-8')
-            result["extracted_image_b64"] = extracted_b64
+        # (from the JPEG bytes that were saved, instead of reading the file back)
+        extracted_jpeg = result.pop("extracted_jpeg", None)
+        if result["status"] == "ok_extracted" and extracted_jpeg is not None:
+            result["extracted_image_b64"] = encode_base64(extracted_jpeg)
             result["unique_id"] = unique_id
         
         # Include the URL for traceability
@@ -191,8 +210,8 @@ class ExtractService:
     
     def _to_uint8(self, mat: np.ndarray) -> np.ndarray:
         """Convert matrix to uint8 format"""
-        mat = cv2.normalize(mat, None, 0, 255, cv2.NORM_MINMAX)
-        return mat.astype(np.uint8)
+        # Stretch and convert to uint8 in a single OpenCV pass
+        return cv2.normalize(mat, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
     
     def _phash64_from_pil(self, img_pil: Image.Image) -> str:
         """Simple 64-bit pHash via DCT(32x32 gray)."""
@@ -330,12 +349,13 @@ class ExtractService:
                   bar_format="{l_bar}{bar} [ time left: {remaining} ]") as pbar:
 
             # DWTs
-            LL_mod, (LHm, HLm, HHm)       = pywt.dwt2(suspect_channel,   wavelet_name)
-            LL_wmref, (LH_wm, HL_wm, HH_wm) = pywt.dwt2(watermark_channel, wavelet_name)
+            LL_mod                        = dwt2_approximation(suspect_channel, wavelet_name)  # suspect details unused
+            LL_wmref, (LH_wm, HL_wm, HH_wm) = pywt.dwt2(watermark_channel, get_wavelet(wavelet_name))
             pbar.update(30)
 
             # SVDs
-            U_mod, S_mod, V_mod = np.linalg.svd(LL_mod,   full_matrices=False)
+            # Only the suspect's singular values are used; skip computing U/V
+            S_mod               = np.linalg.svd(LL_mod,   compute_uv=False)
             U_wm,  S_wm,  V_wm  = np.linalg.svd(LL_wmref, full_matrices=False)
             pbar.update(50)
 
@@ -352,11 +372,14 @@ class ExtractService:
 
             # Semi-blind extraction
             S_wm_est  = (S_mod - S_orig_used) / max(alpha, 1e-12)
-            LL_wm_est = U_wm @ np.diag(S_wm_est) @ V_wm
+            # host_S is loaded as float64; keep the reconstruction in the channel's dtype
+            S_wm_est  = S_wm_est.astype(U_wm.dtype, copy=False)
+            # Scale U's columns by S rather than building an NxN diagonal matrix
+            LL_wm_est = (U_wm * S_wm_est) @ V_wm
             pbar.update(10)
 
             wm_coeffs      = (LL_wm_est, (LH_wm, HL_wm, HH_wm))
-            wm_channel_est = pywt.idwt2(wm_coeffs, wavelet_name)
+            wm_channel_est = pywt.idwt2(wm_coeffs, get_wavelet(wavelet_name))
             pbar.update(10)
 
         return wm_channel_est
@@ -389,9 +412,7 @@ class ExtractService:
             alpha        = float(meta["wm_params"]["alpha"])
             wavelet_name = meta["wm_params"]["wavelet"]
             canonical_wh = tuple(meta.get("canonical_size", [0, 0]))  # (W, H)
-            S_R = np.array(meta["host_S"]["R"], dtype=np.float64)
-            S_G = np.array(meta["host_S"]["G"], dtype=np.float64)
-            S_B = np.array(meta["host_S"]["B"], dtype=np.float64)
+            S_R, S_G, S_B = self._load_host_S(meta)
             
             # Handle watermark logo - either from base64 or file path
             watermark_ref = meta["watermark_ref"]
@@ -428,15 +449,12 @@ class ExtractService:
             return {"status": "skip_bad_meta", "reason": f"Image open failed: {e}. Proceed to embedding."}
 
         # Resize both to canonical size (from embed); fallback to suspect size if there is no canonical size
-        if canonical_wh != (0, 0):
-            watermark_logo = watermark_logo.resize(canonical_wh)
-            suspect_img    = suspect_img.resize(canonical_wh)
-        else:
+        if canonical_wh == (0, 0):
             canonical_wh = suspect_img.size  
 
-        # Split channels → float64
-        wmr, wmg, wmb = [np.float64(c) for c in watermark_logo.split()]
-        sur, sug, sub = [np.float64(c) for c in suspect_img.split()]
+        # Resize with OpenCV and split channels → float32 (matches the embed pipeline)
+        wmr, wmg, wmb = self._rgb_planes(watermark_logo, canonical_wh)
+        sur, sug, sub = self._rgb_planes(suspect_img, canonical_wh)
 
         # Extract each color channels
         ext_r = self._extract_channel(sur, wmr, S_R, wavelet_name, alpha, "Red")
@@ -446,8 +464,7 @@ class ExtractService:
         # Save the extracted watermark image
         r8, g8, b8 = map(self._to_uint8, (ext_r, ext_g, ext_b))
         out_img = Image.merge("RGB", (Image.fromarray(r8), Image.fromarray(g8), Image.fromarray(b8)))
-        os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        out_img.save(out_path)
+        extracted_jpeg = self._save_jpeg(out_img, out_path)
 
         return {
             "status": "ok_extracted",
@@ -456,7 +473,8 @@ class ExtractService:
             "canonical_size": canonical_wh,
             "sideinfo_used": sideinfo_path,
             "watermark_logo": wm_logo_source,
-            "extracted_path": out_path
+            "extracted_path": out_path,
+            "extracted_jpeg": extracted_jpeg
         }
     
     def _extract_from_suspect_with_meta(self, suspect_path: str, meta: Dict[str, Any], out_path: str, sideinfo_used: Optional[str]) -> Dict[str, Any]:
@@ -465,9 +483,7 @@ class ExtractService:
             alpha        = float(meta["wm_params"]["alpha"])
             wavelet_name = meta["wm_params"]["wavelet"]
             canonical_wh = tuple(meta.get("canonical_size", [0, 0]))  # (W, H)
-            S_R = np.array(meta["host_S"]["R"], dtype=np.float64)
-            S_G = np.array(meta["host_S"]["G"], dtype=np.float64)
-            S_B = np.array(meta["host_S"]["B"], dtype=np.float64)
+            S_R, S_G, S_B = self._load_host_S(meta)
             
             # Handle watermark logo - either from base64 or file path
             watermark_ref = meta["watermark_ref"]
@@ -496,14 +512,11 @@ class ExtractService:
         except Exception as e:
             return {"status": "skip_bad_meta", "reason": f"Image open failed: {e}. Proceed to embedding."}
 
-        if canonical_wh != (0, 0):
-            watermark_logo = watermark_logo.resize(canonical_wh)
-            suspect_img    = suspect_img.resize(canonical_wh)
-        else:
+        if canonical_wh == (0, 0):
             canonical_wh = suspect_img.size
 
-        wmr, wmg, wmb = [np.float64(c) for c in watermark_logo.split()]
-        sur, sug, sub = [np.float64(c) for c in suspect_img.split()]
+        wmr, wmg, wmb = self._rgb_planes(watermark_logo, canonical_wh)
+        sur, sug, sub = self._rgb_planes(suspect_img, canonical_wh)
 
         ext_r = self._extract_channel(sur, wmr, S_R, wavelet_name, alpha, "Red")
         ext_g = self._extract_channel(sug, wmg, S_G, wavelet_name, alpha, "Green")
@@ -511,8 +524,7 @@ class ExtractService:
 
         r8, g8, b8 = map(self._to_uint8, (ext_r, ext_g, ext_b))
         out_img = Image.merge("RGB", (Image.fromarray(r8), Image.fromarray(g8), Image.fromarray(b8)))
-        os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        out_img.save(out_path)
+        extracted_jpeg = self._save_jpeg(out_img, out_path)
 
         return {
             "status": "ok_extracted",
@@ -521,30 +533,55 @@ class ExtractService:
             "canonical_size": canonical_wh,
             "sideinfo_used": sideinfo_used,
             "watermark_logo": wm_logo_source,
-            "extracted_path": out_path
+            "extracted_path": out_path,
+            "extracted_jpeg": extracted_jpeg
         }
     
-    def _decode_base64_to_pil(self, base64_string: str) -> Image.Image:
-        """Decode base64 string to PIL Image"""
-        # Remove data URL prefix if present
-        if base64_string.startswith('data:'):
-            base64_string = base64_string.split(',')[1]
+    def _load_host_S(self, meta: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Read the saved host singular values (R, G, B) from sideinfo as float64
         
-        # Decode base64 with padding handling
-        try:
-            # Try direct decode first
-            image_data = base64.b64decode(base64_string)
-        except Exception:
-            # If that fails, try with padding
-            try:
-                # Add padding if needed
-                padding = 4 - (len(base64_string) % 4)
-                if padding != 4:
-                    base64_string += '=' * padding
-                image_data = base64.b64decode(base64_string)
-            except Exception as e:
-                raise ValueError(f"Invalid base64 format: {str(e)}")
+        Sideinfo written since host_S_encoding was added stores each channel as
+        base64 of float32 bytes; older sideinfo stores plain lists of floats.
+        
+        Raises:
+            KeyError: If host_S or one of its channels is missing
+            ValueError: If an encoded channel is not valid base64 float32 data
+        """
+        host_S = meta["host_S"]
+        if meta.get("host_S_encoding") == "f32_b64":
+            return tuple(np.frombuffer(decode_base64_image(host_S[c]), dtype='<f4').astype(np.float64)
+                         for c in ("R", "G", "B"))
+        return tuple(np.array(host_S[c], dtype=np.float64) for c in ("R", "G", "B"))
+    
+    def _rgb_planes(self, image: Image.Image, size: Tuple[int, int]) -> List[np.ndarray]:
+        """
+        Resize an RGB image to size (W, H) with OpenCV and return its R, G, B planes as float32
         
-        # Convert to PIL Image
-        image_stream = io.BytesIO(image_data)
-        return Image.open(image_stream)
+        Uses the same interpolation as the embed (area when shrinking, bicubic
+        when enlarging); images already at size are not resampled.
+        """
+        rgb = np.asarray(image)
+        width, height = int(size[0]), int(size[1])
+        if rgb.shape[:2] != (height, width):
+            shrinking = rgb.shape[0] * rgb.shape[1] > height * width
+            rgb = cv2.resize(rgb, (width, height),
+                             interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_CUBIC)
+        return [rgb[:, :, i].astype(np.float32) for i in range(3)]
+    
+    def _save_jpeg(self, image: Image.Image, out_path: str) -> bytes:
+        """Encode an image to JPEG once, write it to out_path and return the bytes"""
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG')
+        jpeg_bytes = buffer.getvalue()
+        out_dir = os.path.dirname(out_path)
+        if out_dir not in self._ready_dirs:
+            os.makedirs(out_dir, exist_ok=True)
+            self._ready_dirs.add(out_dir)
+        with open(out_path, "wb") as f:
+            f.write(jpeg_bytes)
+        return jpeg_bytes
+    
+    def _decode_base64_to_pil(self, base64_string: str) -> Image.Image:
+        """Decode base64 string to PIL Image"""
+        return Image.open(io.BytesIO(decode_base64_image(base64_string)))
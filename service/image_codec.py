@@ -0,0 +1,60 @@
+# service/image_codec.py
+import re
+
+try:
+    # SIMD base64 codec with the stdlib API; several times faster on multi-MB images
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+def decode_base64_image(base64_string: str) -> bytes:
+    """
+    Decode a base64 image string (optionally a data: URL) to raw bytes
+
+    Args:
+        base64_string: Base64 encoded image, padding optional
+
+    Returns:
+        bytes: Decoded image file content
+
+    Raises:
+        ValueError: If the input is not a non-empty base64 string
+    """
+    if not base64_string or not isinstance(base64_string, str):
+        raise ValueError("Base64 string is required and must be a string")
+
+    # Remove data URL prefix if present
+    if base64_string.startswith('data:'):
+        base64_string = base64_string.split(',')[1]
+
+    # Restore any stripped padding up front instead of retrying after a failed decode
+    padding = -len(base64_string) & 3
+    if padding:
+        base64_string += '=' * padding
+
+    try:
+        return base64.b64decode(base64_string)
+    except Exception as e:
+        raise ValueError(f"Invalid base64 format: {str(e)}")
+
+def encode_base64(data: bytes) -> str:
+    """Encode raw bytes (e.g. a JPEG buffer) as an ASCII base64 string"""
+    return base64.b64encode(data).decode('ascii')
+
+# Strict base64: alphabet characters, then at most two '=' of padding at the very end
+_BASE64_PATTERN = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+
+def validate_base64(base64_string: str) -> None:
+    """
+    Check that a string is strict base64 (correct alphabet and padding)
+
+    Scans the characters instead of decoding, so multi-MB images are not
+    decoded just to be thrown away; the real decode happens later anyway.
+
+    Raises:
+        ValueError: If the string is not valid base64
+    """
+    if not isinstance(base64_string, str) or not _BASE64_PATTERN.fullmatch(base64_string):
+        raise ValueError("Only base64 data is allowed")
+    if len(base64_string) % 4:
+        raise ValueError("Incorrect padding")
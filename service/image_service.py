@@ -1,17 +1,96 @@
 # service/image_service.py
-import cloudinary.uploader
-import cloudinary.api
-import base64
 import binascii
 import io
 import os
+from functools import lru_cache
 from PIL import Image as PILImage
 
+try:
+    # SIMD base64 codec with the stdlib API; several times faster on multi-MB images
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+class ImageServiceError(Exception):
+    """Base class for errors raised by ImageService"""
+
+class ValidationError(ImageServiceError, ValueError):
+    """Image payload is malformed, too large or in an unsupported format"""
+
+class UploadError(ImageServiceError):
+    """Image could not be uploaded to cloud storage"""
+
+class DeleteError(ImageServiceError):
+    """Image could not be deleted from cloud storage"""
+
+class RetrievalError(ImageServiceError):
+    """Image information could not be retrieved from cloud storage"""
+
+class NotFoundError(RetrievalError):
+    """No image exists for the given public ID"""
+
+@lru_cache(maxsize=None)
+def _get_cloudinary():
+    """
+    Import and configure the Cloudinary SDK on first use
+    
+    Returns:
+        module or None: Configured cloudinary module, or None when the SDK is not
+        installed or CLOUDINARY_CLOUD_NAME is not set (local-only deployments)
+    """
+    if not os.getenv('CLOUDINARY_CLOUD_NAME'):
+        return None
+
+    try:
+        import cloudinary
+        import cloudinary.uploader
+        import cloudinary.api
+    except ImportError:
+        return None
+
+    cloudinary.config(
+        cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
+        api_key=os.getenv('CLOUDINARY_API_KEY'),
+        api_secret=os.getenv('CLOUDINARY_API_SECRET'),
+        secure=True
+    )
+    _size_http_pools(int(os.getenv('CLOUDINARY_POOL_MAXSIZE', os.getenv('UPLOAD_WORKERS', 16))))
+    return cloudinary
+
+def _size_http_pools(maxsize: int) -> None:
+    """
+    Let the Cloudinary SDK keep up to maxsize connections per host alive
+    
+    The SDK's module-level urllib3 pools keep only one connection per host by
+    default, so every concurrent call beyond the first (I/O pool threads, gevent
+    greenlets) opens a new TLS connection and discards it afterwards.
+    """
+    modules = []
+    try:
+        from cloudinary import uploader
+        modules.append(uploader)
+        from cloudinary.api_client import call_api
+        modules.append(call_api)
+    except ImportError:
+        pass
+
+    for module in modules:
+        pool_kw = getattr(getattr(module, '_http', None), 'connection_pool_kw', None)
+        if isinstance(pool_kw, dict):
+            pool_kw['maxsize'] = maxsize
+
 class ImageService:
     def __init__(self):
         self.allowed_formats = ['jpeg', 'jpg', 'png', 'gif']
         self.max_file_size = 10 * 1024 * 1024  # 10MB in bytes
 
+    def _cloudinary(self):
+        """Return the configured Cloudinary SDK or fail if cloud storage is disabled"""
+        cloudinary = _get_cloudinary()
+        if cloudinary is None:
+            raise ImageServiceError("Cloud storage is not configured (install cloudinary and set CLOUDINARY_CLOUD_NAME)")
+        return cloudinary
+
     def upload_base64_image(self, base64_string: str) -> dict:
         """
         Upload base64 encoded image to Cloudinary
@@ -23,28 +102,50 @@ class ImageService:
             dict: Cloudinary response with image URL and metadata
             
         Raises:
-            ValueError: If validation fails
-            Exception: If upload fails
+            ValidationError: If validation fails
+            UploadError: If upload fails
         """
         try:
             # Validate and process base64 string
             image_data = self._validate_and_decode_base64(base64_string)
             
+            return self.upload_image_bytes(image_data)
+            
+        except ValidationError:
+            raise
+        except Exception as e:
+            raise UploadError(f"Image upload failed: {str(e)}")
+
+    def upload_image_bytes(self, image_data: bytes) -> dict:
+        """
+        Upload raw image bytes (e.g. a multipart file) to Cloudinary
+        
+        Args:
+            image_data: Binary image content
+            
+        Returns:
+            dict: Cloudinary response with image URL and metadata
+            
+        Raises:
+            ValidationError: If validation fails
+            UploadError: If upload fails
+        """
+        try:
             # Validate image format and size
             self._validate_image(image_data)
             
             # Upload to Cloudinary and return result
             return self._upload_to_cloudinary(image_data)
             
-        except ValueError:
+        except ValidationError:
             raise
         except Exception as e:
-            raise Exception(f"Image upload failed: {str(e)}")
+            raise UploadError(f"Image upload failed: {str(e)}")
 
     def _validate_and_decode_base64(self, base64_string: str) -> bytes:
         """Validate and decode base64 string"""
         if not base64_string or not isinstance(base64_string, str):
-            raise ValueError("Base64 string is required and must be a string")
+            raise ValidationError("Base64 string is required and must be a string")
         
         try:
             # Remove data URL prefix if present
@@ -64,35 +165,35 @@ class ImageService:
                         base64_string += '=' * padding
                     image_data = base64.b64decode(base64_string)
                 except Exception as e:
-                    raise ValueError(f"Invalid base64 format: {str(e)}")
+                    raise ValidationError(f"Invalid base64 format: {str(e)}")
             
             if len(image_data) == 0:
-                raise ValueError("Decoded image data is empty")
+                raise ValidationError("Decoded image data is empty")
                 
             return image_data
             
         except binascii.Error:
-            raise ValueError("Invalid base64 string format")
+            raise ValidationError("Invalid base64 string format")
 
     def _validate_image(self, image_data: bytes) -> None:
         """Validate image format and size"""
         # Check file size
         if len(image_data) > self.max_file_size:
-            raise ValueError(f"Image size exceeds maximum allowed size of {self.max_file_size // (1024*1024)}MB")
+            raise ValidationError(f"Image size exceeds maximum allowed size of {self.max_file_size // (1024*1024)}MB")
         
         try:
             # Validate image format using PIL
             image_stream = io.BytesIO(image_data)
             with PILImage.open(image_stream) as pil_image:
                 if pil_image.format.lower() not in self.allowed_formats:
-                    raise ValueError(f"Unsupported image format: {pil_image.format}. Allowed formats: {', '.join(self.allowed_formats)}")
+                    raise ValidationError(f"Unsupported image format: {pil_image.format}. Allowed formats: {', '.join(self.allowed_formats)}")
                 
                 # Check image dimensions (optional)
                 if pil_image.width < 1 or pil_image.height < 1:
-                    raise ValueError("Invalid image dimensions")
+                    raise ValidationError("Invalid image dimensions")
                     
         except PILImage.UnidentifiedImageError:
-            raise ValueError("Invalid image data or corrupted image")
+            raise ValidationError("Invalid image data or corrupted image")
 
     def _upload_to_cloudinary(self, image_data: bytes) -> dict:
         """Upload image to Cloudinary and return formatted response"""
@@ -102,10 +203,12 @@ class ImageService:
             upload_params = {
                 'folder': os.getenv('CLOUDINARY_UPLOAD_FOLDER', 'watermark_app/'),
                 'transformation': [{'width': 1024, 'crop': 'limit'}],
-                'resource_type': 'image'
+                'resource_type': 'image',
+                # Don't let a stalled upload hold the worker for the full request timeout
+                'timeout': int(os.getenv('CLOUDINARY_UPLOAD_TIMEOUT', 60))
             }
             
-            result = cloudinary.uploader.upload(image_stream, **upload_params)
+            result = self._cloudinary().uploader.upload(image_stream, **upload_params)
             
             # Return formatted response
             return {
@@ -119,7 +222,7 @@ class ImageService:
             }
             
         except Exception as e:
-            raise Exception(f"Cloudinary upload failed: {str(e)}")
+            raise UploadError(f"Cloudinary upload failed: {str(e)}")
 
     def delete_image(self, public_id: str) -> bool:
         """
@@ -130,13 +233,16 @@ class ImageService:
             
         Returns:
             bool: True if deleted successfully
+            
+        Raises:
+            DeleteError: If the delete request fails
         """
         try:
-            result = cloudinary.uploader.destroy(public_id)
+            result = self._cloudinary().uploader.destroy(public_id)
             return result.get('result') == 'ok'
             
         except Exception as e:
-            raise Exception(f"Failed to delete image: {str(e)}")
+            raise DeleteError(f"Failed to delete image: {str(e)}")
 
     def get_image_info(self, public_id: str) -> dict:
         """
@@ -147,9 +253,17 @@ class ImageService:
             
         Returns:
             dict: Image information
+            
+        Raises:
+            NotFoundError: If no image has this public ID
+            RetrievalError: If the lookup fails
         """
         try:
-            result = cloudinary.api.resource(public_id)
+            cloudinary = self._cloudinary()
+            try:
+                result = cloudinary.api.resource(public_id)
+            except cloudinary.exceptions.NotFound:
+                raise NotFoundError(f"Image with public ID {public_id} not found")
             
             return {
                 'public_id': result['public_id'],
@@ -161,5 +275,7 @@ class ImageService:
                 'created_at': result.get('created_at')
             }
             
+        except NotFoundError:
+            raise
         except Exception as e:
-            raise Exception(f"Failed to get image info: {str(e)}")
\ No newline at end of file
+            raise RetrievalError(f"Failed to get image info: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,375 @@
+# service/job_service.py
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Job ids are uuid4 hex strings; anything else is rejected before touching the filesystem
+_JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+def _get_service(name: str):
+    """Return this pool process's shared watermark service"""
+    from service import get_embedded_service, get_extract_service, get_detect_service
+    if name == 'embed':
+        return get_embedded_service()
+    if name == 'extract':
+        return get_extract_service()
+    return get_detect_service()
+
+def warm_up_kernels() -> None:
+    """
+    Run each image-processing kernel once on a tiny array
+    
+    The first dwt2/svd/OpenCV call initializes wavelet filters, BLAS/LAPACK and
+    OpenCV thread pools; doing it at boot keeps that off the first request.
+    Thread pools do not survive fork, so call this in each worker, not the master.
+    """
+    import cv2
+    import numpy as np
+    import pywt
+
+    # float32, matching the channel dtype the watermark services feed to pywt/LAPACK
+    block = np.zeros((8, 8), dtype=np.float32)
+    pywt.idwt2(pywt.dwt2(block, 'haar'), 'haar')
+    np.linalg.svd(block, full_matrices=False)
+    cv2.normalize(block, None, 0, 255, cv2.NORM_MINMAX)
+    cv2.resize(block.astype(np.uint8), (4, 4), interpolation=cv2.INTER_AREA)
+
+def _warm_up():
+    """Pool initializer: import NumPy/OpenCV/PyWavelets and prime them before the first job arrives"""
+    for name in ('embed', 'extract', 'detect'):
+        _get_service(name)
+    warm_up_kernels()
+
+# Image fields of each operation's JSON payload
+IMAGE_FIELDS = {
+    'embed': ('original_image', 'watermark_image'),
+    'extract': ('suspect_image',),
+    'detect': ('original_watermark', 'extracted_watermark'),
+}
+
+def decode_operation_params(operation: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Decode a payload's base64 images once, in the caller, before it crosses into a pool process
+    
+    Raw bytes are a quarter smaller to pickle than base64 and the pool process
+    skips the decode. Fields other than the images are copied as-is (detect's
+    optional suspect_image is dropped; detection never uses it).
+    
+    Args:
+        operation: 'embed', 'extract' or 'detect'
+        params: Validated JSON payload
+        
+    Returns:
+        Dict: Payload for _run_operation
+        
+    Raises:
+        ValueError: If an image field is missing or not valid base64
+    """
+    from service.image_codec import decode_base64_image
+    decoded = dict(params)
+    if operation == 'detect':
+        decoded.pop('suspect_image', None)
+    for field in IMAGE_FIELDS[operation]:
+        decoded[field] = decode_base64_image(params.get(field))
+    return decoded
+
+def _run_operation(operation: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run one watermark operation inside a pool process
+
+    Args:
+        operation: 'embed', 'extract' or 'detect'
+        params: Same fields as the matching JSON endpoint, with images already
+            decoded to raw bytes (see decode_operation_params)
+
+    Returns:
+        Dict: Raw service result
+    """
+    if operation == 'embed':
+        return _get_service('embed').embed_watermark_from_bytes(
+            params['original_image'],
+            params['watermark_image'],
+            params.get('alpha', 0.6)
+        )
+    if operation == 'extract':
+        return _get_service('extract').extract_watermark_from_bytes_with_json(
+            params['suspect_image'],
+            params.get('sideinfo_json', None)
+        )
+    if operation == 'detect':
+        return _get_service('detect').compare_watermarks_from_bytes(
+            params['original_watermark'],
+            params['extracted_watermark'],
+            pcc_threshold=params.get('pcc_threshold', 0.70),
+            save_record=params.get('save_record', False)
+        )
+    raise ValueError(f"Unsupported operation: {operation}")
+
+class JobService:
+    """
+    Own the two worker pools and track background jobs run on them
+    
+    CPU-bound watermark operations run on a process pool (WM_WORKERS) and
+    network-bound Cloudinary calls on a thread pool (UPLOAD_WORKERS), so neither
+    kind of work can starve the other and each is capped independently.
+    """
+
+    def __init__(self):
+        # Default to an even share of the CPUs across Gunicorn workers (counted the
+        # same way gunicorn.conf.py does), so the host doesn't end up with
+        # workers x cpu_count pool processes.
+        # WM_WORKERS=0 runs synchronous watermark operations inline in the request thread
+        from config.concurrency import gunicorn_worker_count
+        default_workers = max(1, (os.cpu_count() or 1) // max(1, gunicorn_worker_count()))
+        self.max_workers = int(os.getenv('WM_WORKERS', default_workers))
+        self.io_max_workers = int(os.getenv('UPLOAD_WORKERS', 16))
+        self.result_ttl = int(os.getenv('JOB_RESULT_TTL', 3600))
+        # Minimum seconds between scans of the jobs directory for expired records
+        self.prune_interval = int(os.getenv('JOB_PRUNE_INTERVAL', 60))
+        self._last_prune = 0.0
+        # Job state lives on disk so any Gunicorn worker on this host can answer a poll
+        self.jobs_dir = os.path.join(tempfile.gettempdir(), "watermark_jobs")
+        self._executor = None
+        self._io_executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Create the process pool on first use (after Gunicorn has forked this worker)"""
+        with self._lock:
+            if self._executor is None:
+                os.makedirs(self.jobs_dir, exist_ok=True)
+                # spawn: forking a threaded worker can copy held locks into the child
+                self._executor = ProcessPoolExecutor(
+                    max_workers=max(1, self.max_workers),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm_up
+                )
+            return self._executor
+
+    def _drop_executor(self, broken: ProcessPoolExecutor) -> None:
+        """Forget a process pool that lost a process, so the next call starts a fresh one"""
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False)
+
+    def _submit_operation(self, operation: str, params: Dict[str, Any]) -> Future:
+        """
+        Submit an operation to the process pool, replacing the pool if it is broken
+        
+        A pool process that dies (e.g. OOM-killed on a large image) breaks the
+        whole ProcessPoolExecutor for good, so it is dropped rather than reused.
+        """
+        executor = self._get_executor()
+        try:
+            future = executor.submit(_run_operation, operation, params)
+        except BrokenProcessPool:
+            # A process died while the pool was idle
+            self._drop_executor(executor)
+            executor = self._get_executor()
+            future = executor.submit(_run_operation, operation, params)
+
+        def drop_if_broken(done_future):
+            if not done_future.cancelled() and isinstance(done_future.exception(), BrokenProcessPool):
+                self._drop_executor(executor)
+
+        future.add_done_callback(drop_if_broken)
+        return future
+
+    def _get_io_executor(self) -> ThreadPoolExecutor:
+        """Create the thread pool for network-bound jobs (e.g. Cloudinary uploads) on first use"""
+        with self._lock:
+            if self._io_executor is None:
+                os.makedirs(self.jobs_dir, exist_ok=True)
+                self._io_executor = ThreadPoolExecutor(
+                    max_workers=self.io_max_workers,
+                    thread_name_prefix='cloudinary-io'
+                )
+            return self._io_executor
+
+    def run(self, operation: str, params: Dict[str, Any], decoded: bool = False) -> Dict[str, Any]:
+        """
+        Run an operation on the process pool and wait for its result
+        
+        Args:
+            operation: 'embed', 'extract' or 'detect'
+            params: Validated request payload
+            decoded: True if params already holds raw image bytes (e.g. multipart uploads)
+            
+        Returns:
+            Dict: Raw service result (exceptions are re-raised here)
+        """
+        if not decoded:
+            params = decode_operation_params(operation, params)
+        if self.max_workers <= 0:
+            return _run_operation(operation, params)
+        try:
+            return self._submit_operation(operation, params).result()
+        except BrokenProcessPool:
+            # A pool process died during this call; retry once on a fresh pool
+            logger.warning("Watermark pool broke during %s; retrying on a new pool", operation)
+            return self._submit_operation(operation, params).result()
+
+    def run_io(self, fn: Callable[..., Any], *args) -> Any:
+        """
+        Run a network-bound call on the I/O thread pool and wait for its result
+        
+        Args:
+            fn: Callable to run (e.g. ImageService.get_image_info)
+            *args: Arguments for fn
+            
+        Returns:
+            fn's return value (exceptions are re-raised here)
+        """
+        return self._get_io_executor().submit(fn, *args).result()
+
+    def submit(self, operation: str, params: Dict[str, Any],
+               build_response: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], int]],
+               decoded: bool = False) -> str:
+        """
+        Queue an operation and return its job id immediately
+
+        Args:
+            operation: 'embed', 'extract' or 'detect'
+            params: Validated request payload
+            build_response: Maps the service result to (response_body, status_code)
+            decoded: True if params already holds raw image bytes (e.g. multipart uploads)
+
+        Returns:
+            str: Job id to poll with get_job
+        """
+        if not decoded:
+            params = decode_operation_params(operation, params)
+        return self._track(lambda: self._submit_operation(operation, params), build_response)
+
+    def submit_io(self, fn: Callable[..., Dict[str, Any]], *args,
+                  build_response: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], int]]) -> str:
+        """
+        Queue a network-bound call on the thread pool and return its job id immediately
+
+        Args:
+            fn: Callable to run (e.g. ImageService.upload_image_bytes)
+            *args: Arguments for fn
+            build_response: Maps fn's result to (response_body, status_code)
+
+        Returns:
+            str: Job id to poll with get_job
+        """
+        executor = self._get_io_executor()
+        return self._track(lambda: executor.submit(fn, *args), build_response)
+
+    def _track(self, start: Callable[[], Future],
+               build_response: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], int]]) -> str:
+        """Record a pending job, start it, and persist its response when it finishes"""
+        self._prune()
+
+        job_id = uuid.uuid4().hex
+        self._write(job_id, {'job_id': job_id, 'status': 'pending', 'created_at': int(time.time())})
+
+        try:
+            future = start()
+        except Exception as e:
+            # Don't leave a job that never started pending until it expires
+            self._write(job_id, {
+                'job_id': job_id,
+                'status': 'failed',
+                'status_code': 500,
+                'result': {'error': str(e), 'code': 'JOB_ERROR'}
+            })
+            raise
+
+        def on_done(done_future):
+            try:
+                body, status_code = build_response(done_future.result())
+            except ValueError as e:
+                body, status_code = {'error': str(e), 'code': 'VALIDATION_ERROR'}, 400
+            except Exception as e:
+                body, status_code = {'error': str(e), 'code': 'JOB_ERROR'}, 500
+            # Exceptions raised here would be swallowed by the Future and leave the
+            # job pending until it expires, so fall back to a minimal failed record
+            try:
+                self._write(job_id, {
+                    'job_id': job_id,
+                    'status': 'completed' if status_code < 400 else 'failed',
+                    'status_code': status_code,
+                    'result': body
+                })
+            except Exception:
+                logger.exception("Failed to save result of job %s", job_id)
+                try:
+                    self._write(job_id, {
+                        'job_id': job_id,
+                        'status': 'failed',
+                        'status_code': 500,
+                        'result': {'error': 'Failed to save job result', 'code': 'JOB_ERROR'}
+                    })
+                except Exception:
+                    logger.exception("Failed to mark job %s as failed", job_id)
+
+        future.add_done_callback(on_done)
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a job's state
+
+        Args:
+            job_id: Id returned by submit
+
+        Returns:
+            Dict or None: Job record (pending, completed or failed), None if unknown
+        """
+        if not _JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        try:
+            with open(self._path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _write(self, job_id: str, record: Dict[str, Any]) -> None:
+        """Atomically replace a job record so pollers never read a partial file"""
+        tmp_path = self._path(job_id) + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            os.replace(tmp_path, self._path(job_id))
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _prune(self) -> None:
+        """Delete job records older than JOB_RESULT_TTL seconds (at most once per JOB_PRUNE_INTERVAL)"""
+        now = time.monotonic()
+        with self._lock:
+            if self._last_prune and now - self._last_prune < self.prune_interval:
+                return
+            self._last_prune = now
+        cutoff = time.time() - self.result_ttl
+        try:
+            with os.scandir(self.jobs_dir) as entries:
+                for entry in entries:
+                    if entry.stat().st_mtime < cutoff:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+        except OSError:
+            pass
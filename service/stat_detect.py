@@ -2,11 +2,11 @@ import cv2
 import numpy as np
 from skimage.metrics import structural_similarity as ssim
 import json, os, shutil, uuid, time
-from typing import Optional, Dict, Any
-import base64
+from typing import Callable, Optional, Dict, Any
 import io
 from PIL import Image
 import tempfile
+from service.image_codec import decode_base64_image
 
 class StatDetectService:
     def __init__(self):
@@ -15,7 +15,8 @@ class StatDetectService:
     
     def compare_watermarks_from_base64(self, original_wm_b64: str, extracted_wm_b64: str, 
                                       pcc_threshold: float = None, save_record: bool = False,
-                                      suspect_image_b64: str = None) -> Dict[str, Any]:
+                                      suspect_image_b64: str = None,
+                                      progress_cb: Optional[Callable[[str, int], None]] = None) -> Dict[str, Any]:
         """
         Compare watermarks from base64 inputs and optionally save detection record
         
@@ -25,6 +26,34 @@ class StatDetectService:
             pcc_threshold: PCC threshold for detection (default: 0.70)
             save_record: Whether to save detection record for admin
             suspect_image_b64: Optional base64 encoded suspect image for record (ignored for core detection)
+            progress_cb: Optional callable receiving (stage, percent) as each step starts
+            
+        Returns:
+            Dict containing metrics, detection results, and optional record info
+        """
+        # Decode base64 images (suspect_image is not needed for detection)
+        if progress_cb:
+            progress_cb("decode", 5)
+        return self.compare_watermarks_from_bytes(
+            decode_base64_image(original_wm_b64),
+            decode_base64_image(extracted_wm_b64),
+            pcc_threshold=pcc_threshold,
+            save_record=save_record,
+            progress_cb=progress_cb
+        )
+    
+    def compare_watermarks_from_bytes(self, original_wm_bytes: bytes, extracted_wm_bytes: bytes,
+                                      pcc_threshold: float = None, save_record: bool = False,
+                                      progress_cb: Optional[Callable[[str, int], None]] = None) -> Dict[str, Any]:
+        """
+        Compare watermarks given as raw image file bytes and optionally save detection record
+        
+        Args:
+            original_wm_bytes: Original watermark image file content
+            extracted_wm_bytes: Extracted watermark image file content
+            pcc_threshold: PCC threshold for detection (default: 0.70)
+            save_record: Whether to save detection record for admin
+            progress_cb: Optional callable receiving (stage, percent) as each step starts
             
         Returns:
             Dict containing metrics, detection results, and optional record info
@@ -36,14 +65,12 @@ class StatDetectService:
         temp_dir = tempfile.mkdtemp()
         
         try:
-            # Decode and save images temporarily (only required images for detection)
-            original_path = self._save_base64_to_temp(original_wm_b64, temp_dir, "original_wm")
-            extracted_path = self._save_base64_to_temp(extracted_wm_b64, temp_dir, "extracted_wm")
-            
-            # Skip suspect_image processing - not needed for detection
+            # Save images temporarily
+            original_path = self._save_bytes_to_temp(original_wm_bytes, temp_dir, "original_wm")
+            extracted_path = self._save_bytes_to_temp(extracted_wm_bytes, temp_dir, "extracted_wm")
             
             # Compute metrics using your exact logic
-            metrics = self._compute_metrics(original_path, extracted_path)
+            metrics = self._compute_metrics(original_path, extracted_path, progress_cb)
             
             # Determine if it's a match
             is_detected = self._is_match(metrics, pcc_threshold, use_abs=True)
@@ -67,6 +94,8 @@ class StatDetectService:
             
             # Save detection record if requested
             if save_record:
+                if progress_cb:
+                    progress_cb("record", 95)
                 record_result = self._save_detection_record(
                     original_logo_path=original_path,
                     extracted_wm_path=extracted_path,
@@ -115,11 +144,17 @@ class StatDetectService:
         """Calculate Mean Squared Error"""
         return float(np.mean((img1 - img2) ** 2))
 
-    def _compute_metrics(self, original_path: str, extracted_path: str) -> Dict[str, float]:
+    def _compute_metrics(self, original_path: str, extracted_path: str,
+                         progress_cb: Optional[Callable[[str, int], None]] = None) -> Dict[str, float]:
         """
         Returns a dict with PCC, PCC absolute value, MSE, SSIM, PSNR.
         Resizes extracted to match original if needed.
+        progress_cb, if given, is called with (stage, percent) before each metric.
         """
+        if progress_cb is None:
+            progress_cb = lambda stage, pct: None
+
+        progress_cb("load", 20)
         original  = cv2.imread(original_path,  cv2.IMREAD_GRAYSCALE)
         extracted = cv2.imread(extracted_path, cv2.IMREAD_GRAYSCALE)
         if original is None or extracted is None:
@@ -128,9 +163,13 @@ class StatDetectService:
         if original.shape != extracted.shape:
             extracted = cv2.resize(extracted, (original.shape[1], original.shape[0]))
 
+        progress_cb("pcc", 40)
         pcc_val  = self._pearson_correlation_coefficient(original, extracted)
+        progress_cb("mse", 50)
         mse_val  = self._mean_squared_error(original, extracted)
+        progress_cb("ssim", 60)
         ssim_val = ssim(original, extracted)
+        progress_cb("psnr", 90)
         psnr_val = self._calculate_psnr(original, extracted)
 
         return {
@@ -200,34 +239,8 @@ class StatDetectService:
 
         return {"record_dir": rec_dir, "record_json": rec_json, "record": record}
 
-    def _save_base64_to_temp(self, base64_string: str, temp_dir: str, filename: str) -> str:
-        """Save base64 image to temporary file and return path"""
-        if not base64_string or not isinstance(base64_string, str):
-            raise ValueError("Base64 string is required and must be a string")
-        
-        # Remove data URL prefix if present
-        if base64_string.startswith('data:'):
-            base64_string = base64_string.split(',')[1]
-        
-        # Basic validation - check if string looks like base64
-        if len(base64_string.strip()) == 0:
-            raise ValueError("Base64 string is empty after processing")
-        
-        # Decode base64 with padding handling
-        try:
-            # Try direct decode first
-            image_data = base64.b64decode(base64_string)
-        except Exception:
-            # If that fails, try with padding
-            try:
-                # Add padding if needed
-                padding = 4 - (len(base64_string) % 4)
-                if padding != 4:
-                    base64_string += '=' * padding
-                image_data = base64.b64decode(base64_string)
-            except Exception as e:
-                raise ValueError(f"Invalid base64 format: {str(e)}")
-        
+    def _save_bytes_to_temp(self, image_data: bytes, temp_dir: str, filename: str) -> str:
+        """Save image bytes to temporary file and return path"""
         # Check if decoded data has reasonable size for an image
         if len(image_data) < 100:  # Very small, likely not a real image
             raise ValueError(f"Decoded image data too small ({len(image_data)} bytes), likely not a valid image")
@@ -244,7 +257,7 @@ class StatDetectService:
         except Exception as e:
             # Provide more detailed error information
             data_preview = image_data[:50] if len(image_data) > 50 else image_data
-            raise ValueError(f"Invalid image data: {str(e)}. Data length: {len(image_data)} bytes. The base64 data does not represent a valid image file.")
+            raise ValueError(f"Invalid image data: {str(e)}. Data length: {len(image_data)} bytes. The data does not represent a valid image file.")
         
         # Determine file extension
         format_lower = pil_image.format.lower() if pil_image.format else 'jpg'
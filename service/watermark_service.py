@@ -1,31 +1,57 @@
 import json
 import os
 import tempfile
-from typing import List, Dict, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, List, Dict, Optional
 from entity.watermark import Watermark
 import uuid
 from config.database_manager import DatabaseManager
 
+# Per-process LRU of watermark rows by ID, each entry (expires_at, row_dict).
+# Rows change rarely, so a short TTL bounds staleness from writes made by
+# other workers; this worker's own updates and deletes invalidate immediately.
+_row_cache = OrderedDict()
+_row_cache_lock = threading.Lock()
+
+def _row_cache_get(watermark_id: int) -> Optional[Dict]:
+    """Return the cached row for watermark_id, or None if absent or expired"""
+    with _row_cache_lock:
+        entry = _row_cache.get(watermark_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _row_cache[watermark_id]
+            return None
+        _row_cache.move_to_end(watermark_id)
+        return entry[1]
+
+def _row_cache_put(watermark_id: int, row: Dict, ttl: float, maxsize: int) -> None:
+    """Store a row for ttl seconds and evict the least recently used ones beyond maxsize"""
+    with _row_cache_lock:
+        _row_cache[watermark_id] = (time.monotonic() + ttl, row)
+        _row_cache.move_to_end(watermark_id)
+        while len(_row_cache) > maxsize:
+            _row_cache.popitem(last=False)
+
+def _row_cache_invalidate(watermark_id: int) -> None:
+    with _row_cache_lock:
+        _row_cache.pop(watermark_id, None)
+
 class WatermarkService:
     def __init__(self):
         """Initialize watermark service with database connection"""
-        # Initialize database manager
+        # Tables are created once per release via `flask init-db` (or RUN_MIGRATIONS
+        # in gunicorn.conf.py), not by every worker on startup
         try:
             self.db_manager = DatabaseManager()
-            
-            # Create tables if they don't exist
-            try:
-                self.db_manager.create_tables()
-                print("✓ Database connection successful")
-            except Exception as e:
-                print(f"✗ Database table creation failed: {e}")
-                raise Exception(f"Database initialization failed: {e}")
-                
         except Exception as e:
             print(f"✗ Database connection failed: {e}")
             raise Exception(f"Database connection failed: {e}")
-    
-
+        # get_watermark_by_id cache size (0 disables) and entry lifetime in seconds
+        self.cache_size = int(os.getenv('WATERMARK_CACHE_SIZE', 4096))
+        self.cache_ttl = float(os.getenv('WATERMARK_CACHE_TTL', 300))
     
     def create_watermark(self, store_name: str, watermark_url_image: str) -> Watermark:
         """
@@ -90,6 +116,62 @@ class WatermarkService:
         )
         return watermark
     
+    def create_watermarks(self, items: List[Dict[str, str]]) -> List[Watermark]:
+        """
+        Create several watermarks in a single transaction
+        
+        Args:
+            items: Dicts with store_name and watermark_url_image
+            
+        Returns:
+            List[Watermark]: Created watermark objects, in input order
+            
+        Raises:
+            ValueError: If any store_name or watermark_url_image is empty
+        """
+        rows = []
+        for item in items:
+            store_name = item.get('store_name')
+            watermark_url_image = item.get('watermark_url_image')
+            if not store_name or not store_name.strip():
+                raise ValueError("Store name cannot be empty")
+            if not watermark_url_image or not watermark_url_image.strip():
+                raise ValueError("Watermark image URL cannot be empty")
+            rows.append((store_name.strip(), watermark_url_image.strip()))
+        
+        if not rows:
+            return []
+        
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if self.db_manager.db_type == 'postgresql':
+                    # One multi-row INSERT; RETURNING keeps the IDs in VALUES order
+                    from psycopg2.extras import execute_values
+                    watermark_ids = [row[0] for row in execute_values(
+                        cursor,
+                        "INSERT INTO watermarks (store_name, watermark_url_image) VALUES %s RETURNING watermark_id",
+                        rows,
+                        fetch=True
+                    )]
+                else:
+                    # MySQL and SQLite: per-row lastrowid, but one connection and one commit
+                    query = "INSERT INTO watermarks (store_name, watermark_url_image) VALUES (%s, %s)"
+                    if self.db_manager.db_type == 'sqlite':
+                        query = query.replace('%s', '?')
+                    watermark_ids = []
+                    for row in rows:
+                        cursor.execute(query, row)
+                        watermark_ids.append(cursor.lastrowid)
+                conn.commit()
+            finally:
+                cursor.close()
+        
+        return [
+            Watermark(watermark_id=watermark_id, store_name=store_name, watermark_url_image=watermark_url_image)
+            for watermark_id, (store_name, watermark_url_image) in zip(watermark_ids, rows)
+        ]
+    
     def get_watermark_by_id(self, watermark_id: int) -> Optional[Watermark]:
         """
         Get watermark by ID
@@ -100,7 +182,20 @@ class WatermarkService:
         Returns:
             Watermark: Watermark object if found, None otherwise
         """
-        # Use database only
+        watermark_data = _row_cache_get(watermark_id) if self.cache_size else None
+        if watermark_data is None:
+            watermark_data = self._fetch_watermark_row(watermark_id)
+            # Only hits are cached; a missing ID may be created by another worker
+            if watermark_data is not None and self.cache_size:
+                _row_cache_put(watermark_id, watermark_data, self.cache_ttl, self.cache_size)
+        
+        if watermark_data is not None:
+            return Watermark.from_dict(watermark_data)
+        
+        return None
+    
+    def _fetch_watermark_row(self, watermark_id: int) -> Optional[Dict]:
+        """Read one watermark row from the database, bypassing the cache"""
         query = """
             SELECT watermark_id, store_name, watermark_url_image 
             FROM watermarks 
@@ -113,8 +208,7 @@ class WatermarkService:
         result = self.db_manager.execute_query(query, (watermark_id,))
         
         if result and len(result) > 0:
-            watermark_data = result[0]
-            return Watermark.from_dict(watermark_data)
+            return result[0]
         
         return None
     
@@ -167,6 +261,62 @@ class WatermarkService:
         
         return []
     
+    def iter_all_watermarks(self) -> Iterator[Watermark]:
+        """
+        Iterate over all watermarks without loading them into memory at once
+        
+        Returns:
+            Iterator[Watermark]: Watermark objects ordered by ID
+        """
+        return map(Watermark.from_dict, self.iter_all_watermark_dicts())
+    
+    def iter_all_watermark_dicts(self, limit: Optional[int] = None, offset: int = 0) -> Iterator[Dict]:
+        """
+        Iterate over all watermarks as plain row dicts, skipping Watermark objects
+        
+        Rows have the same keys as Watermark.to_dict(), so they can be serialized as-is.
+        
+        Args:
+            limit: Maximum number of rows (None for all)
+            offset: Rows to skip before the first one returned
+        
+        Returns:
+            Iterator[Dict]: Watermark rows ordered by ID
+        """
+        query = """
+            SELECT watermark_id, store_name, watermark_url_image 
+            FROM watermarks 
+            ORDER BY watermark_id
+        """
+        
+        if limit is None:
+            return self.db_manager.iter_query(query)
+        
+        query += " LIMIT %s OFFSET %s"
+        if self.db_manager.db_type == 'sqlite':
+            query = query.replace('%s', '?')
+        return self.db_manager.iter_query(query, (limit, offset))
+    
+    def get_watermarks_version(self) -> str:
+        """
+        Get a cheap fingerprint of the watermarks table for conditional GETs
+        
+        Changes whenever a row is inserted (count, max ID), deleted (count) or
+        updated (latest updated_at). Two updates within the timestamp's resolution
+        can share a version, so treat it as a weak validator.
+        
+        Returns:
+            str: Opaque version string
+        """
+        query = """
+            SELECT COUNT(*) AS row_count, MAX(watermark_id) AS max_id, MAX(updated_at) AS last_updated
+            FROM watermarks
+        """
+        
+        result = self.db_manager.execute_query(query)
+        row = result[0] if result else {}
+        return f"{row.get('row_count', 0)}:{row.get('max_id')}:{row.get('last_updated')}"
+    
     def update_watermark(self, watermark_id: int, store_name: str = None, 
                         watermark_url_image: str = None) -> Optional[Watermark]:
         """
@@ -222,8 +372,23 @@ class WatermarkService:
         
         params.append(watermark_id)
         
+        if self.db_manager.db_type == 'postgresql':
+            # RETURNING hands back the updated row, saving the follow-up SELECT
+            query += " RETURNING watermark_id, store_name, watermark_url_image"
+            with self.db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(query, tuple(params))
+                    row = cursor.fetchone()
+                    conn.commit()
+                finally:
+                    cursor.close()
+            _row_cache_invalidate(watermark_id)
+            return Watermark(*row) if row else None
+        
         # Execute update
         self.db_manager.execute_query(query, tuple(params), fetch=False)
+        _row_cache_invalidate(watermark_id)
         
         # Get updated watermark
         return self.get_watermark_by_id(watermark_id)
@@ -247,12 +412,17 @@ class WatermarkService:
         if self.db_manager.db_type == 'sqlite':
             query = query.replace('%s', '?')
         
-        # Check if watermark exists first
-        existing = self.get_watermark_by_id(watermark_id)
-        if existing:
-            self.db_manager.execute_query(query, (watermark_id,), fetch=False)
-            return True
-        return False
+        # The affected row count says whether it existed, so no SELECT beforehand
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query, (watermark_id,))
+                deleted = cursor.rowcount > 0
+                conn.commit()
+            finally:
+                cursor.close()
+        _row_cache_invalidate(watermark_id)
+        return deleted
     
     def search_watermarks(self, query: str) -> List[Watermark]:
         """
@@ -264,6 +434,20 @@ class WatermarkService:
         Returns:
             List[Watermark]: List of matching watermark objects
         """
+        return [Watermark.from_dict(w) for w in self.search_watermark_dicts(query)]
+    
+    def search_watermark_dicts(self, query: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """
+        Search watermarks by store name, returning plain row dicts (same keys as Watermark.to_dict())
+        
+        Args:
+            query: Search query string
+            limit: Maximum number of rows (None for all matches)
+            offset: Matches to skip before the first one returned
+            
+        Returns:
+            List[Dict]: Matching watermark rows ordered by ID
+        """
         if not query or not query.strip():
             return []
         
@@ -291,13 +475,11 @@ class WatermarkService:
             """
         
         search_pattern = f"%{query.strip()}%"
+        params = (search_pattern,)
         
-        if self.db_manager.db_type == 'sqlite':
-            result = self.db_manager.execute_query(search_query, (search_pattern,))
-        else:
-            result = self.db_manager.execute_query(search_query, (search_pattern,))
-        
-        if result:
-            return [Watermark.from_dict(w) for w in result]
+        # Page in the database so only the requested rows cross the network
+        if limit is not None:
+            search_query += " LIMIT ? OFFSET ?" if self.db_manager.db_type == 'sqlite' else " LIMIT %s OFFSET %s"
+            params += (limit, offset)
         
-        return []
+        return self.db_manager.execute_query(search_query, params) or []
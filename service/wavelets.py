@@ -0,0 +1,44 @@
+# service/wavelets.py
+import pywt
+
+# Wavelet filter banks, built once. Under preload_app this module is imported in
+# the Gunicorn master, so workers share these objects copy-on-write instead of
+# pywt rebuilding a Wavelet from its name on every dwt2/idwt2 call.
+WAVELETS = {name: pywt.Wavelet(name) for name in ('haar', 'db2', 'db4', 'sym4')}
+
+def get_wavelet(name: str) -> pywt.Wavelet:
+    """
+    Return the shared Wavelet object for a wavelet name
+    
+    Args:
+        name: PyWavelets wavelet name (e.g. "haar")
+        
+    Returns:
+        pywt.Wavelet: Cached filter bank (other valid names are added on first use)
+        
+    Raises:
+        ValueError: If pywt does not know the name
+    """
+    wavelet = WAVELETS.get(name)
+    if wavelet is None:
+        wavelet = WAVELETS[name] = pywt.Wavelet(name)
+    return wavelet
+
+def dwt2_approximation(data, name: str):
+    """
+    Compute only the LL (approximation) sub-band of a 1-level 2D DWT
+    
+    Transforms the second-to-last axis, then the last axis of the low-pass
+    half only, the same way pywt.dwt2 does, so the result matches dwt2's LL
+    while skipping the LH/HL/HH sub-bands for callers that discard them.
+    
+    Args:
+        data: 2D array (one color channel), or a stack of them along the leading axis
+        name: PyWavelets wavelet name (e.g. "haar")
+        
+    Returns:
+        numpy.ndarray: LL sub-band
+    """
+    wavelet = get_wavelet(name)
+    rows_low, _ = pywt.dwt(data, wavelet, axis=-2)
+    return pywt.dwt(rows_low, wavelet, axis=-1)[0]
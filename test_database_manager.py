@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for DatabaseManager's PostgreSQL prepared statements, using a fake connection
+
+Usage:
+    python -m pytest test_database_manager.py
+"""
+
+from contextlib import contextmanager
+
+import pytest
+
+class FakeCursor:
+    description = (('value',),)
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+    def __iter__(self):
+        return iter([(1,)])
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    """Records every statement run on it"""
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self.statements)
+
+    def commit(self):
+        pass
+
+@pytest.fixture
+def manager():
+    """DatabaseManager using prepared statements, without a real PostgreSQL server"""
+    from config.database_manager import DatabaseManager
+    manager = DatabaseManager.__new__(DatabaseManager)
+    manager._use_prepared_statements = True
+    manager.connection = FakeConnection()
+
+    @contextmanager
+    def get_connection():
+        yield manager.connection
+
+    manager.get_connection = get_connection
+    return manager
+
+def _prepares(connection):
+    return [sql for sql, _ in connection.statements if sql.startswith('PREPARE ')]
+
+def test_placeholders_are_numbered_and_escapes_unescaped(manager):
+    query = "SELECT * FROM watermarks WHERE store_name LIKE '50%%' AND watermark_id = %s OR store_name = %s"
+    manager.execute_query(query, (7, 'store'))
+
+    (prepare, _), (execute, params) = manager.connection.statements
+    name = prepare.split()[1]
+    assert prepare == (f"PREPARE {name} AS SELECT * FROM watermarks "
+                       "WHERE store_name LIKE '50%' AND watermark_id = $1 OR store_name = $2")
+    assert execute == f"EXECUTE {name}(%s, %s)"
+    assert params == (7, 'store')
+
+def test_statement_is_prepared_once_per_connection(manager):
+    query = "SELECT * FROM watermarks WHERE watermark_id = %s"
+    first_connection = manager.connection
+
+    manager.execute_query(query, (1,))
+    manager.execute_query(query, (2,))
+    assert len(_prepares(first_connection)) == 1
+
+    manager.connection = FakeConnection()
+    manager.execute_query(query, (3,))
+    assert len(_prepares(manager.connection)) == 1
+
+def test_mapping_params_run_unprepared(manager):
+    query = "SELECT * FROM watermarks WHERE watermark_id = %(id)s"
+    manager.execute_query(query, {'id': 1})
+    assert manager.connection.statements == [(query, {'id': 1})]
+
+def test_placeholder_count_mismatch_runs_unprepared(manager):
+    query = "SELECT * FROM watermarks WHERE watermark_id = %s AND store_name = %s"
+    manager.execute_query(query, (1,))
+    assert manager.connection.statements == [(query, (1,))]
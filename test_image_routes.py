@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Route-level tests for the image and direct API blueprints (no Cloudinary or database needed)
+
+Usage:
+    python -m pytest test_image_routes.py
+"""
+
+import base64
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from test_watermark_pipeline import _test_images
+
+class FakeImageService:
+    """Stand-in for the Cloudinary-backed ImageService that counts its calls"""
+
+    max_file_size = 10 * 1024 * 1024
+
+    def __init__(self):
+        self.calls = []
+
+    def upload_base64_image(self, base64_string):
+        self.calls.append('upload')
+        return {'public_id': 'test/image', 'bytes': len(base64_string)}
+
+    def get_image_info(self, public_id):
+        self.calls.append('info')
+        return {'public_id': public_id, 'format': 'png'}
+
+    def delete_image(self, public_id):
+        self.calls.append('delete')
+        return True
+
+def _reset_shared_state():
+    """Drop the per-process controller/services and the module-level caches"""
+    import service
+    from controller import image_controller
+    from routes.image_routes import get_image_controller
+    for getter in (get_image_controller, service.get_image_service, service.get_embedded_service,
+                   service.get_extract_service, service.get_detect_service, service.get_job_service):
+        getter.cache_clear()
+    image_controller._extract_cache.clear()
+    image_controller._info_cache.clear()
+
+@pytest.fixture
+def controller(monkeypatch, tmp_path):
+    """ImageController running watermark operations inline, with a fake ImageService"""
+    from routes.image_routes import get_image_controller
+    monkeypatch.setenv('WM_WORKERS', '0')
+    _reset_shared_state()
+
+    controller = get_image_controller()
+    controller.image_service = FakeImageService()
+    controller.job_service.jobs_dir = str(tmp_path)
+    yield controller
+
+    for executor in (controller.job_service._executor, controller.job_service._io_executor):
+        if executor is not None:
+            executor.shutdown()
+    _reset_shared_state()
+
+@pytest.fixture
+def client(controller):
+    from app import create_app
+    app = create_app('api')
+    app.testing = True
+    return app.test_client()
+
+def _count_runs(monkeypatch, controller):
+    """Record the operation of every JobService.run call"""
+    calls = []
+    run = controller.job_service.run
+
+    def counting_run(operation, params, **kwargs):
+        calls.append(operation)
+        return run(operation, params, **kwargs)
+
+    monkeypatch.setattr(controller.job_service, 'run', counting_run)
+    return calls
+
+def _embed(client):
+    """Embed the test watermark through the API and return the response data"""
+    host_b64, watermark_b64 = _test_images()
+    response = client.post('/api/images/embed-watermark', json={
+        'original_image': host_b64, 'watermark_image': watermark_b64, 'alpha': 0.6
+    })
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+def _poll(client, job_id, timeout=60):
+    """Poll a job until it leaves the pending state"""
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(f'/api/images/jobs/{job_id}')
+        assert response.status_code == 200
+        job = response.get_json()
+        if job['status'] != 'pending' or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+def test_malformed_json_returns_missing_body(client):
+    response = client.post('/api/images/upload', data='{not json', content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json()['code'] == 'MISSING_BODY'
+
+def test_embed_extract_round_trip(client):
+    embedded = _embed(client)
+    response = client.post('/api/images/extract-watermark', json={
+        'suspect_image': embedded['watermarked_image'], 'sideinfo_json': embedded['metadata']
+    })
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['status'] == 'extracted'
+    assert body['data']['canonical_size'] == [80, 64]
+
+def test_embed_result_url_is_served_immediately(client):
+    host_b64, watermark_b64 = _test_images()
+    response = client.post('/api/images/embed-watermark?images=url', json={
+        'original_image': host_b64, 'watermark_image': watermark_b64
+    })
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert 'watermarked_image' not in data
+
+    result = client.get(data['watermarked_url'])
+    assert result.status_code == 200
+    assert result.mimetype == 'image/jpeg'
+    assert result.get_data()[:2] == b'\xff\xd8'
+
+def test_extract_cache_hit(client, controller, monkeypatch):
+    embedded = _embed(client)
+    payload = {'suspect_image': embedded['watermarked_image'], 'sideinfo_json': embedded['metadata']}
+    runs = _count_runs(monkeypatch, controller)
+
+    first = client.post('/api/images/extract-watermark', json=payload)
+    second = client.post('/api/images/extract-watermark', json=payload)
+    assert first.status_code == second.status_code == 200
+    assert first.get_json() == second.get_json()
+    assert runs == ['extract']
+
+def test_extract_without_sideinfo_is_not_cached(client, controller, monkeypatch):
+    # The result depends on the *.wm.json files on disk, which a later embed can add to
+    payload = {'suspect_image': _test_images()[0]}
+    runs = _count_runs(monkeypatch, controller)
+
+    for _ in range(2):
+        assert client.post('/api/images/extract-watermark', json=payload).status_code == 200
+    assert runs == ['extract', 'extract']
+
+def test_extract_cache_evicts_least_recently_used(client, controller, monkeypatch):
+    controller.extract_cache_size = 1
+    embedded = _embed(client)
+    payload = {'suspect_image': embedded['watermarked_image'], 'sideinfo_json': embedded['metadata']}
+    # Same extraction under a different cache key
+    other_payload = {**payload, 'sideinfo_json': {**embedded['metadata'], 'note': 'other'}}
+    runs = _count_runs(monkeypatch, controller)
+
+    for body in (payload, other_payload, payload):
+        assert client.post('/api/images/extract-watermark', json=body).status_code == 200
+    assert runs == ['extract'] * 3
+
+def test_info_cache_hit_and_invalidation(client, controller):
+    calls = controller.image_service.calls
+
+    assert client.get('/api/images/test/image/info').status_code == 200
+    assert client.get('/api/images/test/image/info').get_json()['data']['public_id'] == 'test/image'
+    assert calls == ['info']
+
+    assert client.delete('/api/images/test/image').status_code == 200
+    assert client.get('/api/images/test/image/info').status_code == 200
+    assert calls == ['info', 'delete', 'info']
+
+def test_info_cache_expires(client, controller):
+    controller.info_cache_ttl = 0
+    client.get('/api/images/test/image/info')
+    client.get('/api/images/test/image/info')
+    assert controller.image_service.calls == ['info', 'info']
+
+def test_batch_keeps_item_order_and_reports_item_errors(client):
+    host_b64, watermark_b64 = _test_images()
+    response = client.post('/api/images/batch', json={'items': [
+        {'operation': 'upload', 'params': {'image': host_b64}},
+        {'operation': 'embed', 'params': {'original_image': host_b64}},
+        {'operation': 'embed', 'params': {'original_image': host_b64, 'watermark_image': watermark_b64}},
+    ]})
+    assert response.status_code == 200
+    body = json.loads(response.get_data())
+    assert body['success'] is True
+    assert body['count'] == 3
+
+    upload, invalid, embed = body['results']
+    assert [result['index'] for result in body['results']] == [0, 1, 2]
+    assert upload['success'] is True and upload['data']['public_id'] == 'test/image'
+    assert invalid['success'] is False and invalid['status_code'] == 400
+    assert embed['success'] is True and embed['data']['image_size'] == [80, 64]
+
+def test_batch_rejects_unknown_operation(client):
+    response = client.post('/api/images/batch', json={'items': [{'operation': 'resize'}]})
+    assert response.status_code == 400
+    assert response.get_json()['code'] == 'INVALID_BATCH_OPERATION'
+
+def test_async_upload_job_polling(client, controller):
+    response = client.post('/api/images/upload?async=true', json={'image': _test_images()[0]})
+    assert response.status_code == 202
+    accepted = response.get_json()
+    assert accepted['status_url'] == f"/api/images/jobs/{accepted['job_id']}"
+
+    job = _poll(client, accepted['job_id'])
+    assert job['status'] == 'completed'
+    assert job['status_code'] == 201
+    assert job['result']['data']['public_id'] == 'test/image'
+
+def test_async_embed_job_polling(client):
+    host_b64, watermark_b64 = _test_images()
+    response = client.post('/api/images/embed-watermark?async=true', json={
+        'original_image': host_b64, 'watermark_image': watermark_b64
+    })
+    assert response.status_code == 202
+
+    job = _poll(client, response.get_json()['job_id'])
+    assert job['status'] == 'completed'
+    assert job['result']['data']['image_size'] == [80, 64]
+
+def test_unknown_job_returns_404(client):
+    for job_id in ('0' * 32, 'not-a-job-id'):
+        response = client.get(f'/api/images/jobs/{job_id}')
+        assert response.status_code == 404
+        assert response.get_json()['code'] == 'JOB_NOT_FOUND'
+
+def _multipart_embed_form():
+    host_b64, watermark_b64 = _test_images()
+    return {
+        'original_image': (io.BytesIO(base64.b64decode(host_b64)), 'host.png'),
+        'watermark_image': (io.BytesIO(base64.b64decode(watermark_b64)), 'watermark.png'),
+        'alpha': '0.6'
+    }
+
+def test_multipart_embed_runs_on_the_job_service(client, controller, monkeypatch):
+    runs = _count_runs(monkeypatch, controller)
+    response = client.post('/api/images/embed-watermark', data=_multipart_embed_form(),
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.get_json()['data']['image_size'] == [80, 64]
+    assert runs == ['embed']
+
+def test_multipart_embed_async_job_polling(client):
+    response = client.post('/api/images/embed-watermark?async=true', data=_multipart_embed_form(),
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+
+    job = _poll(client, response.get_json()['job_id'])
+    assert job['status'] == 'completed'
+    assert job['result']['data']['image_size'] == [80, 64]
+
+def test_direct_api_runs_on_the_job_service(client, controller, monkeypatch):
+    host_b64, watermark_b64 = _test_images()
+    runs = _count_runs(monkeypatch, controller)
+
+    embed = client.post('/api/direct/embed', json={'original_image': host_b64, 'watermark_image': watermark_b64})
+    assert embed.status_code == 200
+    embedded = embed.get_json()['data']
+
+    extract = client.post('/api/direct/extract', json={
+        'suspect_image': embedded['watermarked_image'], 'sideinfo_json': embedded['metadata']
+    })
+    assert extract.status_code == 200
+    extracted = extract.get_json()['data']['extracted_watermark']
+
+    detect = client.post('/api/direct/detect', json={
+        'original_watermark': watermark_b64, 'extracted_watermark': extracted
+    })
+    assert detect.status_code == 200
+    assert runs == ['embed', 'extract', 'detect']
+
+def test_direct_api_timeout_cancels_queued_work(monkeypatch):
+    from routes import direct_api_routes
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(direct_api_routes, '_operation_pool', pool)
+    release = threading.Event()
+    pool.submit(release.wait)
+    ran = []
+
+    @direct_api_routes.with_timeout(0.05)
+    def operation():
+        ran.append(True)
+
+    try:
+        assert operation()['code'] == 'OPERATION_TIMEOUT'
+    finally:
+        release.set()
+        pool.shutdown()
+    assert ran == []
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for JobService's process pool and job records
+
+Usage:
+    python -m pytest test_job_service.py
+"""
+
+import json
+import os
+import signal
+
+import pytest
+
+from test_watermark_pipeline import _test_images
+
+@pytest.fixture
+def job_service(monkeypatch, tmp_path):
+    """JobService with a one-process pool and its job records under tmp_path"""
+    from service.job_service import JobService
+    monkeypatch.setenv('WM_WORKERS', '1')
+    service = JobService()
+    service.jobs_dir = str(tmp_path)
+    yield service
+
+    if service._executor is not None:
+        service._executor.shutdown()
+
+def _embed_params():
+    host_b64, watermark_b64 = _test_images()
+    return {'original_image': host_b64, 'watermark_image': watermark_b64}
+
+def test_run_replaces_a_broken_pool(job_service):
+    assert job_service.run('embed', _embed_params())['image_size'] == (80, 64)
+    broken = job_service._executor
+
+    # Kill the pool process, as the OOM killer would
+    for process in list(broken._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+
+    assert job_service.run('embed', _embed_params())['image_size'] == (80, 64)
+    assert job_service._executor is not broken
+
+def test_failed_submit_does_not_leave_a_pending_job(job_service, monkeypatch):
+    def refuse(operation, params):
+        raise RuntimeError('pool unavailable')
+
+    monkeypatch.setattr(job_service, '_submit_operation', refuse)
+    with pytest.raises(RuntimeError):
+        job_service.submit('embed', _embed_params(), build_response=lambda result: (result, 200))
+
+    [record_file] = os.listdir(job_service.jobs_dir)
+    with open(os.path.join(job_service.jobs_dir, record_file), encoding='utf-8') as f:
+        record = json.load(f)
+    assert record['status'] == 'failed'
+    assert record['result']['code'] == 'JOB_ERROR'
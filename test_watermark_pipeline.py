@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for the embed/extract watermark pipeline (no server or database needed)
+
+Usage:
+    python -m pytest test_watermark_pipeline.py
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from service.image_codec import decode_base64_image, encode_base64
+
+def _png_base64(image):
+    """Encode a B, G, R uint8 array as a base64 PNG"""
+    return encode_base64(cv2.imencode('.png', image)[1].tobytes())
+
+def _test_images():
+    """Return (host, watermark) base64 PNGs of different sizes"""
+    # A smooth host: JPEG re-encoding wipes out a watermark hidden in pure noise
+    y, x = np.mgrid[0:64, 0:80]
+    host = cv2.GaussianBlur(np.dstack([x * 3, y * 4, (x + y) * 2]).astype(np.uint8), (0, 0), 2)
+    watermark = np.zeros((40, 40, 3), dtype=np.uint8)
+    watermark[10:30, 10:30] = 255
+    return _png_base64(host), _png_base64(watermark)
+
+def _embedded_service(monkeypatch, **env):
+    """Create an EmbeddedService configured by the given environment variables"""
+    from service.embeded_service import EmbeddedService
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return EmbeddedService()
+
+def test_embed_smoke(monkeypatch, tmp_path):
+    """Embedding returns a decodable JPEG and saves it with its sideinfo"""
+    host_b64, watermark_b64 = _test_images()
+    result = _embedded_service(monkeypatch).embed_watermark_from_base64(
+        host_b64, watermark_b64, 0.6, output_dir=str(tmp_path))
+
+    watermarked = cv2.imdecode(np.frombuffer(decode_base64_image(result['watermarked_image_b64']), np.uint8),
+                               cv2.IMREAD_COLOR)
+    assert watermarked.shape == (64, 80, 3)
+    assert result['image_size'] == (80, 64)
+    assert result['metadata']['canonical_size'] == [80, 64]
+    assert os.path.isfile(result['output_path'])
+    assert os.path.isfile(result['metadata_path'])
+
+def test_embed_batched_channels_smoke(monkeypatch, tmp_path):
+    """WM_CHANNEL_THREADS=1 (one batched pass) returns the same image size"""
+    host_b64, watermark_b64 = _test_images()
+    result = _embedded_service(monkeypatch, WM_CHANNEL_THREADS='1').embed_watermark_from_base64(
+        host_b64, watermark_b64, 0.6, output_dir=str(tmp_path))
+    assert result['image_size'] == (80, 64)
+
+def test_embed_extract_round_trip(monkeypatch, tmp_path):
+    """The watermark extracted with the embed sideinfo correlates with the one embedded"""
+    from service.extract_service import ExtractService
+    host_b64, watermark_b64 = _test_images()
+    embedded = _embedded_service(monkeypatch).embed_watermark_from_base64(
+        host_b64, watermark_b64, 0.6, output_dir=str(tmp_path))
+    result = ExtractService().extract_watermark_from_base64_with_json(
+        embedded['watermarked_image_b64'], embedded['metadata'], output_dir=str(tmp_path))
+
+    assert result['status'] == 'ok_extracted'
+    assert result['canonical_size'] == (80, 64)
+    extracted = cv2.imdecode(np.frombuffer(decode_base64_image(result['extracted_image_b64']), np.uint8),
+                             cv2.IMREAD_GRAYSCALE)
+    original = cv2.imdecode(np.frombuffer(decode_base64_image(watermark_b64), np.uint8), cv2.IMREAD_GRAYSCALE)
+    original = cv2.resize(original, (extracted.shape[1], extracted.shape[0]))
+    assert np.corrcoef(extracted.ravel(), original.ravel())[0, 1] > 0.4
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Tests for WatermarkService's row cache and the watermark routes' conditional GETs,
+against a throwaway SQLite database
+
+Usage:
+    python -m pytest test_watermark_service.py
+"""
+
+import pytest
+
+@pytest.fixture
+def watermark_service(monkeypatch, tmp_path):
+    """WatermarkService backed by a fresh SQLite database, counting database row reads"""
+    from config.database import get_config
+    from config.database_manager import DatabaseManager, close_pools
+    from service import watermark_service as module
+    monkeypatch.setenv('DATABASE_TYPE', 'sqlite')
+    monkeypatch.setenv('SQLITE_DATABASE', str(tmp_path / 'watermarks.db'))
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    # The config is cached per process; re-read it with the SQLite settings
+    get_config.cache_clear()
+    module._row_cache.clear()
+    DatabaseManager().create_tables()
+
+    service = module.WatermarkService()
+    service.row_reads = []
+    fetch = service._fetch_watermark_row
+
+    def counting_fetch(watermark_id):
+        service.row_reads.append(watermark_id)
+        return fetch(watermark_id)
+
+    monkeypatch.setattr(service, '_fetch_watermark_row', counting_fetch)
+    yield service
+
+    module._row_cache.clear()
+    close_pools()
+    get_config.cache_clear()
+
+def test_get_by_id_is_cached(watermark_service):
+    watermark_id = watermark_service.create_watermark('store', 'https://example.com/a.png').watermark_id
+
+    first = watermark_service.get_watermark_by_id(watermark_id)
+    second = watermark_service.get_watermark_by_id(watermark_id)
+    assert first.to_dict() == second.to_dict()
+    assert watermark_service.row_reads == [watermark_id]
+
+def test_missing_id_is_not_cached(watermark_service):
+    assert watermark_service.get_watermark_by_id(42) is None
+    watermark_service.create_watermark('store', 'https://example.com/a.png')
+    assert watermark_service.get_watermark_by_id(1) is not None
+    assert watermark_service.row_reads == [42, 1]
+
+def test_update_invalidates_cached_row(watermark_service):
+    watermark_id = watermark_service.create_watermark('store', 'https://example.com/a.png').watermark_id
+    watermark_service.get_watermark_by_id(watermark_id)
+
+    updated = watermark_service.update_watermark(watermark_id, store_name='renamed')
+    assert updated.store_name == 'renamed'
+    assert watermark_service.get_watermark_by_id(watermark_id).store_name == 'renamed'
+
+def test_delete_invalidates_cached_row(watermark_service):
+    watermark_id = watermark_service.create_watermark('store', 'https://example.com/a.png').watermark_id
+    watermark_service.get_watermark_by_id(watermark_id)
+
+    assert watermark_service.delete_watermark(watermark_id) is True
+    assert watermark_service.get_watermark_by_id(watermark_id) is None
+
+def test_cached_row_expires(watermark_service):
+    watermark_service.cache_ttl = 0
+    watermark_id = watermark_service.create_watermark('store', 'https://example.com/a.png').watermark_id
+
+    watermark_service.get_watermark_by_id(watermark_id)
+    watermark_service.get_watermark_by_id(watermark_id)
+    assert watermark_service.row_reads == [watermark_id, watermark_id]
+
+@pytest.fixture
+def client(watermark_service):
+    """Test client for the watermark routes, on the same SQLite database"""
+    from app import create_app
+    from routes.watermark_routes import get_watermark_controller
+    get_watermark_controller.cache_clear()
+    app = create_app('db')
+    app.testing = True
+    yield app.test_client()
+
+    get_watermark_controller.cache_clear()
+
+def _create(client, store_name):
+    response = client.post('/api/watermarks/', json={
+        'store_name': store_name, 'watermark_url_image': 'https://example.com/a.png'
+    })
+    assert response.status_code == 201
+    return response.get_json()['data']['watermark_id']
+
+def test_get_watermark_answers_304_to_a_matching_etag(client):
+    watermark_id = _create(client, 'store')
+    first = client.get(f'/api/watermarks/{watermark_id}')
+    assert first.status_code == 200
+    assert first.headers['ETag']
+
+    revalidated = client.get(f'/api/watermarks/{watermark_id}', headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b''
+
+def test_listing_etag_changes_with_every_write(client, watermark_service):
+    def listing_etag():
+        response = client.get('/api/watermarks/')
+        assert response.status_code == 200
+        assert response.headers['ETag'].startswith('W/')
+        return response.headers['ETag']
+
+    etags = [listing_etag()]
+    watermark_id = _create(client, 'store')
+    etags.append(listing_etag())
+
+    # updated_at has one-second resolution; backdate the row so the update is visible
+    watermark_service.db_manager.execute_query(
+        "UPDATE watermarks SET updated_at = '2000-01-01 00:00:00'", fetch=False)
+    etags.append(listing_etag())
+    assert client.put(f'/api/watermarks/{watermark_id}', json={'store_name': 'renamed'}).status_code == 200
+    etags.append(listing_etag())
+
+    assert client.delete(f'/api/watermarks/{watermark_id}').status_code == 200
+    etags.append(listing_etag())
+    # Each write changes the tag from the one before it
+    assert all(before != after for before, after in zip(etags, etags[1:]))
+
+    revalidated = client.get('/api/watermarks/', headers={'If-None-Match': etags[-1]})
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b''
+
+def test_listing_etag_varies_with_accept(client):
+    _create(client, 'store')
+    as_json = client.get('/api/watermarks/')
+    as_ndjson = client.get('/api/watermarks/', headers={'Accept': 'application/x-ndjson'})
+    assert as_ndjson.mimetype == 'application/x-ndjson'
+    assert 'Accept' in as_json.headers['Vary'] and 'Accept' in as_ndjson.headers['Vary']
+    assert as_json.headers['ETag'] != as_ndjson.headers['ETag']
+
+    # A JSON body's tag doesn't validate the NDJSON representation
+    response = client.get('/api/watermarks/', headers={
+        'Accept': 'application/x-ndjson', 'If-None-Match': as_json.headers['ETag']
+    })
+    assert response.status_code == 200
+    assert response.get_data().count(b'\n') == 1